@@ -32,11 +32,17 @@ TOKEN_LENGTH = 7
 
 log = logging.getLogger("analytics")
 
+# test case and test step events recorded instead of sent, see start_recording
+_RECORDED_EVENTS = None
+
 
 def lack_testcases():
     """the testsuite does not have any started testcases"""
+    if _RECORDED_EVENTS is not None:
+        return False
     return bool(epsmsgbus.core.testsuite().testcases == [])
 
+
 def get_analytics():
     """ Get analytics config """
     return get_conf().rig.analytics
@@ -164,6 +170,8 @@ def testsuite_ended():
 @require_use_epsmsgbus
 def testcase_started(name):
     """Signal that test case ended. Link adapter and API function."""
+    if record("testcase_started", name):
+        return
     adapter = TestCaseDataAdapter(name)
     epsmsgbus.testcase_started(adapter, name)
     log.debug("testcase_started: %s", name)
@@ -172,6 +180,8 @@ def testcase_started(name):
 @require_use_epsmsgbus
 def testcase_ended(verdict):
     """Signal that test case ended. Link adapter and API function."""
+    if record("testcase_ended", verdict):
+        return
     epsmsgbus.testcase_ended(verdict)
     log.debug("testcase_ended: verdict=%s", verdict)
 
@@ -179,6 +189,8 @@ def testcase_ended(verdict):
 @require_use_epsmsgbus
 def teststep_started(name):
     """Signal that test step started. Link adapter and API function."""
+    if record("teststep_started", name):
+        return
     adapter = TestStepDataAdapter()
     epsmsgbus.teststep_started(adapter, name)
     log.debug("teststep_started: %s", name)
@@ -187,11 +199,57 @@ def teststep_started(name):
 @require_use_epsmsgbus
 def teststep_ended(verdict):
     """Signal that test step ended. Link adapter and API function."""
+    if record("teststep_ended", verdict):
+        return
     epsmsgbus.teststep_ended(verdict)
     log.debug("teststep_ended: verdict=%s", verdict)
 
+
+def start_recording():
+    """
+    Record test case and test step events with their time instead of sending
+    them. Used by the rig workers running tests in parallel, the main process
+    sends the events with replay() when the test case is done.
+    """
+    global _RECORDED_EVENTS # pylint: disable=global-statement
+    _RECORDED_EVENTS = []
+
+
+def stop_recording():
+    """ Stop recording, return the recorded events """
+    global _RECORDED_EVENTS # pylint: disable=global-statement
+    events, _RECORDED_EVENTS = _RECORDED_EVENTS, None
+    return events or []
+
+
+def record(event, arg):
+    """ Record event if recording, return True if it was recorded """
+    if _RECORDED_EVENTS is None:
+        return False
+    _RECORDED_EVENTS.append((event, arg, datetime.utcnow()))
+    return True
+
+
+@require_use_epsmsgbus
+def replay(events):
+    """ Send events recorded in another process, keeping their time """
+    for event, arg, time in events:
+        if event == "testcase_started":
+            epsmsgbus.testcase_started(TestCaseDataAdapter(arg), arg, starttime=time)
+        elif event == "testcase_ended":
+            epsmsgbus.testcase_ended(arg, endtime=time)
+        elif event == "teststep_started":
+            epsmsgbus.teststep_started(TestStepDataAdapter(), arg, starttime=time)
+        elif event == "teststep_ended":
+            epsmsgbus.teststep_ended(arg, endtime=time)
+    log.debug("replay: %s events", len(events))
+
+
 @require_use_epsmsgbus
-def messagehandler(use_db=False, use_mq=False):
-    """Configure what to connect to"""
-    epsmsgbus.messagehandler(use_db, use_mq)
-    log.debug("messagehandler: use_db=%s use_mq=%s", use_db, use_mq)
+def messagehandler(use_db=False, use_mq=False, spool_dir=None):
+    """
+    Configure what to connect to. Messages are also written to a spool file in
+    spool_dir, messages not delivered can be sent later with epsmsgbus.spool
+    """
+    epsmsgbus.messagehandler(use_db, use_mq, spool_dir)
+    log.debug("messagehandler: use_db=%s use_mq=%s spool_dir=%s", use_db, use_mq, spool_dir)
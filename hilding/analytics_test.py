@@ -63,3 +63,21 @@ def _test_suite_without_steps():
     analytics.testcase_started("case1")
     analytics.testcase_ended("passed")
     analytics.testsuite_ended()
+
+def _test_replay():
+    """test case recorded in a rig worker keeps the time of its steps"""
+    analytics.start_recording()
+    assert not analytics.lack_testcases()
+    analytics.testcase_started("case1")
+    analytics.teststep_started("step1")
+    analytics.teststep_ended("passed")
+    analytics.testcase_ended("passed")
+    recorded = analytics.stop_recording()
+    assert [event for event, _, _ in recorded] == [
+        "testcase_started", "teststep_started", "teststep_ended", "testcase_ended"]
+    analytics.testsuite_started()
+    analytics.replay(recorded)
+    testcase = analytics.epsmsgbus.core.testsuite().testcases[0]
+    assert testcase.starttime == recorded[0][2]
+    assert testcase.teststeps[0].endtime == recorded[2][2]
+    analytics.testsuite_ended()
@@ -0,0 +1,135 @@
+"""
+Signal broker session kept across the tests run by one testrunner process
+
+Each test script creates a Dut, and its precondition unsubscribes all
+signals, restarts heartbeat and tester present and subscribes again. Within
+a session the gRPC channel is shared by all Dut instances and the setup done
+by the first precondition is kept running. The next precondition with the
+same parameters only resets the per test buffers and state.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+import logging
+from contextlib import contextmanager
+
+import grpc
+
+from supportfunctions.support_can import SupportCAN
+
+log = logging.getLogger('broker_session')
+
+
+class BrokerSession:
+    """
+    gRPC channels and the precondition setup (heartbeat, tester present and
+    subscriptions) kept alive between tests
+    """
+    def __init__(self):
+        self.channels = {}
+        self.setup_key = None
+        self.periodic = {}
+        self.signals = []
+
+    def channel(self, hostname, port):
+        """ gRPC channel to the signal broker, created once per address """
+        address = f'{hostname}:{port}'
+        if address not in self.channels:
+            self.channels[address] = grpc.insecure_channel(address)
+        return self.channels[address]
+
+    def keep_setup(self, setup_key, periodic_names, signals):
+        """
+        Keep the setup just done by a precondition
+
+        setup_key       parameters the setup was done with
+        periodic_names  names of the periodic signals started
+        signals         signals subscribed
+        """
+        self.setup_key = setup_key
+        self.periodic = {name: list(SupportCAN.can_periodic[name])
+                         for name in periodic_names}
+        self.signals = list(signals)
+
+    def setup_alive(self, setup_key=None):
+        """
+        True if the kept setup is still running unchanged, for setup_key if
+        given. A test stopping the heartbeat or unsubscribing makes the next
+        precondition do the full setup again.
+        """
+        if self.setup_key is None:
+            return False
+        if setup_key is not None and setup_key != self.setup_key:
+            return False
+        for name, per_param in self.periodic.items():
+            if SupportCAN.can_periodic.get(name) != per_param or\
+               not SupportCAN.periodic_active(name):
+                return False
+        for signame in self.signals:
+            thread = SupportCAN.can_subscribe_threads.get(signame)
+            if thread is None or not thread.is_alive() or\
+               not SupportCAN.can_subscribed[signame].is_set():
+                return False
+        return True
+
+    def reset_test_state(self):
+        """ clear buffers and flow control settings left by the previous test """
+        for signame in self.signals:
+            SupportCAN().reset_signal(signame)
+
+    def end_test(self):
+        """
+        Stop periodic signals and subscriptions the test started itself,
+        the kept setup continues
+        """
+        iso_tp = SupportCAN()
+        for name in list(iso_tp.can_periodic):
+            if name not in self.periodic:
+                iso_tp.stop_periodic(name)
+        for signame in list(iso_tp.can_subscribes):
+            if signame not in self.signals:
+                iso_tp.unsubscribe_signal(signame)
+
+    def close(self):
+        """ stop the kept setup and close the channels """
+        iso_tp = SupportCAN()
+        iso_tp.stop_periodic_all()
+        iso_tp.unsubscribe_signals()
+        self.setup_key = None
+        for channel in self.channels.values():
+            channel.close()
+        self.channels = {}
+
+
+def get_session():
+    """ the active session, None if tests are not run in a session """
+    return _SESSION
+_SESSION = None
+
+
+@contextmanager
+def session():
+    """ run the tests within the with statement in one broker session """
+    global _SESSION # pylint: disable=global-statement
+    _SESSION = BrokerSession()
+    try:
+        yield _SESSION
+    finally:
+        log.debug("Closing broker session")
+        _SESSION.close()
+        _SESSION = None
@@ -0,0 +1,53 @@
+"""
+Unit tests for broker_session
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+
+
+"""
+import threading
+
+from hilding import broker_session
+from supportfunctions.support_can import SupportCAN
+
+
+def test_setup_alive(monkeypatch):
+    """ kept setup is only reused while it's running unchanged """
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    subscribed = threading.Event()
+    subscribed.set()
+    monkeypatch.setattr(SupportCAN, "can_periodic", {'heartbeat': [True, 'Hb', 'ns', b'', 0.4]})
+    monkeypatch.setattr(SupportCAN, "periodic_active", lambda name: name == 'heartbeat')
+    monkeypatch.setattr(SupportCAN, "can_subscribe_threads", {'rec': thread})
+    monkeypatch.setattr(SupportCAN, "can_subscribed", {'rec': subscribed})
+    try:
+        session = broker_session.BrokerSession()
+        assert not session.setup_alive()
+        session.keep_setup('key', ['heartbeat'], ['rec'])
+        assert session.setup_alive('key')
+        assert not session.setup_alive('other key')
+        SupportCAN.can_periodic['heartbeat'][0] = False
+        assert not session.setup_alive('key')
+        SupportCAN.can_periodic['heartbeat'][0] = True
+        stop.set()
+        thread.join()
+        assert not session.setup_alive('key')
+    finally:
+        stop.set()
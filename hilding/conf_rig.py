@@ -20,17 +20,22 @@ Any unauthorized copying or distribution of content from this file is prohibited
 /*********************************************************************************/
 """
 import importlib
+import logging
 from supportfunctions.support_sec_acc import SecAccessParam
 
 from hilding.conf_analytics import Analytics
+from hilding.sddb_cache import find_sddb_file, read_cache, write_cache
 #SSA = SupportSecurityAccess()
 
+log = logging.getLogger('conf_rig')
+
 class Rig: # pylint: disable=too-many-public-methods
     """ hilding rig management """
     def __init__(self, conf):
         self.conf = conf
         self.analytics = Analytics(self)
         self.__sddb_module_cache = {}
+        self.__did_index_cache = {}
 
     def __str__(self):
         __str = f"Rig({self.user}@{self.hostname}):\n"
@@ -165,6 +170,11 @@ class Rig: # pylint: disable=too-many-public-methods
         """ get the path to the build dir for the selected rig """
         return ensure_exists(self.rig_path.joinpath("build"))
 
+    @property
+    def vbf_cache_path(self):
+        """ get the path to the preprocessed vbf files in the build dir """
+        return ensure_exists(self.build_path.joinpath("vbf_cache"))
+
     @property
     def sddb_dids(self):
         """ get sddb did content """
@@ -189,12 +199,35 @@ class Rig: # pylint: disable=too-many-public-methods
             sddb_file = self.build_path.joinpath(f"sddb_{content}.py")
             if not sddb_file.exists():
                 raise ModuleNotFoundError(f"The {sddb_file} file does not exist")
-            sddb_module = get_module(sddb_file)
-            self.__sddb_module_cache[content] = {
-                k:v for k,v in vars(sddb_module).items()
-                if not k.startswith('__')}
+            # use binary cache of the module if it's made from the current sddb file
+            cache_file = self.build_path.joinpath(f"sddb_{content}.pickle")
+            source_file = find_sddb_file(self.sddb_path)
+            sddb_content = read_cache(cache_file, source_file, sddb_file)
+            if sddb_content is None:
+                sddb_module = get_module(sddb_file)
+                sddb_content = {
+                    k:v for k,v in vars(sddb_module).items()
+                    if not k.startswith('__')}
+                if source_file is not None:
+                    try:
+                        write_cache(cache_file, source_file, sddb_file, sddb_content)
+                    except OSError as err:
+                        log.warning("Could not write sddb cache %s: %s", cache_file, err)
+            self.__sddb_module_cache[content] = sddb_content
         return self.__sddb_module_cache[content]
 
+    def sddb_did_index(self, incoming_mode, build_index):
+        """
+        get DID index for incoming_mode, build_index(sddb_dids, incoming_mode)
+        is only called the first time and when the sddb dids content changed
+        """
+        sddb_dids = self.sddb_dids
+        cached = self.__did_index_cache.get(incoming_mode)
+        if cached is None or cached[0] is not sddb_dids:
+            cached = (sddb_dids, build_index(sddb_dids, incoming_mode))
+            self.__did_index_cache[incoming_mode] = cached
+        return cached[1]
+
     def get_testrun_data(self):
         """ accessor method to get get_testrun_data module """
         testrun_data_file = self.build_path.joinpath("testrun_data.py")
@@ -63,6 +63,7 @@ from supportfunctions.support_postcondition import SupportPostcondition
 from supportfunctions.support_file_io import SupportFileIO
 
 from hilding.uds import Uds
+from hilding.uds import UdsEmptyResponse
 from hilding.uds import EicDid
 from hilding.uds import IoVmsDid
 
@@ -72,6 +73,7 @@ try:
     from hilding import analytics
 except ValueError:
     pass
+from hilding import broker_session
 from hilding import get_conf
 
 # pylint: disable=no-member
@@ -134,15 +136,23 @@ class Dut:
     # pylint: disable=too-many-instance-attributes
     def __init__(self):
         self.conf = get_conf()
-        self.channel = grpc.insecure_channel(
-            f'{self.conf.rig.hostname}:'
-            f'{self.conf.rig.signal_broker_port}')
+        session = broker_session.get_session()
+        if session:
+            self.channel = session.channel(self.conf.rig.hostname,
+                                           self.conf.rig.signal_broker_port)
+        else:
+            self.channel = grpc.insecure_channel(
+                f'{self.conf.rig.hostname}:'
+                f'{self.conf.rig.signal_broker_port}')
         self.network_stub = NetworkServiceStub(self.channel)
         self.system_stub = SystemServiceStub(self.channel)
         self.namespace = SupportFileIO.parameter_adopt_teststep('namespace')
         self.protocol = SupportFileIO.parameter_adopt_teststep('protocol')
         self.framelength_max = SupportFileIO.parameter_adopt_teststep('framelength_max')
         self.padding = SupportFileIO.parameter_adopt_teststep('padding')
+        can_buffer_max = SupportFileIO.parameter_adopt_teststep('can_buffer_max')
+        if can_buffer_max != '':
+            SupportCAN.buffer_maxlen = int(can_buffer_max)
         self.uds = Uds(self)
 
         self.SIO = SupportFileIO()
@@ -194,18 +204,6 @@ class Dut:
 
         iso_tp = SupportCAN()
 
-        #There is an issue in unsubscribe_signals() that generates a lot of errors in the log.
-        #In order to not confuse users this was simply removed from the log by disabling the logger
-        logger = logging.getLogger()
-        logger.disabled = True
-
-        # deregister signals
-        # Adding unsubscribe in precondition to remove all the unwanted subscriptions
-        # from the previous scripts if any.
-        iso_tp.unsubscribe_signals()
-
-        logger.disabled = False
-
         self.uds.step = 100
         # start heartbeat, repeat every 0.4 second
         heartbeat_param: PerParam = {
@@ -221,18 +219,7 @@ class Dut:
         heartbeat_param['send'] = True
         log.debug("heartbeat_param %s", heartbeat_param)
 
-        iso_tp = SupportCAN()
-
-        # start heartbeat, repeat every x second
-        iso_tp.start_heartbeat(self.network_stub, heartbeat_param)
-
-        # start testerpresent without reply
         tp_name = self.conf.rig.signal_tester_present
-        self.SE3e.start_periodic_tp_zero_suppress_prmib(self, tp_name)
-
-        # record signal we send as well
-        iso_tp.subscribe_signal(self, timeout)
-        log.debug("precondition can_p2 %s", self)
 
         # record signal we send as well. Do notice the reverse order of the
         # send and receive signals!
@@ -244,10 +231,49 @@ class Dut:
                             "framelength_max": self.framelength_max,
                             "padding" : self.padding
                            }
-        iso_tp.subscribe_signal(can_p2, timeout)
 
-        # do not generate FC frames for signals we generated:
-        time.sleep(1)
+        session = broker_session.get_session()
+        setup_key = (tuple(heartbeat_param.items()), tp_name, self.namespace,
+                     self.conf.rig.signal_send, self.conf.rig.signal_receive)
+        if session and session.setup_alive(setup_key):
+            log.debug("Heartbeat, tester present and subscriptions kept from previous test")
+            session.reset_test_state()
+        else:
+            #There is an issue in unsubscribe_signals() that generates a lot of errors in the log.
+            #In order to not confuse users this was simply removed from the log by disabling
+            #the logger
+            logger = logging.getLogger()
+            logger.disabled = True
+
+            # deregister signals
+            # Adding unsubscribe in precondition to remove all the unwanted subscriptions
+            # from the previous scripts if any.
+            iso_tp.unsubscribe_signals()
+
+            logger.disabled = False
+
+            # start heartbeat, repeat every x second
+            # no wait for the ECU to wake up, it's probed with 22F186 below
+            iso_tp.start_heartbeat(self.network_stub, heartbeat_param, wakeup_wait=0)
+
+            # start testerpresent without reply
+            self.SE3e.start_periodic_tp_zero_suppress_prmib(self, tp_name)
+
+            # subscriptions kept in a session are ended when the session is
+            # closed, not by a deadline
+            subscribe_timeout = 0 if session else timeout
+
+            # record signal we send as well
+            iso_tp.subscribe_signal(self, subscribe_timeout)
+            log.debug("precondition can_p2 %s", self)
+            iso_tp.subscribe_signal(can_p2, subscribe_timeout)
+
+            # do not generate FC frames for signals we generated:
+            iso_tp.wait_subscribed([self.conf.rig.signal_receive, can_p2["receive"]])
+            if session:
+                session.keep_setup(setup_key, ['heartbeat', 'TesterPresent_periodic'],
+                                   [self.conf.rig.signal_receive, can_p2["receive"]])
+
         can_mf: CanMFParam = {
             "block_size": 0,
             "separation_time": 0,
@@ -259,7 +285,7 @@ class Dut:
 
         log.info("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~Precondition started~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
 
-        res = self.uds.active_diag_session_f186()
+        res = self.wait_ecu_ready()
         #res = dut.SE22.read_did_f186(can_p, b'\01')
         log.info("Precondition ECU Mode 1 checked usine 22F186: %s\n", res)
 
@@ -270,6 +296,24 @@ class Dut:
         log.info("Precondition f125: %s\n", res)
         self.uds.step = 0
 
+    def wait_ecu_ready(self, timeout=4):
+        """Read DID F186 until the ECU answers
+
+        Args:
+            timeout (int, optional): Max time to wait for the ECU to wake up. Defaults to 4.
+
+        Returns:
+            UdsResponse: The first response from the ECU
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self.uds.active_diag_session_f186()
+            except UdsEmptyResponse:
+                if time.time() >= deadline:
+                    raise
+                log.info("Precondition: waiting for ECU to answer 22F186")
+
     def postcondition(self, start_time, result):
         """Run postconditions and change to mode 1
 
@@ -295,20 +339,28 @@ class Dut:
         log.debug("Stop all periodic signals sent")
 
         iso_tp = SupportCAN()
-        iso_tp.stop_periodic_all()
+        iso_tp.log_buffer_stats()
+        iso_tp.log_periodic_stats()
+        session = broker_session.get_session()
+        if session and session.setup_alive():
+            # heartbeat, tester present and subscriptions are kept for the next test
+            session.end_test()
+        else:
+            iso_tp.stop_periodic_all()
 
-        #There is an issue in unsubscribe_signals() that generates a lot of errors in the log.
-        #In order to not confuse users this was simply removed from the log by disabling the logger
-        logger = logging.getLogger()
-        logger.disabled = True
+            #There is an issue in unsubscribe_signals() that generates a lot of errors in the log.
+            #In order to not confuse users this was simply removed from the log by disabling
+            #the logger
+            logger = logging.getLogger()
+            logger.disabled = True
 
-        # deregister signals
-        iso_tp.unsubscribe_signals()
+            # deregister signals
+            iso_tp.unsubscribe_signals()
 
-        logger.disabled = False
+            logger.disabled = False
 
-        # if threads should remain: try to stop them
-        iso_tp.thread_stop()
+            # if threads should remain: try to stop them
+            iso_tp.thread_stop()
 
         log.info("Test cleanup end: %s\n", datetime.now())
 
@@ -365,7 +417,7 @@ class Dut:
         iso_tp.subscribe_signal(can_p2, timeout)
 
         # do not generate FC frames for signals we generated:
-        time.sleep(1)
+        iso_tp.wait_subscribed([self.conf.rig.signal_receive, can_p2["receive"]])
         can_mf: CanMFParam = {
             "block_size": 0,
             "separation_time": 0,
@@ -436,11 +488,12 @@ class Dut:
 
         self.uds.purpose = purpose
         ret = None
-        if inspect.ismethod(func):
-            # step should also works with class methods and not just functions.
-            # e.g. dut.step(dut.uds.set_mode, 2)
-            ret = func(*args, **kwargs)
-        ret = func(self, *args, **kwargs)
+        with SupportFileIO.step_context(func):
+            if inspect.ismethod(func):
+                # step should also works with class methods and not just functions.
+                # e.g. dut.step(dut.uds.set_mode, 2)
+                ret = func(*args, **kwargs)
+            ret = func(self, *args, **kwargs)
 
         #If a test step fails we save the purpose so that it can be given as feedback later
         if isinstance(ret, tuple):
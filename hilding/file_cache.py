@@ -0,0 +1,146 @@
+"""
+Pickled cache of data generated from files
+
+A cache file holds a key followed by the data. The key identifies the files
+the data was made from:
+ - hashed files are identified by their content (sha256). Size and timestamp
+   are stored as well so the file is only hashed again when it was touched.
+ - stamped files are identified by size and timestamp only.
+A cache file is only used if the key still matches. Used by sddb_cache and
+vbf_cache.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+import hashlib
+import logging
+import pickle
+import tempfile
+from pathlib import Path
+
+log = logging.getLogger('file_cache')
+
+# result of key_state
+KEY_OUTDATED = 0
+KEY_VALID = 1
+# content of all hashed files unchanged but some of them touched
+KEY_TOUCHED = 2
+
+
+def file_hash(path):
+    """ sha256 of a file """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_key(version, hashed, stamped=None, hashes=None):
+    """
+    Key identifying the files a cache is made from
+
+    hashed:  {field: path} of files identified by content
+    stamped: {field: path} of files identified by size and timestamp
+    hashes:  {field: sha256} already known for some of the hashed files
+    """
+    hashes = hashes or {}
+    key = {"version": version}
+    for field, path in hashed.items():
+        stat = path.stat()
+        key[field] = {"name": path.name,
+                      "size": stat.st_size,
+                      "mtime_ns": stat.st_mtime_ns,
+                      "sha256": hashes.get(field) or file_hash(path)}
+    for field, path in (stamped or {}).items():
+        stat = path.stat()
+        key[field] = {"size": stat.st_size,
+                      "mtime_ns": stat.st_mtime_ns}
+    return key
+
+
+def key_state(key, version, hashed, stamped=None):
+    """
+    Check if a cache key still matches the files
+    return: KEY_VALID, KEY_TOUCHED or KEY_OUTDATED
+    """
+    if not isinstance(key, dict) or key.get("version") != version:
+        return KEY_OUTDATED
+    for field, path in (stamped or {}).items():
+        stat = path.stat()
+        if (key[field]["size"], key[field]["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return KEY_OUTDATED
+    state = KEY_VALID
+    for field, path in hashed.items():
+        stat = path.stat()
+        if key[field]["name"] != path.name or key[field]["size"] != stat.st_size:
+            return KEY_OUTDATED
+        if key[field]["mtime_ns"] == stat.st_mtime_ns:
+            continue
+        # file touched or copied again, only the content matters
+        if key[field]["sha256"] != file_hash(path):
+            return KEY_OUTDATED
+        state = KEY_TOUCHED
+    return state
+
+
+def write_cache(cache_file, key, data):
+    """ Store key and data in cache_file """
+    # other test processes may read or write the cache at the same time, each
+    # writer uses its own temporary file and replaces the cache file with it
+    with tempfile.NamedTemporaryFile(dir=cache_file.parent, prefix=f"{cache_file.name}.",
+                                     suffix='.tmp', delete=False) as file:
+        tmp_file = Path(file.name)
+        try:
+            pickle.dump(key, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            file.close()
+            tmp_file.unlink()
+            raise
+    tmp_file.replace(cache_file)
+    log.debug("Cache written: %s", cache_file)
+
+
+def read_cache(cache_file, version, hashed, stamped=None):
+    """
+    Get data stored in cache_file, None if there is no valid cache
+
+    If the hashed files were only touched the key is refreshed, so they are
+    not hashed again on the next read.
+    """
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, 'rb') as file:
+            key = pickle.load(file)
+            state = key_state(key, version, hashed, stamped)
+            if state == KEY_OUTDATED:
+                log.debug("Cache outdated: %s", cache_file)
+                return None
+            data = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError) as err:
+        log.warning("Could not read cache %s: %s", cache_file, err)
+        return None
+    if state == KEY_TOUCHED:
+        hashes = {field: key[field]["sha256"] for field in hashed}
+        try:
+            write_cache(cache_file, cache_key(version, hashed, stamped, hashes), data)
+        except OSError as err:
+            log.warning("Could not refresh cache key %s: %s", cache_file, err)
+    return data
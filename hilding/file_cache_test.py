@@ -0,0 +1,69 @@
+"""
+pytest for hilding/file_cache.py
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+import os
+import pickle
+
+from hilding import file_cache
+from hilding.file_cache import cache_key, read_cache, write_cache
+
+
+def test_file_cache(tmp_path, monkeypatch):
+    """ pytest: cache is only used while the files are unchanged """
+    source_file = tmp_path.joinpath("source.txt")
+    source_file.write_text("content 1")
+    stamped_file = tmp_path.joinpath("generated.py")
+    stamped_file.write_text("generated = 1")
+    cache_file = tmp_path.joinpath("source.pickle")
+    hashed = {"source": source_file}
+    stamped = {"generated": stamped_file}
+    data = {"generated": 1}
+
+    assert read_cache(cache_file, 1, hashed, stamped) is None
+    write_cache(cache_file, cache_key(1, hashed, stamped), data)
+    assert read_cache(cache_file, 1, hashed, stamped) == data
+    assert read_cache(cache_file, 2, hashed, stamped) is None
+
+    # same content, new timestamp: still valid and the key is refreshed
+    os.utime(source_file, ns=(0, 0))
+    assert read_cache(cache_file, 1, hashed, stamped) == data
+    with open(cache_file, 'rb') as file:
+        assert pickle.load(file)["source"]["mtime_ns"] == 0
+    monkeypatch.setattr(file_cache, 'file_hash', None)
+    assert read_cache(cache_file, 1, hashed, stamped) == data
+    monkeypatch.undo()
+
+    # new content of the same size
+    source_file.write_text("content 2")
+    assert read_cache(cache_file, 1, hashed, stamped) is None
+
+    # stamped file touched
+    write_cache(cache_file, cache_key(1, hashed, stamped), data)
+    os.utime(stamped_file, ns=(0, 0))
+    assert read_cache(cache_file, 1, hashed, stamped) is None
+
+    # no temporary files left
+    assert sorted(path.name for path in tmp_path.iterdir()) ==\
+        ["generated.py", "source.pickle", "source.txt"]
+
+    # broken cache file
+    cache_file.write_bytes(b"broken")
+    assert read_cache(cache_file, 1, hashed, stamped) is None
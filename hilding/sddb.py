@@ -28,6 +28,7 @@ import sys
 import codecs
 import logging
 import tempfile
+import time
 
 from pathlib import Path
 from pprint import pformat
@@ -35,6 +36,7 @@ from lxml import etree
 from inflection import underscore
 
 from hilding import get_conf
+from hilding.sddb_cache import write_cache
 
 log = logging.getLogger('sddb')
 
@@ -71,6 +73,48 @@ def ecu_determination(root, type_str):
 
 SERVICE22 = './/Service[@ID="22"]/DataIdentifiers/DataIdentifier'
 
+SW_TYPES = ('PBL', 'SBL', 'APP')
+
+
+def did_content(did):
+    """
+    Service 22 did attributes with lower case keys, returns did id and attributes
+    """
+    # did.attrib is a dict containing the info we need
+    content = {k.lower():v for k, v in did.attrib.items()}
+    did_key = content.pop("id")
+    return did_key, content
+
+
+def did_response_items(did):
+    """
+    Response items of a service 22 did
+    """
+    log.debug('%s', did.attrib["Name"])
+    resp_items = []
+    for response_item in did.findall('.//ResponseItems/ResponseItem'):
+        log.debug('attrib = %s', response_item.attrib)
+        log.debug('Name = %s', response_item.attrib['Name'])
+
+        # Makes a new dict with the response_item as a base
+        resp_item = {k.lower():v for k, v in response_item.attrib.items()}
+
+        # Adding the rest of the information
+        for formula in response_item.findall('Formula'):
+            log.debug('FORMULA = %s', formula.text)
+            resp_item['formula'] = formula.text
+        for unit in response_item.findall('Unit'):
+            log.debug('UNIT = %s', unit.text)
+            resp_item['unit'] = unit.text
+        for compare_value in response_item.findall('CompareValue'):
+            log.debug('COMPARE_VALUE = %s', compare_value.text)
+            resp_item['compare_value'] = compare_value.text
+        for software_label in response_item.findall('SoftwareLabel'):
+            log.debug('SOFTWARE_LABEL = %s', software_label.text)
+            resp_item['software_label'] = software_label.text
+        resp_items.append(resp_item)
+    return resp_items
+
 
 def extract_service22_dids(root, type_str):
     """
@@ -90,10 +134,8 @@ def extract_service22_dids(root, type_str):
         diagnostic_part_number = diag_part_num.replace(" ", "_")
 
         for did in ecu_app.findall(SERVICE22):
-            # did.attrib is a dict containing the info we need
-            did_content = {k.lower():v for k, v in did.attrib.items()}
-            did_key = did_content.pop("id")
-            service22_dids[did_key] = did_content
+            did_key, content = did_content(did)
+            service22_dids[did_key] = content
     return service22_dids, diagnostic_part_number
 
 
@@ -109,32 +151,7 @@ def extract_service22_response_items(root, type_str):
     for ecu_app in root.findall(ecu):
         log.info('Name= %s', ecu_app.attrib["Name"])
         for did in ecu_app.findall(SERVICE22):
-            # did.attrib is a dict containing the info we need
-            log.debug('%s', did.attrib["Name"])
-            did_key = did.attrib["ID"]
-            data_dict[did_key] = []
-
-            for response_item in did.findall('.//ResponseItems/ResponseItem'):
-                log.debug('attrib = %s', response_item.attrib)
-                log.debug('Name = %s', response_item.attrib['Name'])
-
-                # Makes a new dict with the response_item as a base
-                resp_item = {k.lower():v for k, v in response_item.attrib.items()}
-
-                # Adding the rest of the information
-                for formula in response_item.findall('Formula'):
-                    log.debug('FORMULA = %s', formula.text)
-                    resp_item['formula'] = formula.text
-                for unit in response_item.findall('Unit'):
-                    log.debug('UNIT = %s', unit.text)
-                    resp_item['unit'] = unit.text
-                for compare_value in response_item.findall('CompareValue'):
-                    log.debug('COMPARE_VALUE = %s', compare_value.text)
-                    resp_item['compare_value'] = compare_value.text
-                for software_label in response_item.findall('SoftwareLabel'):
-                    log.debug('SOFTWARE_LABEL = %s', software_label.text)
-                    resp_item['software_label'] = software_label.text
-                data_dict[did_key].append(resp_item)
+            data_dict[did.attrib["ID"]] = did_response_items(did)
     return data_dict
 
 
@@ -151,34 +168,30 @@ def quotify(string):
     return '\'' + string + '\''
 
 
-def process_did_content(root):
+def process_did_content(dids):
     """
-    Go over the different sections of the sddb and extract the service 22 dids
+    Write the service 22 dids extracted from the different sections of the sddb
     """
-    pbl_dict, pbl_diag_part_num = extract_service22_dids(root, 'PBL')
-    sbl_dict, sbl_diag_part_num = extract_service22_dids(root, 'SBL')
-    app_dict, app_diag_part_num = extract_service22_dids(root, 'APP')
-    data_dict = extract_service22_response_items(root, 'APP')
-
     # Write all information to file. First file mode should be w+ so we start
     # with empty file, then we append to that file.
     did_file = Path(get_conf().rig.build_path).joinpath('sddb_dids.py')
-    write(did_file, 'pbl_diag_part_num', quotify(pbl_diag_part_num), 'w')
-    write(did_file, 'pbl_did_dict', pformat(pbl_dict), 'a')
-    write(did_file, 'sbl_diag_part_num', quotify(sbl_diag_part_num), 'a')
-    write(did_file, 'sbl_did_dict', pformat(sbl_dict), 'a')
-    write(did_file, 'app_diag_part_num', quotify(app_diag_part_num), 'a')
-    write(did_file, 'app_did_dict', pformat(app_dict), 'a')
-    write(did_file, 'resp_item_dict', pformat(data_dict), 'a')
+    write(did_file, 'pbl_diag_part_num', quotify(dids['pbl_diag_part_num']), 'w')
+    write(did_file, 'pbl_did_dict', pformat(dids['pbl_did_dict']), 'a')
+    write(did_file, 'sbl_diag_part_num', quotify(dids['sbl_diag_part_num']), 'a')
+    write(did_file, 'sbl_did_dict', pformat(dids['sbl_did_dict']), 'a')
+    write(did_file, 'app_diag_part_num', quotify(dids['app_diag_part_num']), 'a')
+    write(did_file, 'app_did_dict', pformat(dids['app_did_dict']), 'a')
+    write(did_file, 'resp_item_dict', pformat(dids['resp_item_dict']), 'a')
 
     log.info("DID info has been saved at:\n %s", did_file)
 
-def extract_dtcs(root):
+
+def dtc_content(dtcs_node):
     """
-    Extract DTCs and their respective snapshot definition from service 19
+    DTCs and their respective snapshot definition from the service 19 DTCS element
     """
     dtc_record = {}
-    for dtc_node in root.find('.//Service[@ID="19"]/DTCS'):
+    for dtc_node in dtcs_node:
         dtc = {underscore(k):v for k, v in dtc_node.attrib.items()}
         try:
             dtc_id = dtc.pop('id')
@@ -202,11 +215,18 @@ def extract_dtcs(root):
     return dtc_record
 
 
-def extract_report_dtc(root):
-    """ Get service 19 subfunctions and their response items """
+def extract_dtcs(root):
+    """
+    Extract DTCs and their respective snapshot definition from service 19
+    """
+    return dtc_content(root.find('.//Service[@ID="19"]/DTCS'))
+
+
+def report_dtc_content(subfunctions_node):
+    """ Service 19 subfunctions and their response items """
     report_dtc = {}
 
-    for report_dtc_node in root.find('.//Service[@ID="19"]/Subfunctions'):
+    for report_dtc_node in subfunctions_node:
         report_dtc_item = {
             k.lower():v for k, v in report_dtc_node.attrib.items()}
         try:
@@ -224,170 +244,27 @@ def extract_report_dtc(root):
     return report_dtc
 
 
-def process_dtc_content(root):
-    """ Get DTCs and DTC reports and write it to the build file """
-    dtc_dict = extract_dtcs(root)
-    report_dtc = extract_report_dtc(root)
+def extract_report_dtc(root):
+    """ Get service 19 subfunctions and their response items """
+    return report_dtc_content(root.find('.//Service[@ID="19"]/Subfunctions'))
+
 
+def process_dtc_content(dtcs):
+    """ Write DTCs and DTC reports to the build file """
     dtc_file = Path(get_conf().rig.build_path).joinpath('sddb_dtcs.py')
-    write(dtc_file, 'sddb_dtcs', pformat(dtc_dict), 'w')
-    write(dtc_file, 'sddb_report_dtc', pformat(report_dtc), 'a')
+    write(dtc_file, 'sddb_dtcs', pformat(dtcs['sddb_dtcs']), 'w')
+    write(dtc_file, 'sddb_report_dtc', pformat(dtcs['sddb_report_dtc']), 'a')
 
     log.info("DTC info has been saved at:\n %s", dtc_file)
 
-def extract_pbl_services(root):
-    """ Get primary bootloader services"""
-    # pylint: disable=bare-except
-    pbl_services = {}
-    pbl_service_list = root.find('.//SW[@Type="PBL"]/Services', namespaces=None)
-    if pbl_service_list is not None:
-        for service in pbl_service_list:
-            # First get Service name and ID
-            service_item = dict(service.attrib)
-            service_item['Name'] = underscore(service_item['Name'])
-            service_item['name'] = service_item.pop('Name')
-            try:
-                service_id = service_item.pop('ID')
-            except:
-                pass
-
-            pbl_services[service_id] = service_item
-
-            # Get the negative response codes
-            nrc_lst = []
-            try:
-                for nrc in service.find('NegativeResponseCodes'):
-                    to_underscore = dict(nrc.attrib)
-                    to_underscore['Name'] = underscore(to_underscore['Name'])
-                    to_underscore['code'] = to_underscore.pop('Code')
-                    to_underscore['name'] = to_underscore.pop('Name')
-                    nrc_lst.append(to_underscore)
-
-                pbl_services[service_id]['negative_response_code'] = nrc_lst
-
-            except:
-                log.debug("PBL: Service (%s) does not have any NRC defined.", service_id)
-
-            # Get subfunctions
-            try:
-                sub_fn_lst = []
-                for sub_functions in service.find('Subfunctions'):
-                    to_underscore = dict(sub_functions.attrib)
-                    to_underscore['Name'] = underscore(to_underscore['Name'])
-                    to_underscore['id'] = to_underscore.pop('ID')
-                    to_underscore['name'] = to_underscore.pop('Name')
-
-                    # Not all subfunctions have the keys below, need to check for each subfunction.
-                    if 'delayTime' in to_underscore:
-                        to_underscore['delay_time'] = to_underscore.pop('delayTime')
-                        to_underscore['delay_time_on_boot'] = to_underscore.pop('delayTimeOnBoot')
-                        to_underscore['number_of_attempts'] = to_underscore.pop('numberOfAttempts')
-
-                    sub_fn_lst.append(to_underscore)
-
-                    # Get sessions
-                    sess_lst = []
-                    for sessions in sub_functions.find('Sessions'):
-                        to_underscore = dict(sessions.attrib)
-                        to_underscore['Name'] = underscore(to_underscore['Name'])
-                        to_underscore['id'] = to_underscore.pop('ID')
-                        to_underscore['name'] = to_underscore.pop('Name')
-                        to_underscore['p2server_max'] = to_underscore.pop('P2ServerMax')
-                        to_underscore['p4server_max'] = to_underscore.pop('P4ServerMax')
-
-                        sess_lst.append(to_underscore)
-
-                    pbl_services[service_id]['sessions'] = sess_lst
-                pbl_services[service_id]['sub_functions'] = sub_fn_lst
-
-            except:
-                log.debug("PBL: No subfunction in service (%s).", service_id)
-    else:
-        log.debug("PBL: No PBL services in sddb.")
-    return pbl_services
-
 
-def extract_sbl_services(root):
-    """ Get secondary bootloader services """
-    # pylint: disable=bare-except
-    sbl_services = {}
-    sbl_service_list = root.find('.//SW[@Type="SBL"]/Services', namespaces=None)
-    if sbl_service_list is not None:
-        for service in sbl_service_list:
-            # First get Service name and ID
-            service_item = dict(service.attrib)
-            service_item['Name'] = underscore(service_item['Name'])
-            service_item['name'] = service_item.pop('Name')
-            try:
-                service_id = service_item.pop('ID')
-            except:
-                pass
-
-            sbl_services[service_id] = service_item
-
-            # Get the negative response codes
-            nrc_lst = []
-            try:
-                for nrc in service.find('NegativeResponseCodes'):
-                    to_underscore = dict(nrc.attrib)
-                    to_underscore['Name'] = underscore(to_underscore['Name'])
-                    to_underscore['code'] = to_underscore.pop('Code')
-                    to_underscore['name'] = to_underscore.pop('Name')
-                    nrc_lst.append(to_underscore)
-
-                sbl_services[service_id]['negative_response_code'] = nrc_lst
-
-            except:
-                log.debug("SBL: Service (%s) does not have any NRC defined.", service_id)
-
-            # Get subfunctions
-            try:
-                sub_fn_lst = []
-                for sub_functions in service.find('Subfunctions'):
-                    to_underscore = dict(sub_functions.attrib)
-                    to_underscore['Name'] = underscore(to_underscore['Name'])
-                    to_underscore['id'] = to_underscore.pop('ID')
-                    to_underscore['name'] = to_underscore.pop('Name')
-
-                    # Not all subfunctions have the keys below, need to check for each subfunction.
-                    if 'delayTime' in to_underscore:
-                        to_underscore['delay_time'] = to_underscore.pop('delayTime')
-                        to_underscore['delay_time_on_boot'] = to_underscore.pop('delayTimeOnBoot')
-                        to_underscore['number_of_attempts'] = to_underscore.pop('numberOfAttempts')
-
-                    sub_fn_lst.append(to_underscore)
-
-                    # Get sessions
-                    sess_lst = []
-                    for sessions in sub_functions.find('Sessions'):
-                        to_underscore = dict(sessions.attrib)
-                        to_underscore['Name'] = underscore(to_underscore['Name'])
-                        to_underscore['id'] = to_underscore.pop('ID')
-                        to_underscore['name'] = to_underscore.pop('Name')
-                        to_underscore['p2server_max'] = to_underscore.pop('P2ServerMax')
-                        to_underscore['p4server_max'] = to_underscore.pop('P4ServerMax')
-
-                        sess_lst.append(to_underscore)
-
-                    sbl_services[service_id]['sessions'] = sess_lst
-                sbl_services[service_id]['sub_functions'] = sub_fn_lst
-
-            except:
-                log.debug("SBL: No subfunction in service (%s).", service_id)
-    else:
-        log.debug("SBL services are not supported")
-    return sbl_services
-
-
-def extract_app_services(root):
+def services_content(service_list, type_str):
     """
-    Get application services
-        Default session
-        Extended session
+    Services of one software level (PBL, SBL or APP) from its Services element
     """
     # pylint: disable=bare-except
-    app_services = {}
-    for service in root.find('.//SW[@Type="APP"]/Services', namespaces=None):
+    services = {}
+    for service in service_list:
         # First get Service name and ID
         service_item = dict(service.attrib)
         service_item['Name'] = underscore(service_item['Name'])
@@ -397,7 +274,7 @@ def extract_app_services(root):
         except:
             pass
 
-        app_services[service_id] = service_item
+        services[service_id] = service_item
 
         # Get the negative response codes
         nrc_lst = []
@@ -409,10 +286,10 @@ def extract_app_services(root):
                 to_underscore['name'] = to_underscore.pop('Name')
                 nrc_lst.append(to_underscore)
 
-            app_services[service_id]['negative_response_code'] = nrc_lst
+            services[service_id]['negative_response_code'] = nrc_lst
 
         except:
-            log.debug("APP: Service (%s) does not have any NRC defined.", service_id)
+            log.debug("%s: Service (%s) does not have any NRC defined.", type_str, service_id)
 
         # Get subfunctions
         try:
@@ -443,13 +320,22 @@ def extract_app_services(root):
 
                     sess_lst.append(to_underscore)
 
-                app_services[service_id]['sessions'] = sess_lst
-            app_services[service_id]['sub_functions'] = sub_fn_lst
+                services[service_id]['sessions'] = sess_lst
+            services[service_id]['sub_functions'] = sub_fn_lst
 
         except:
-            log.debug("APP: No subfunction in service (%s).", service_id)
+            log.debug("%s: No subfunction in service (%s).", type_str, service_id)
+
+    return services
+
 
-    return app_services
+def extract_services(root, type_str):
+    """ Get services of a software level: PBL, SBL or APP """
+    service_list = root.find(f'.//SW[@Type="{type_str}"]/Services', namespaces=None)
+    if service_list is None:
+        log.debug("%s: No %s services in sddb.", type_str, type_str)
+        return {}
+    return services_content(service_list, type_str)
 
 
 def extract_defined_services(root):
@@ -463,41 +349,189 @@ def extract_defined_services(root):
         Default session
         ExtendedDiagnostic session
     """
-    pbl_services = extract_pbl_services(root)
-    sbl_services = extract_sbl_services(root)
-    app_services = extract_app_services(root)
+    pbl_services = extract_services(root, 'PBL')
+    sbl_services = extract_services(root, 'SBL')
+    app_services = extract_services(root, 'APP')
 
     return pbl_services, sbl_services, app_services
 
 
-def process_service_content(root):
-    """ Get services for each software level and write to file. """
-    pbl_services, sbl_services, app_services = extract_defined_services(root)
-
+def process_service_content(services):
+    """ Write services for each software level to file. """
     service_file = Path(get_conf().rig.build_path).joinpath('sddb_services.py')
-    write(service_file, 'pbl', pformat(pbl_services), 'w')
-    write(service_file, 'sbl', pformat(sbl_services), 'a')
-    write(service_file, 'app', pformat(app_services), 'a')
+    write(service_file, 'pbl', pformat(services['pbl']), 'w')
+    write(service_file, 'sbl', pformat(services['sbl']), 'a')
+    write(service_file, 'app', pformat(services['app']), 'a')
 
     log.info("Services for primary bootloader, secondary bootloader, and "
              "application has been saved at:\n %s", service_file)
 
 
+def extract_content(root):
+    """
+    Content of all sections of the parsed sddb tree, the same way SddbExtractor
+    collects it while parsing
+    """
+    pbl_dict, pbl_diag_part_num = extract_service22_dids(root, 'PBL')
+    sbl_dict, sbl_diag_part_num = extract_service22_dids(root, 'SBL')
+    app_dict, app_diag_part_num = extract_service22_dids(root, 'APP')
+    pbl_services, sbl_services, app_services = extract_defined_services(root)
+    return {'dids': {'pbl_diag_part_num': pbl_diag_part_num, 'pbl_did_dict': pbl_dict,
+                     'sbl_diag_part_num': sbl_diag_part_num, 'sbl_did_dict': sbl_dict,
+                     'app_diag_part_num': app_diag_part_num, 'app_did_dict': app_dict,
+                     'resp_item_dict': extract_service22_response_items(root, 'APP')},
+            'dtcs': {'sddb_dtcs': extract_dtcs(root),
+                     'sddb_report_dtc': extract_report_dtc(root)},
+            'services': {'pbl': pbl_services, 'sbl': sbl_services, 'app': app_services}}
+
+
+def clear_element(elem, siblings=False):
+    """
+    Free the content of an element which has been extracted,
+    optionally also the (already extracted) siblings before it
+    """
+    elem.clear()
+    if siblings:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def parent_is_service(elem, service_id):
+    """ True if elem is a direct child of Service with ID service_id """
+    parent = elem.getparent()
+    return parent is not None and parent.tag == 'Service' and parent.get('ID') == service_id
+
+
+class SddbExtractor: # pylint: disable=too-many-instance-attributes
+    """
+    Collects the content of all sections of the sddb in a single pass while
+    parsing, the result is the same as extract_content on the parsed tree.
+
+    Elements are cleared as soon as their content has been extracted so the
+    whole tree is never kept in memory.
+    """
+    # only events for these elements are handled
+    TAGS = ('ECU', 'SW', 'DataIdentifier', 'DTCS', 'Subfunctions', 'Services')
+
+    def __init__(self):
+        self.ecu_name = None
+        self.diag_part_num = {type_str: str() for type_str in SW_TYPES}
+        self.did_dicts = {type_str: {} for type_str in SW_TYPES}
+        self.resp_item_dict = {}
+        self.dtcs = None
+        self.report_dtc = None
+        self.services = {type_str: None for type_str in SW_TYPES}
+        # types of the SW elements being parsed, None for SW elements not matched
+        self.sw_stack = []
+
+    def parse(self, source):
+        """
+        Parse sddb from source (file name or binary file object),
+        returns the content the same way as extract_content
+        """
+        context = etree.iterparse( # pylint: disable=c-extension-no-member
+            source, events=('start', 'end'), tag=self.TAGS)
+        for event, elem in context:
+            if event == 'start':
+                self.__start(elem)
+            else:
+                self.__end(elem)
+        log.debug(context.root.attrib)
+        return self.content()
+
+    def content(self):
+        """ Content collected so far """
+        return {'dids': {'pbl_diag_part_num': self.diag_part_num['PBL'],
+                         'pbl_did_dict': self.did_dicts['PBL'],
+                         'sbl_diag_part_num': self.diag_part_num['SBL'],
+                         'sbl_did_dict': self.did_dicts['SBL'],
+                         'app_diag_part_num': self.diag_part_num['APP'],
+                         'app_did_dict': self.did_dicts['APP'],
+                         'resp_item_dict': self.resp_item_dict},
+                'dtcs': {'sddb_dtcs': self.dtcs or {},
+                         'sddb_report_dtc': self.report_dtc or {}},
+                'services': {type_str.lower(): self.services[type_str] or {}
+                             for type_str in SW_TYPES}}
+
+    def __sw_type(self, sw_node):
+        """ Type of a SW matched by ecu_determination, None for other SW elements """
+        type_str = sw_node.get('Type')
+        sws = sw_node.getparent()
+        if type_str not in SW_TYPES or sws is None or sws.tag != 'SWs':
+            return None
+        ecu = sws.getparent()
+        if ecu is None or ecu.tag != 'ECU' or ecu.get('Name') != self.ecu_name:
+            return None
+        return type_str
+
+    def __start(self, elem):
+        # attributes are available at start, children are not
+        if elem.tag == 'ECU':
+            if self.ecu_name is None:
+                self.ecu_name = elem.attrib['Name']
+        elif elem.tag == 'SW':
+            type_str = self.__sw_type(elem)
+            self.sw_stack.append(type_str)
+            if type_str is not None:
+                diag_part_num = elem.attrib['DiagnosticPartNumber']
+                self.diag_part_num[type_str] = diag_part_num.replace(" ", "_")
+                if type_str == 'APP':
+                    log.info('Name= %s', elem.attrib["Name"])
+
+    def __end(self, elem):
+        # element and all its children are parsed
+        tag = elem.tag
+        if tag == 'DataIdentifier':
+            sw_types = {type_str for type_str in self.sw_stack if type_str is not None}
+            parent = elem.getparent()
+            if sw_types and parent.tag == 'DataIdentifiers' and parent_is_service(parent, '22'):
+                self.__service22_did(elem, sw_types)
+                clear_element(elem, siblings=True)
+        elif tag == 'DTCS':
+            if self.dtcs is None and parent_is_service(elem, '19'):
+                self.dtcs = dtc_content(elem)
+                clear_element(elem)
+        elif tag == 'Subfunctions':
+            # used for the services as well, cleared with them
+            if self.report_dtc is None and parent_is_service(elem, '19'):
+                self.report_dtc = report_dtc_content(elem)
+        elif tag == 'Services':
+            parent = elem.getparent()
+            if parent is not None and parent.tag == 'SW':
+                type_str = parent.get('Type')
+                if type_str in self.services and self.services[type_str] is None:
+                    self.services[type_str] = services_content(elem, type_str)
+                clear_element(elem)
+        elif tag == 'SW':
+            self.sw_stack.pop()
+            clear_element(elem, siblings=True)
+        elif tag == 'ECU':
+            clear_element(elem)
+
+    def __service22_did(self, did, sw_types):
+        did_key, content = did_content(did)
+        for type_str in sw_types:
+            self.did_dicts[type_str][did_key] = dict(content)
+        if 'APP' in sw_types:
+            self.resp_item_dict[did.attrib["ID"]] = did_response_items(did)
+
+
 def parse_sddb_file():
     """
     Convert and parse the sddb file and trigger the processing of it's content
     """
     sddb_file = get_sddb_file()
+    start_time = time.perf_counter()
 
     # the carcom sddb export seems to be in latin1 format and lxml.etree can't
     # handle it so let's convert the file first
-    with tempfile.TemporaryFile(mode='w+') as tf:
+    with tempfile.TemporaryFile(mode='w+b') as tf:
         with open(sddb_file, 'r', encoding='latin1') as f:
 
             # remove that pesky BOM at the beginning of the file if it exists
             line = f.readline()
             line = line.replace(codecs.BOM_UTF8.decode('latin1'), '')
-            tf.write(line)
+            tf.write(line.encode('utf-8'))
 
             # read the rest of the file
             for line in f:
@@ -509,14 +543,21 @@ def parse_sddb_file():
                 line = line.replace(u'\x85', '\n')
                 line = line.replace(u'\x96', 'SPA')
 
-                tf.write(line)
+                tf.write(line.encode('utf-8'))
 
         log.info("Parse sddb file")
         tf.seek(0)
-        tree = etree.parse(tf) # pylint: disable=c-extension-no-member
-    root = tree.getroot()
-    log.debug(root.attrib)
-
-    process_did_content(root)
-    process_dtc_content(root)
-    process_service_content(root)
+        sddb_content = SddbExtractor().parse(tf)
+    log.info("Parsed sddb file %s (%d kB) in %.2f s", sddb_file.name,
+             sddb_file.stat().st_size // 1024, time.perf_counter() - start_time)
+
+    process_did_content(sddb_content['dids'])
+    process_dtc_content(sddb_content['dtcs'])
+    process_service_content(sddb_content['services'])
+
+    # binary cache of the generated modules, used by Rig to load the content
+    build_path = Path(get_conf().rig.build_path)
+    sddb_hash = None
+    for content, data in sddb_content.items():
+        sddb_hash = write_cache(build_path.joinpath(f'sddb_{content}.pickle'), sddb_file,
+                                build_path.joinpath(f'sddb_{content}.py'), data, sddb_hash)
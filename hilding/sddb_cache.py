@@ -0,0 +1,58 @@
+"""
+Binary cache for the content generated from the sddb file
+
+The generated sddb_*.py modules are big dict literals that take a long time
+to compile. Each section (dids, dtcs, services) is also stored pickled in the
+build directory together with a key identifying the sddb file and generated
+module it was made from, see file_cache. The sddb file is identified by its
+content and the generated module by size and timestamp.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+from hilding import file_cache
+
+# increase when the content or format of the cache changes
+SDDB_CACHE_VERSION = 2
+
+
+def find_sddb_file(sddb_path):
+    """ sddb file in sddb_path selected the same way as sddb.get_sddb_file, or None """
+    return next(sddb_path.glob("*.sddb"), None)
+
+
+def write_cache(cache_file, sddb_file, module_file, data, sddb_hash=None):
+    """
+    Store data generated from sddb_file (and written to module_file) in cache_file
+
+    Returns the sha256 of the sddb file so it can be reused for other sections
+    """
+    key = file_cache.cache_key(SDDB_CACHE_VERSION, {"sddb": sddb_file},
+                               {"module": module_file}, {"sddb": sddb_hash})
+    file_cache.write_cache(cache_file, key, data)
+    return key["sddb"]["sha256"]
+
+
+def read_cache(cache_file, sddb_file, module_file):
+    """
+    Get data stored in cache_file, None if there is no valid cache
+    """
+    if sddb_file is None or not module_file.exists():
+        return None
+    return file_cache.read_cache(cache_file, SDDB_CACHE_VERSION, {"sddb": sddb_file},
+                                 {"module": module_file})
@@ -0,0 +1,50 @@
+"""
+pytest for hilding/sddb_cache.py
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+from hilding.sddb_cache import find_sddb_file, read_cache, write_cache
+
+
+def test_sddb_cache(tmp_path):
+    """ pytest: cache is only used while sddb file and generated module are unchanged """
+    sddb_file = tmp_path.joinpath("ecu.sddb")
+    sddb_file.write_text("<sddb/>")
+    module_file = tmp_path.joinpath("sddb_dids.py")
+    module_file.write_text("app_did_dict = {}")
+    cache_file = tmp_path.joinpath("sddb_dids.pickle")
+    data = {"app_did_dict": {"F186": {"name": "Active Diagnostic Session", "size": "1"}}}
+
+    assert find_sddb_file(tmp_path) == sddb_file
+    assert read_cache(cache_file, sddb_file, module_file) is None
+    write_cache(cache_file, sddb_file, module_file, data)
+    assert read_cache(cache_file, sddb_file, module_file) == data
+
+    # new sddb content
+    sddb_file.write_text("<sddb></sddb>")
+    assert read_cache(cache_file, sddb_file, module_file) is None
+
+    # regenerated module
+    write_cache(cache_file, sddb_file, module_file, data)
+    module_file.write_text("app_did_dict = {'F186': {}}")
+    assert read_cache(cache_file, sddb_file, module_file) is None
+
+    # module not generated
+    module_file.unlink()
+    assert read_cache(cache_file, sddb_file, module_file) is None
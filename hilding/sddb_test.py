@@ -0,0 +1,127 @@
+"""
+pytest for hilding/sddb.py
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+from io import BytesIO
+
+from lxml import etree
+
+from hilding.sddb import SddbExtractor, extract_content
+
+SERVICES = """
+<Services>
+  <Service ID="22" Name="ReadDataByIdentifier">
+    <NegativeResponseCodes>
+      <NegativeResponseCode Code="13" Name="IncorrectMessageLengthOrInvalidFormat"/>
+    </NegativeResponseCodes>
+    <DataIdentifiers>
+      <DataIdentifier ID="F186" Name="Active Diagnostic Session" Size="1">
+        <ResponseItems>
+          <ResponseItem Name="Active Diagnostic Session" Offset="0" Size="1">
+            <Formula>X</Formula>
+            <Unit>degC</Unit>
+            <CompareValue>01</CompareValue>
+          </ResponseItem>
+        </ResponseItems>
+      </DataIdentifier>
+      <DataIdentifier ID="{did}" Name="Part Number" Size="7"/>
+    </DataIdentifiers>
+  </Service>
+  <Service ID="10" Name="DiagnosticSessionControl">
+    <Subfunctions>
+      <Subfunction ID="01" Name="DefaultSession">
+        <Sessions>
+          <Session ID="01" Name="DefaultSession" P2ServerMax="50" P4ServerMax="5000"/>
+        </Sessions>
+      </Subfunction>
+    </Subfunctions>
+  </Service>
+  {service19}
+</Services>
+"""
+
+SERVICE19 = """
+<Service ID="19" Name="ReadDTCInformation">
+  <Subfunctions>
+    <Subfunction ID="02" Name="ReportDTCByStatusMask">
+      <Sessions>
+        <Session ID="01" Name="DefaultSession" P2ServerMax="50" P4ServerMax="5000"/>
+      </Sessions>
+      <ResponseItems>
+        <ResponseItem Name="DTCStatusAvailabilityMask" Offset="0" Size="1"/>
+      </ResponseItems>
+    </Subfunction>
+  </Subfunctions>
+  <DTCS>
+    <DTC ID="0x0A0B4A" Description="Wrong software" FaultType="4A">
+      <SnapshotDIDs>
+        <SnapshotDID Type="Global">
+          <DataIdentifier ID="DD00" Name="Global Real Time"/>
+        </SnapshotDID>
+      </SnapshotDIDs>
+    </DTC>
+    <DTC ID="0x0A0C00" Description="No snapshot"/>
+  </DTCS>
+</Service>
+"""
+
+# pylint: disable=consider-using-f-string
+SDDB = """<?xml version="1.0" encoding="UTF-8"?>
+<SDDB Version="1">
+  <ECUs>
+    <ECU Name="BECM">
+      <SWs>
+        <SW Type="PBL" Name="BECM PBL" DiagnosticPartNumber="32263666 AA">{pbl}</SW>
+        <SW Type="SBL" Name="BECM SBL" DiagnosticPartNumber="32263667 AA">{sbl}</SW>
+        <SW Type="APP" Name="BECM APP" DiagnosticPartNumber="32290001 AE">{app}</SW>
+      </SWs>
+    </ECU>
+    <ECU Name="OTHER">
+      <SWs>
+        <SW Type="APP" Name="OTHER APP" DiagnosticPartNumber="1">{other}</SW>
+      </SWs>
+    </ECU>
+  </ECUs>
+</SDDB>
+""".format(
+    pbl=SERVICES.format(did="F121", service19=""),
+    sbl=SERVICES.format(did="F122", service19=""),
+    app=SERVICES.format(did="F12E", service19=SERVICE19),
+    other=SERVICES.format(did="F12F", service19=""))
+# pylint: enable=consider-using-f-string
+
+
+def test_sddb_extractor():
+    """ pytest: single pass extraction gives the same content as the parsed tree """
+    content = SddbExtractor().parse(BytesIO(SDDB.encode('utf-8')))
+    tree = etree.parse(BytesIO(SDDB.encode('utf-8'))) # pylint: disable=c-extension-no-member
+    assert content == extract_content(tree.getroot())
+
+    dids = content['dids']
+    assert dids['app_diag_part_num'] == '32290001_AE'
+    assert set(dids['app_did_dict']) == {'F186', 'F12E'}
+    assert set(dids['pbl_did_dict']) == {'F186', 'F121'}
+    assert dids['resp_item_dict']['F186'][0]['unit'] == 'degC'
+    assert dids['resp_item_dict']['F12E'] == []
+    assert content['dtcs']['sddb_dtcs']['0A0B4A']['snapshot_dids'][0]['did_ref'] ==\
+        {'ID': 'DD00', 'Name': 'Global Real Time'}
+    assert content['dtcs']['sddb_report_dtc']['02']['response_items'][0]['size'] == '1'
+    assert set(content['services']['app']) == {'22', '10', '19'}
+    assert content['services']['sbl']['10']['sessions'][0]['p2server_max'] == '50'
@@ -24,6 +24,8 @@ import os
 import logging
 import sys
 import importlib
+import multiprocessing
+import queue
 import traceback
 from datetime import datetime
 from pathlib import Path
@@ -32,6 +34,8 @@ import yaml
 from iterfzf import iterfzf
 
 from hilding import analytics
+from hilding import broker_session
+from hilding.conf import Conf, initialize_conf
 from hilding.reset_ecu import reset_and_flash_ecu
 from hilding.uds import UdsEmptyResponse
 from hilding.dut import DutTestError
@@ -232,23 +236,148 @@ def run_tests_and_save_results(test_files, result_dir, use_db=False, use_mq=Fals
     run tests from list of tests and save to message bus and/or db
     """
 
-    analytics.messagehandler(use_db=use_db, use_mq=use_mq)
+    analytics.messagehandler(use_db=use_db, use_mq=use_mq, spool_dir=result_dir)
     analytics.testsuite_started()
 
     configure_progress_log(result_dir)
 
-    for test_file_py in test_files:
-        if reset_between:
-            run_reset_between()
+    # the signal broker setup done by the first test is kept for the next tests
+    with broker_session.session():
+        for test_file_py in test_files:
+            if reset_between:
+                run_reset_between()
 
-        test_case_name = get_test_case_name(test_file_py)
-        analytics.testcase_started(test_case_name)
-        verdict = run_test_and_parse_log_to_result(test_file_py, result_dir.joinpath('Result.txt'))
-        analytics.testcase_ended(verdict)
+            test_case_name = get_test_case_name(test_file_py)
+            analytics.testcase_started(test_case_name)
+            verdict = run_test_and_parse_log_to_result(test_file_py,
+                                                       result_dir.joinpath('Result.txt'))
+            analytics.testcase_ended(verdict)
 
     analytics.testsuite_ended()
 
 
+def rig_worker(rig, result_dir, tests, events, reset_between, loglevel):
+    # pylint: disable=too-many-arguments
+    """
+    worker process running tests on one rig, started by run_tests_on_rigs
+
+    takes (index, test_file_py) from the tests queue until None is received,
+    appends the results to Result_<rig>.txt and puts (rig, index, verdict,
+    analytics events) on the events queue when a test is done. The test case
+    and test step analytics are recorded with their time and sent by the
+    main process, see analytics.start_recording
+    """
+    logging.basicConfig(
+        format=f'%(levelname)s {rig} %(name)s %(message)s', stream=sys.stdout,
+        level=loglevel)
+    # each worker has its own conf, the Dut created by the tests uses it for
+    # the gRPC channel to the signal broker of this rig
+    initialize_conf(rig, force=True)
+    global _TEST_RES_DIR # pylint: disable=global-statement
+    _TEST_RES_DIR = result_dir
+    configure_progress_log(result_dir)
+
+    result_file = result_dir.joinpath(f"Result_{rig}.txt")
+    with broker_session.session():
+        for index, test_file_py in iter(tests.get, None):
+            if reset_between:
+                run_reset_between()
+            analytics.start_recording()
+            analytics.testcase_started(get_test_case_name(test_file_py))
+            verdict = run_test_and_parse_log_to_result(test_file_py, result_file)
+            analytics.testcase_ended(verdict)
+            events.put((rig, index, verdict, analytics.stop_recording()))
+
+
+def merge_results(test_files, result_dir, rigs):
+    """
+    append the results from the Result_<rig>.txt files to Result.txt in the
+    order of test_files
+    """
+    rig_results = {}
+    for rig in rigs:
+        rig_result_file = result_dir.joinpath(f"Result_{rig}.txt")
+        if not rig_result_file.exists():
+            continue
+        with open(rig_result_file) as rig_result_handle:
+            for line in rig_result_handle.readlines():
+                if line.strip():
+                    rig_results.setdefault(line.split()[0], []).append(line)
+
+    with open(result_dir.joinpath('Result.txt'), mode='a') as result_file_handle:
+        for test_file_py in test_files:
+            lines = rig_results.get(get_test_case_name(test_file_py))
+            if lines:
+                result_file_handle.write(lines.pop(0))
+            else:
+                log.error("No result for %s", Path(test_file_py).name)
+
+
+def run_tests_on_rigs(test_files, result_dir, rigs, use_db=False, use_mq=False,
+                      reset_between=False):
+    # pylint: disable=too-many-arguments,too-many-locals
+    """
+    run tests from list of tests on several rigs in parallel and save to
+    message bus and/or db
+
+    there is one worker process per rig, each taking the next test from a
+    shared queue. All results end up in one Result.txt and one test suite.
+    The message bus has one current test case, so each test case is sent
+    with its test steps when it is done, keeping the times from the worker.
+    """
+    platforms = {rig: Conf(selected_rig=rig).rig.platform for rig in rigs}
+    if len(set(platforms.values())) > 1:
+        log.warning("Rigs with different platforms share ODTBPROJPARAM: %s", platforms)
+
+    analytics.messagehandler(use_db=use_db, use_mq=use_mq, spool_dir=result_dir)
+    analytics.testsuite_started()
+
+    configure_progress_log(result_dir)
+
+    # spawn, each worker must create its own gRPC channel
+    context = multiprocessing.get_context('spawn')
+    tests = context.Queue()
+    events = context.Queue()
+    for index, test_file_py in enumerate(test_files):
+        tests.put((index, test_file_py))
+    workers = []
+    for rig in rigs:
+        tests.put(None)
+        worker = context.Process(
+            target=rig_worker, name=f"rig_{rig}",
+            args=(rig, result_dir, tests, events, reset_between, logging.getLogger().level))
+        worker.start()
+        workers.append(worker)
+
+    done = 0
+    while done < len(test_files):
+        try:
+            rig, index, verdict, recorded = events.get(timeout=10)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                log.error("All rig workers stopped, %s tests not run",
+                          len(test_files) - done)
+                break
+            continue
+        if recorded:
+            analytics.replay(recorded)
+        else:
+            # analytics not configured for the rig of the worker
+            analytics.testcase_started(get_test_case_name(test_files[index]))
+            analytics.testcase_ended(verdict)
+        log.info("%s/%s tests done (%s on %s)", done + 1, len(test_files),
+                 Path(test_files[index]).name, rig)
+        done += 1
+
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            log.error("Worker %s stopped with exit code %s", worker.name, worker.exitcode)
+
+    merge_results(test_files, result_dir, rigs)
+    analytics.testsuite_ended()
+
+
 def get_ecutest_files(file_dict, reqprod):
     """ use fzf to select tests to run """
     files = []
@@ -375,8 +504,13 @@ def nightly(args):
     add_to_result(blacklisted_reqprods, result_file)
     create_logs(blacklisted_reqprods, test_res_dir)
 
-    run_tests_and_save_results(
-        test_files, test_res_dir, args.use_db, args.use_mq, reset_between=True)
+    rigs = getattr(args, 'rigs', None)
+    if rigs:
+        run_tests_on_rigs(
+            test_files, test_res_dir, rigs, args.use_db, args.use_mq, reset_between=True)
+    else:
+        run_tests_and_save_results(
+            test_files, test_res_dir, args.use_db, args.use_mq, reset_between=True)
 
     add_testsuite_endtime(result_file)
     # create an empty txt file with the global verdict as name
@@ -36,3 +36,19 @@ def _test_get_test_res_dir():
     time.sleep(0.1)
     res2 = testrunner.get_test_res_dir("%f")
     assert res1 == res2
+
+
+def test_merge_results(tmp_path):
+    """ results from the rigs are merged in the order of the test list """
+    test_files = [f"test_folder/automated/e_{reqprod}_a.py-->e_{reqprod}_A_1"
+                  for reqprod in (100, 200, 300)]
+    tmp_path.joinpath("Result_rig1.txt").write_text(
+        "e_300_A_1 FAILED e_300.log\ne_100_A_1 PASSED e_100.log\n")
+    tmp_path.joinpath("Result_rig2.txt").write_text("e_200_A_1 PASSED e_200.log\n")
+    tmp_path.joinpath("Result.txt").write_text("e_1_A_1 Excluded e_1.log\n")
+    testrunner.merge_results(test_files, tmp_path, ["rig1", "rig2"])
+    assert tmp_path.joinpath("Result.txt").read_text().splitlines() == [
+        "e_1_A_1 Excluded e_1.log",
+        "e_100_A_1 PASSED e_100.log",
+        "e_200_A_1 PASSED e_200.log",
+        "e_300_A_1 FAILED e_300.log"]
@@ -103,7 +103,8 @@ class Uds:
             "purpose": self.purpose,
             "timeout": 1,
             "min_no_messages": -1,
-            "max_no_messages": -1
+            "max_no_messages": -1,
+            "wait_response": True
         }
 
         log.info("--> Request with payload: %s", payload.hex())
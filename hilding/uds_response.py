@@ -32,6 +32,53 @@ from hilding import get_conf
 
 log = logging.getLogger('uds_response')
 
+
+class DidIndex: # pylint: disable=too-few-public-methods
+    """ DIDs defined in the sddb for an incoming mode
+
+    Built once per rig and incoming mode (see Rig.sddb_did_index) instead of
+    for every response.
+
+    dids      DID -> sddb info (name, size, ...)
+    regex     DID -> compiled regex finding the DID and its item in a payload
+    handlers  DID -> names of UdsResponse methods handling the DID
+    """
+    def __init__(self, sddb_dids, incoming_mode):
+        self.dids = {}
+        if not incoming_mode:
+            self.dids.update(sddb_dids["app_did_dict"])
+            self.dids.update(sddb_dids["pbl_did_dict"])
+            self.dids.update(sddb_dids["sbl_did_dict"])
+        elif incoming_mode in [1, 3]:
+            self.dids.update(sddb_dids["app_did_dict"])
+        elif incoming_mode == 2:
+            # it would be good to separate these two and we can do that if we
+            # add a state to the class indicating which programming mode it's
+            # in.
+            self.dids.update(sddb_dids["pbl_did_dict"])
+            self.dids.update(sddb_dids["sbl_did_dict"])
+        else:
+            sys.exit(f"Incorrect incoming_mode set: {incoming_mode}. "
+                     f"Exiting...")
+
+        self.regex = {}
+        for did, item in self.dids.items():
+            # each byte takes two hexadecimal characters
+            length = int(item['size']) * 2
+            # For F120 with a length of 14 the resulting regex should be
+            # r'F120(.{14})'. The f-string needs the curly braces doubled to
+            # get a single curly brace pair in the resulting string.
+            self.regex[did] = re.compile(rf'{did}(.{{{length}}})')
+
+        # DID specific handlers are methods with a name ending with the DID
+        methods = dir(UdsResponse)
+        self.handlers = {}
+        for did in self.dids:
+            did_methods = [method for method in methods if method.endswith(did.lower())]
+            if did_methods:
+                self.handlers[did] = did_methods
+
+
 class UdsResponse:
     """ UDS response, this is a class that handles one response
     """
@@ -41,7 +88,7 @@ class UdsResponse:
         self.data = {}
         self.data['details'] = {}
         self.all_defined_dids = {}
-        self.__did_regex = {}
+        self.__did_index = None
         self.__sddb_dids = get_conf().rig.sddb_dids
         self.__sddb_dtcs = get_conf().rig.sddb_dtcs.get("sddb_dtcs")
         self.__process_message()
@@ -114,38 +161,8 @@ class UdsResponse:
             self.data["nrc_name"] = negative_response_codes[nrc]
 
     def __positive_response(self):
-        self.all_defined_dids = {}
-        if not self.incoming_mode:
-            self.all_defined_dids.update(self.__sddb_dids["app_did_dict"])
-            self.all_defined_dids.update(self.__sddb_dids["pbl_did_dict"])
-            self.all_defined_dids.update(self.__sddb_dids["sbl_did_dict"])
-        elif self.incoming_mode in [1, 3]:
-            self.all_defined_dids.update(self.__sddb_dids["app_did_dict"])
-        elif self.incoming_mode == 2:
-            # it would be good to separate these two and we can do that if we
-            # add a state to the class indicating which programming mode it's
-            # in.
-            self.all_defined_dids.update(self.__sddb_dids["pbl_did_dict"])
-            self.all_defined_dids.update(self.__sddb_dids["sbl_did_dict"])
-        else:
-            sys.exit(f"Incorrect incoming_mode set: {self.incoming_mode}. "
-                     f"Exiting...")
-
-        for did, item in self.all_defined_dids.items():
-            # each byte takes two hexadecimal characters
-            length = int(item['size']) * 2
-            # For F120 with a length of 14 the resulting regex should be
-            # r'F120(.{14})' in the raw string below. The first replacement is
-            # trivial, but the second one requires some explanation. Python
-            # `format` will consume any curly braces pairs, but we want to have
-            # {14} in the resulting string there is a way around that. By
-            # doubling the curly braces `format` will then not do any variable
-            # replacement and will add a single curly brace in the output
-            # instead which is what we want.
-            # see:
-            # https://docs.python.org/3/library/string.html#format-string-syntax
-            # for more details
-            self.__did_regex[did] = r'{}(.{{{}}})'.format(did, length)
+        self.__did_index = get_conf().rig.sddb_did_index(self.incoming_mode, DidIndex)
+        self.all_defined_dids = self.__did_index.dids
 
         service_types = {
             "50": "DiagnosticSessionControl",
@@ -183,9 +200,8 @@ class UdsResponse:
         self.add_response_items(did, item)
 
         # execute did specific handler if it's defined
-        for did_method in dir(self):
-            if did_method.endswith(self.data["did"].lower()):
-                getattr(self, did_method)()
+        for did_method in self.__did_index.handlers.get(did, []):
+            getattr(self, did_method)()
 
     def __process_dtc_report(self):
         report_type = self.data["body"][0:2]
@@ -353,8 +369,8 @@ class UdsResponse:
         Args:
             content (content): Content to search through
         """
-        for did, regex in self.__did_regex.items():
-            match = re.search(regex, content)
+        for did, regex in self.__did_index.regex.items():
+            match = regex.search(content)
             if match:
                 item = match.groups()[0]
                 info = self.all_defined_dids[did]
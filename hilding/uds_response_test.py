@@ -156,3 +156,13 @@ def test_diagnostic_session_control():
     assert UdsResponse("065003001901F400").details['mode'] == 3
     assert UdsResponse("065003001901F400").details[
         'session_parameter_record'] == "001901F400"
+
+def test_did_index(mock_get_conf):
+    """ pytest: did index is built once per incoming mode and rig """
+    rig = mock_get_conf().rig
+    did_index = rig.sddb_did_index(1, uds_response.DidIndex)
+    assert rig.sddb_did_index(1, uds_response.DidIndex) is did_index
+    assert "F186" in did_index.dids and "F12C" not in did_index.dids
+    assert did_index.handlers["F186"] == ["_UdsResponse__active_diag_session_f186"]
+    assert did_index.regex["F186"].search("62F18601").groups()[0] == "01"
+    assert "F12C" in rig.sddb_did_index(2, uds_response.DidIndex).dids
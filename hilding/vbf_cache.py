@@ -0,0 +1,61 @@
+"""
+Cache of preprocessed VBF files
+
+Every software download parses the VBF header, scans the data section for
+blocks and decompresses each block to compare its CRC with the checksum in
+the file. The result of that work is stored pickled in the rig build
+directory together with a key identifying the VBF file content (see file_cache), so a
+repeated download of the same file can go straight to the transfer.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+from hilding import file_cache
+
+# increase when the content or format of the cache changes
+VBF_CACHE_VERSION = 2
+
+
+def vbf_file_hash(vbf_file):
+    """ sha256 of the vbf file """
+    return file_cache.file_hash(vbf_file)
+
+
+def cache_file(cache_path, vbf_file):
+    """ file in cache_path used for vbf_file """
+    return cache_path.joinpath(f"{vbf_file.name}.pickle")
+
+
+def write_cache(cache_path, vbf_file, data, vbf_hash=None):
+    """
+    Store data preprocessed from vbf_file in cache_path
+
+    Returns the sha256 of the vbf file so it can be reused for the next write
+    of the same file
+    """
+    key = file_cache.cache_key(VBF_CACHE_VERSION, {"vbf": vbf_file}, hashes={"vbf": vbf_hash})
+    file_cache.write_cache(cache_file(cache_path, vbf_file), key, data)
+    return key["vbf"]["sha256"]
+
+
+def read_cache(cache_path, vbf_file):
+    """
+    Get data preprocessed from vbf_file, None if there is no valid cache
+    """
+    return file_cache.read_cache(cache_file(cache_path, vbf_file), VBF_CACHE_VERSION,
+                                 {"vbf": vbf_file})
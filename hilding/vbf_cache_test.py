@@ -0,0 +1,38 @@
+"""
+pytest for hilding/vbf_cache.py
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+from hilding.vbf_cache import read_cache, write_cache, vbf_file_hash
+
+
+def test_vbf_cache(tmp_path):
+    """ pytest: cache is only used while the vbf file content is unchanged """
+    vbf_file = tmp_path.joinpath("sbl.vbf")
+    vbf_file.write_bytes(b"vbf_version = 2.6; header {sw_part_type = SBL;}\x00\x01")
+    data = {"vbf_version": "2.6", "header": {"sw_part_type": "SBL"}, "data_start": 47}
+
+    assert read_cache(tmp_path, vbf_file) is None
+    assert write_cache(tmp_path, vbf_file, data) == vbf_file_hash(vbf_file)
+    assert read_cache(tmp_path, vbf_file) == data
+    assert tmp_path.joinpath("sbl.vbf.pickle").exists()
+
+    # new content of the same size
+    vbf_file.write_bytes(b"vbf_version = 2.6; header {sw_part_type = SBL;}\x00\x02")
+    assert read_cache(tmp_path, vbf_file) is None
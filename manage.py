@@ -167,6 +167,10 @@ if __name__ == "__main__":
     nightly_parser.add_argument('testfile_list', help="file with each test listed")
     nightly_parser.add_argument('--use-db', action="store_true")
     nightly_parser.add_argument('--use-mq', action="store_true")
+    nightly_parser.add_argument(
+        '--rigs', nargs='+',
+        help="run the tests in parallel on these rigs, one process per rig. "
+             "Analytics of a test case are sent when it is done")
 
     did_report_parser = subparsers.add_parser(
         "did_report", help="Generate a DID report by testing all dids "
@@ -0,0 +1,114 @@
+"""
+Throughput of the LZSS encoder used for compressed (data format 0x10) VBF blocks
+
+    python misc/lzss_benchmark.py [--size BYTES] [FILE]
+
+Encodes FILE (or a generated image resembling application code) with the
+hash chain encoder, checks that decode_barray gives back the input and
+compares the speed with the brute force window search of CircularBuffer,
+which the earlier encoder used for every input byte.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+import sys
+import random
+import time
+from argparse import ArgumentParser
+from os.path import dirname, join
+
+sys.path.append(join(dirname(__file__), '..'))
+
+# pylint: disable=wrong-import-position
+from supportfunctions.support_lzss import LzssEncoder
+from supportfunctions.lzss_helpers import CircularBuffer
+
+
+def random_bytes(rnd, size):
+    """ size bytes from rnd, random.Random.randbytes needs python 3.9 """
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def generate_image(size):
+    """ data with the mix of repeated instructions, tables and padding of an application """
+    rnd = random.Random(0)
+    instructions = [random_bytes(rnd, 4) for _ in range(400)]
+    image = bytearray()
+    while len(image) < size:
+        part = rnd.random()
+        if part < 0.8:
+            image += b''.join(rnd.choice(instructions) for _ in range(rnd.randrange(4, 64)))
+        elif part < 0.95:
+            image += random_bytes(rnd, rnd.randrange(16, 256))
+        else:
+            image += b'\xff' * rnd.randrange(16, 512)
+    return bytes(image[:size])
+
+
+def brute_force_rate(data, sample_size=2000):
+    """ bytes/s of CircularBuffer.get_longest_match for each byte of data """
+    lzss = LzssEncoder
+    dictionary = CircularBuffer(lzss.LZSS_WINDOW_SIZE)
+    sample = data[:sample_size]
+    start = time.perf_counter()
+    for pos, byte in enumerate(sample):
+        buffer = CircularBuffer(lzss.MAX_MATCH_SIZE)
+        for look_ahead in sample[pos:pos + lzss.MAX_MATCH_SIZE]:
+            buffer.put_byte(look_ahead)
+        dictionary.get_longest_match(lzss.MAX_MATCH_SIZE, buffer)
+        dictionary.put_byte(byte)
+    return len(sample) / (time.perf_counter() - start)
+
+
+def main():
+    """ run the benchmark """
+    parser = ArgumentParser(description="LZSS encoder benchmark")
+    parser.add_argument("file", nargs="?", help="file to encode, default generated image")
+    parser.add_argument("--size", type=int, default=1 << 20,
+                        help="size of generated image (default 1 MiB)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as file:
+            data = file.read()
+    else:
+        data = generate_image(args.size)
+
+    lzss = LzssEncoder()
+    start = time.perf_counter()
+    encoded = lzss.encode_barray(data)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = lzss.decode_barray(encoded)
+    decode_time = time.perf_counter() - start
+    if decoded != data:
+        sys.exit("decode_barray doesn't give back the encoded data")
+
+    encode_rate = len(data) / encode_time
+    brute_force = brute_force_rate(data)
+    print(f"input:        {len(data)} bytes")
+    print(f"encoded:      {len(encoded)} bytes ({100 * len(encoded) / len(data):.1f} %)")
+    print(f"encode:       {encode_time:.2f} s, {encode_rate / 1024:.0f} kB/s")
+    print(f"decode:       {decode_time:.2f} s, {len(data) / decode_time / 1024:.0f} kB/s")
+    print(f"brute force:  {brute_force / 1024:.1f} kB/s, "
+          f"{len(data) / brute_force:.0f} s for the input "
+          f"({encode_rate / brute_force:.0f} times slower)")
+
+
+if __name__ == "__main__":
+    main()
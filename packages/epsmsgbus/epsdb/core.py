@@ -24,9 +24,12 @@ Any unauthorized copying or distribution of content from this file is prohibited
 Read JSON messages in Cynosure 2.0 format and insert data in database.
 """
 
+import atexit
 import dateutil.parser
 import logging
 import re
+import threading
+import time
 
 import epsconfig
 
@@ -49,12 +52,19 @@ class DatabaseConfiguration(object):
     enabled = False
     dbtype = 'NULL'
     connstr = []
+    # Reuse connections instead of connecting for each statement
+    pool = True
+    # Collect test step results and store them per test case
+    write_behind = False
 
     def __init__(self, name=DEFAULT_CONFIG_NAME):
         c = epsconfig.config(name)
         if c:
             self.enabled = c.database.enabled or False
             self.dbtype = c.database.type
+            if c.database.pool is not None:
+                self.pool = bool(c.database.pool)
+            self.write_behind = c.database.write_behind or False
             self.connstr = []
             for opt in c.database:
                 if opt.name.startswith('connstr'):
@@ -88,6 +98,9 @@ class NullDatabase(object):
     def execute(self, *a, **k):
         log.debug("Database disabled (NullDatabase).")
 
+    def executemany(self, *a, **k):
+        log.debug("Database disabled (NullDatabase).")
+
     def commit(self, *a, **k):
         pass
 
@@ -98,14 +111,75 @@ class NullDatabase(object):
         pass
 
 
+class ConnectionPool(object):
+    """Idle connections kept for reuse. Connections are only reused in the
+    thread that created them since SQLite connections can't be shared between
+    threads."""
+    max_idle = 2
+    max_idle_time = 60.0
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def idle(self, key):
+        """Return list of (connection, time released) for 'key' in this thread."""
+        if not hasattr(self.local, 'idle'):
+            self.local.idle = {}
+        return self.local.idle.setdefault(key, [])
+
+    def get(self, key):
+        """Return idle connection for 'key' or None if there is none. Connections
+        idle for too long are closed, the server may have dropped them."""
+        idle = self.idle(key)
+        now = time.monotonic()
+        while idle:
+            connection, released = idle.pop()
+            if now - released < self.max_idle_time:
+                return connection
+            self.discard(connection)
+        return None
+
+    def put(self, key, connection):
+        """Keep connection for reuse."""
+        idle = self.idle(key)
+        if len(idle) < self.max_idle:
+            idle.append((connection, time.monotonic()))
+        else:
+            self.discard(connection)
+
+    def clear(self):
+        """Close all idle connections of this thread."""
+        for idle in getattr(self.local, 'idle', {}).values():
+            while idle:
+                self.discard(idle.pop()[0])
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            log.debug("TRACE", exc_info=True)
+
+
+try:
+    CONNECTION_POOL
+except NameError:
+    CONNECTION_POOL = ConnectionPool()
+
+# Number of times a connection failed and NullDatabase was used instead
+CONNECTION_FAILURES = 0
+
+
 class ConnectionFactory(object):
-    def __init__(self, enabled, dbtype, *connstr):
+    def __init__(self, enabled, dbtype, *connstr, pool=False):
         """Dispatch to the configured database type. If 'pyodbc' is not
-        configured, then fake the database.
+        configured, then fake the database. With 'pool' connections are
+        reused, see release().
         IMPORTANT: Run init() the first time an SQLite database is used to
         create all necessary database objects!"""
         log.debug(self.hide_password("ConnectionFactory(%s, '%s', %s)" % (enabled, dbtype, connstr)))
         self.connstr = connstr
+        self.pool = pool
+        self.key = (str(dbtype).upper(), connstr)
         if not enabled:
             self.dbmod = NullDatabase()
         elif dbtype.upper() == 'MSSQL':
@@ -129,15 +203,47 @@ class ConnectionFactory(object):
 
     def connection(self):
         """Return database connection object (DBI)."""
+        while self.pool and not isinstance(self.dbmod, NullDatabase):
+            connection = CONNECTION_POOL.get(self.key)
+            if connection is None:
+                break
+            if self.usable(connection):
+                return connection
+            CONNECTION_POOL.discard(connection)
         try:
             return self.dbmod.connect(*self.connstr)
         except Exception as e:
+            global CONNECTION_FAILURES
+            CONNECTION_FAILURES += 1
             log.error(e)
             log.debug("TRACE", exc_info=True)
             log.warning("Cannot connect to database, database operations will be disabled.")
             self.dbmod = NullDatabase()
             return NullDatabase()
 
+    def usable(self, connection):
+        """Check that a pooled connection still works, the server may have
+        dropped it while it was idle."""
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            log.info("Pooled database connection not usable [%s], reconnecting.", e)
+            log.debug("TRACE", exc_info=True)
+            return False
+
+    def release(self, connection):
+        """Connection is not used anymore, keep it for reuse if pooled."""
+        if self.pool and not isinstance(connection, NullDatabase):
+            CONNECTION_POOL.put(self.key, connection)
+        else:
+            connection.close()
+
 
 class DatabaseContext(object):
     """Context where a database connection is set up."""
@@ -145,6 +251,7 @@ class DatabaseContext(object):
         """Connect to database and create cursor."""
         if factory is None:
             factory = connection_factory()
+        self.factory = factory
         self.connection = factory.connection()
         self.cursor = self.connection.cursor()
 
@@ -153,19 +260,28 @@ class DatabaseContext(object):
 
     def __exit__(self, t, v, tb):
         """Commit unless there was an error in which case we roll back. Close
-        connection and cursor."""
-        if t is None and v is None and tb is None:
-            self.connection.commit()
-        else:
-            self.connection.rollback()
-        self.close()
+        cursor, the connection is only reused after a successful commit."""
+        reuse = False
+        try:
+            if t is None and v is None and tb is None:
+                self.connection.commit()
+                reuse = True
+            else:
+                self.connection.rollback()
+        finally:
+            self.close(reuse)
 
-    def close(self):
-        """Close cursor and connection."""
+    def close(self, reuse=False):
+        """Close cursor and connection (or give it back to the pool)."""
         if hasattr(self, 'cursor') and self.cursor:
             self.cursor.close()
+            self.cursor = None
         if hasattr(self, 'connection') and self.connection:
-            self.connection.close()
+            if reuse:
+                self.factory.release(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
 
     def sql(self, statement, args=None):
         """Run SQL statement with arguments."""
@@ -176,6 +292,14 @@ class DatabaseContext(object):
             log.debug("SQL: %s <-> %s" % (statement, args))
             return self.cursor.execute(statement, args)
 
+    def sqlmany(self, statement, rows):
+        """Run SQL statement once for each row of arguments."""
+        rows = list(rows)
+        log.debug("SQL: %s <-> %d rows" % (statement, len(rows)))
+        if rows:
+            # pyodbc doesn't accept an empty sequence
+            self.cursor.executemany(statement, rows)
+
 
 
 # Data mappings from JSON to database columns ============================{{{1
@@ -504,11 +628,18 @@ class DataMapper(object):
 
     def add_attribute(self, db, uuid, attribute, value):
         """Add attribute to runtime_data - to connect part numbers that have been read."""
-        if value:
-            db.sql("INSERT INTO runtime_data (testsuite_result, attribute, value) VALUES (?, ?, ?)",
-                    (uuid, attribute, value))
-        else:
-            log.debug("The attribute '%s' had no value, not added to 'runtime_data'." % attribute)
+        self.add_attributes(db, uuid, [(attribute, value)])
+
+    def add_attributes(self, db, uuid, attributes):
+        """Add list of (attribute, value) to runtime_data in one batch."""
+        rows = []
+        for attribute, value in attributes:
+            if value:
+                rows.append((uuid, attribute, value))
+            else:
+                log.debug("The attribute '%s' had no value, not added to 'runtime_data'." % attribute)
+        db.sqlmany("INSERT INTO runtime_data (testsuite_result, attribute, value) VALUES (?, ?, ?)",
+                rows)
 
 
 class TestsuiteResultInsert(DataMapper):
@@ -546,48 +677,50 @@ class TestsuiteResultInsert(DataMapper):
         devchgnum = self.mapping.devchgnum(msg)
         vehicle_series = self.mapping.vehicle_series(msg)
         relver = self.mapping.relver(msg)
-        with DatabaseContext() as db:
-            # Store in 'runtime_data'
-            self.add_attribute(db, uuid, 'git_hash', self.mapping.git_hash(msg))
-            self.add_attribute(db, uuid, 'jenkins_jobid', self.mapping.jenkins_jobid(msg))
-            self.add_attribute(db, uuid, 'can_db', self.mapping.model_can_db(msg))
-            self.add_attribute(db, uuid, 'model_ecu', self.mapping.model_ecu(msg))
-            self.add_attribute(db, uuid, 'hil_model_id', self.mapping.model_id(msg))
-            self.add_attribute(db, uuid, 'model_project', self.mapping.model_project(msg))
-            self.add_attribute(db, uuid, 'system_name', self.mapping.system_name(msg))
-            self.add_attribute(db, uuid, 'system_ecu', self.mapping.ecu_raw(msg))
-            self.add_attribute(db, uuid, 'system_platform', self.mapping.vehicle_platform_raw(msg))
-            self.add_attribute(db, uuid, 'system_AD_project', self.mapping.ad_project(msg))
-            self.add_attribute(db, uuid, 'system_series', vehicle_series)
-            self.add_attribute(db, uuid, 'system_vehicle_project', self.mapping.vehicle_project_raw(msg))
-            self.add_attribute(db, uuid, 'system_release_version', relver)
-            self.add_attribute(db, uuid, 'release_baseline', changeset)
-
-            # If self.mapping.version_framework(msg) is 'NoneType' we get an exception when we execute 'get'.
-            # That is why we have this extra check
-            version_framework = self.mapping.version_framework(msg)
-            if isinstance(version_framework, dict):
-                self.add_attribute(db, uuid, 'epc_framework_repo',  version_framework.get('revision'))
-            else:
-                self.add_attribute(db, uuid, 'epc_framework_repo', '')
+        # Store in 'runtime_data'
+        attributes = [
+            ('git_hash', self.mapping.git_hash(msg)),
+            ('jenkins_jobid', self.mapping.jenkins_jobid(msg)),
+            ('can_db', self.mapping.model_can_db(msg)),
+            ('model_ecu', self.mapping.model_ecu(msg)),
+            ('hil_model_id', self.mapping.model_id(msg)),
+            ('model_project', self.mapping.model_project(msg)),
+            ('system_name', self.mapping.system_name(msg)),
+            ('system_ecu', self.mapping.ecu_raw(msg)),
+            ('system_platform', self.mapping.vehicle_platform_raw(msg)),
+            ('system_AD_project', self.mapping.ad_project(msg)),
+            ('system_series', vehicle_series),
+            ('system_vehicle_project', self.mapping.vehicle_project_raw(msg)),
+            ('system_release_version', relver),
+            ('release_baseline', changeset)]
+
+        # If self.mapping.version_framework(msg) is 'NoneType' we get an exception when we execute 'get'.
+        # That is why we have this extra check
+        version_framework = self.mapping.version_framework(msg)
+        if isinstance(version_framework, dict):
+            attributes.append(('epc_framework_repo',  version_framework.get('revision')))
+        else:
+            attributes.append(('epc_framework_repo', ''))
 
-            # If self.mapping.version_framework(msg) is 'NonType' we get an exception when we execute 'get'.
-            # That is why we have this extra check
-            version_test = self.mapping.version_test(msg)
-            if isinstance(version_test, dict):
-                self.add_attribute(db, uuid, 'epc_test_repo', version_test.get('revision'))
-            else:
-                self.add_attribute(db, uuid, 'epc_test_repo', '')
+        # If self.mapping.version_framework(msg) is 'NonType' we get an exception when we execute 'get'.
+        # That is why we have this extra check
+        version_test = self.mapping.version_test(msg)
+        if isinstance(version_test, dict):
+            attributes.append(('epc_test_repo', version_test.get('revision')))
+        else:
+            attributes.append(('epc_test_repo', ''))
 
-            self.add_attribute(db, uuid, 'automation_desk_version', self.mapping.automation_desk_version(msg))
-            package_urls = self.mapping.package_url(msg)
-            if isinstance(package_urls, list):
-                for i, package_url in enumerate(package_urls, start=1):
-                    self.add_attribute(db, uuid, 'package_url_'+str(i), package_url)
-            else:
-                self.add_attribute(db, uuid, 'package_url_1', self.mapping.package_url(msg))
-            for i, test_equipment in enumerate(self.mapping.test_equipment(msg), start=1):
-                self.add_attribute(db, uuid, 'test_equipment_'+str(i), test_equipment)
+        attributes.append(('automation_desk_version', self.mapping.automation_desk_version(msg)))
+        package_urls = self.mapping.package_url(msg)
+        if isinstance(package_urls, list):
+            for i, package_url in enumerate(package_urls, start=1):
+                attributes.append(('package_url_'+str(i), package_url))
+        else:
+            attributes.append(('package_url_1', self.mapping.package_url(msg)))
+        for i, test_equipment in enumerate(self.mapping.test_equipment(msg), start=1):
+            attributes.append(('test_equipment_'+str(i), test_equipment))
+        with DatabaseContext() as db:
+            self.add_attributes(db, uuid, attributes)
         if devchgnum:
             with DatabaseContext() as db:
                 # Create baseline if not exists, save in own transaction
@@ -638,26 +771,30 @@ class TestsuiteResultUpdate(DataMapper):
             changeset = self.mapping.changeset(msg)
             ecu = self.mapping.ecu(msg)
             with DatabaseContext() as db:
+                attributes = []
                 pnix = 0
                 for pn in partnums:
                     pnix += 1
-                    self.add_attribute(db, uuid, 'sw_partnumber_%02d' % pnix, pn)
+                    attributes.append(('sw_partnumber_%02d' % pnix, pn))
                     self.add_product(db, ecu, pn)
                     if changeset and isinstance(changeset, int):
                         self.add_product_baseline(db, changeset, pn)
+                self.add_attributes(db, uuid, attributes)
         with DatabaseContext() as db:
             self.add_attribute(db, uuid, 'sw_tag', self.mapping.sw_tag(msg))
         if hwpartnums:
             changeset = self.mapping.changeset(msg)
             ecu = self.mapping.ecu(msg)
             with DatabaseContext() as db:
+                attributes = []
                 pnix = 0
                 for pn in hwpartnums:
                     pnix += 1
-                    self.add_attribute(db, uuid, 'hw_partnumber_%02d' % pnix, pn)
+                    attributes.append(('hw_partnumber_%02d' % pnix, pn))
                     self.add_product(db, ecu, pn)
                     if changeset and isinstance(changeset, int):
                         self.add_product_baseline(db, changeset, pn)
+                self.add_attributes(db, uuid, attributes)
 
     def add_product(self, db, ecu, partnumber):
         """Add software part numbers, create product if not exists."""
@@ -790,6 +927,56 @@ class TeststepResult(DataMapper):
             self.mapping.verdict(msg),
             'finished')
 
+    def store(self, msg, on_stored=None):
+        """With write-behind the result is stored with the others of the
+        test case, see WriteBehind. Return False if not stored yet."""
+        if CONFIG.write_behind:
+            WRITE_BEHIND.add(self.command, self.values(msg), on_stored)
+            return False
+        super(TeststepResult, self).store(msg)
+        return True
+
+
+# Write-behind of results ================================================{{{1
+class WriteBehind(object):
+    """Rows collected to be inserted later, each statement with executemany
+    in one transaction. Rows referring to other records must be flushed
+    before these records are changed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = OrderedDict()
+        self.on_stored = []
+
+    def add(self, command, values, on_stored=None):
+        """Add row of values for SQL command. 'on_stored' is called when the
+        row has been stored."""
+        with self.lock:
+            self.rows.setdefault(command, []).append(values)
+            if on_stored is not None:
+                self.on_stored.append(on_stored)
+
+    def flush(self):
+        """Store all rows collected."""
+        with self.lock:
+            rows, self.rows = self.rows, OrderedDict()
+            on_stored, self.on_stored = self.on_stored, []
+        if rows:
+            failures = CONNECTION_FAILURES
+            with DatabaseContext() as db:
+                for command, values in rows.items():
+                    db.sqlmany(command, values)
+            if CONNECTION_FAILURES == failures:
+                for callback in on_stored:
+                    callback()
+
+
+try:
+    WRITE_BEHIND
+except NameError:
+    WRITE_BEHIND = WriteBehind()
+    atexit.register(lambda: WRITE_BEHIND.flush())
+
 
 # Administrative tasks ==================================================={{{1
 class Admin(object):
@@ -1293,7 +1480,7 @@ def init():
 
 def connection_factory():
     """Return connection factory as configured in 'configuration' object."""
-    return ConnectionFactory(CONFIG.enabled, CONFIG.dbtype, *CONFIG.connstr)
+    return ConnectionFactory(CONFIG.enabled, CONFIG.dbtype, *CONFIG.connstr, pool=CONFIG.pool)
 
 
 def modify_name(name):
@@ -1308,17 +1495,29 @@ def reset_teststep_cache():
     TESTSTEP_NAME_GENERATOR.clear()
 
 
-def set_config(enabled=None, dbtype=None, connstr=None):
+def flush():
+    """Store the results collected with write-behind."""
+    WRITE_BEHIND.flush()
+
+
+def set_config(enabled=None, dbtype=None, connstr=None, pool=None, write_behind=None):
     if enabled is not None:
         CONFIG.enabled = bool(enabled)
     if dbtype is not None:
         CONFIG.dbtype = dbtype
     if connstr is not None:
         CONFIG.connstr = connstr
+    if pool is not None:
+        CONFIG.pool = bool(pool)
+        if not CONFIG.pool:
+            CONNECTION_POOL.clear()
+    if write_behind is not None:
+        CONFIG.write_behind = bool(write_behind)
 
 
-def store_data(data,share_activity):
-    """Store data (a mapping)."""
+def store_data(data, share_activity, on_stored=None):
+    """Store data (a mapping). Return False if the data is stored later with
+    write-behind, then 'on_stored' is called when it has been stored."""
     if 'type' in data and data['type'] == 'baseline':
         # DO NOTHING right now, baseline messages don't contain anything interesting
         pass
@@ -1327,8 +1526,10 @@ def store_data(data,share_activity):
         if 'parentTaskId' in data:
             # *** TEST STEP ***
             # The message was a create message for a test step (task with parent task)
-            TeststepResult(TeststepResultMapping()).store(data)
+            return TeststepResult(TeststepResultMapping()).store(data, on_stored)
         else:
+            # Test steps collected with write-behind are stored before the test case changes
+            flush()
             tcase_map = TestcaseResultMapping()
             # *** TEST CASE ***
             if 'verdict' in data:
@@ -1340,12 +1541,14 @@ def store_data(data,share_activity):
     elif 'activityId' in data:
         # *** TEST SUITE ***
         # Activity = test suite
+        flush()
         tsuite_map = TestsuiteResultMapping()
         if 'verdict' in data:
             # The message was an update message for a test suite (activity)
             TestsuiteResultUpdate(tsuite_map).store(data)
         elif ('productId' or 'productIds') in data or share_activity:
             TestsuiteResultInsert(tsuite_map).store(data)
+    return True
 
 # modeline ==============================================================={{{1
 # vim: set fdm=marker:
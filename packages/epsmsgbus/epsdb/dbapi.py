@@ -31,25 +31,32 @@ import logging
 from . import core
 
 # Only give access to these functions and classes.
-__all__ = ['store_message', 'admin', 'DatabaseContext']
+__all__ = ['store_message', 'flush', 'admin', 'DatabaseContext']
 
 
 log = logging.getLogger('epsdb')
 
 
 admin = core.admin
+flush = core.flush
 DatabaseContext = core.DatabaseContext
 
 
-def store_message(message, share_activity):
-    """Store data [in JSON or a mapping (dict)]."""
+def store_message(message, share_activity, on_stored=None):
+    """Store data [in JSON or a mapping (dict)]. 'on_stored' is called when
+    the data has been stored, with write-behind that may be later."""
     if core.CONFIG.enabled:
+        failures = core.CONNECTION_FAILURES
         try:
             data = json.loads(message) if isinstance(message, str) else message
-            core.store_data(data, share_activity)
+            stored = core.store_data(data, share_activity, on_stored)
         except Exception as e:
             log.error("Problem saving to database [%s]." % e)
             log.error("TRACE", exc_info=True)
+            return
+        # NullDatabase was used if the connection failed
+        if stored and on_stored is not None and core.CONNECTION_FAILURES == failures:
+            on_stored()
     else:
         log.debug("Saving to database is disabled.")
 
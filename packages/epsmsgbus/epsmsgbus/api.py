@@ -57,7 +57,7 @@ from epsmsgbus.data import TestCaseDataAdapter
 from epsmsgbus.data import TestStepDataAdapter
 import epsmsgbus.activityid as activity_mod
 
-from epsmsgbus.cynosure import messagehandler
+from epsmsgbus.cynosure import messagehandler, flush_messages
 
 
 cynosure_msg = None
@@ -104,51 +104,58 @@ def testsuite_ended(verdict=None):
     assert verdict in Verdict.values.values() or verdict is None, 'Invalid verdict, must be one of: %s' % Verdict.values.values()
     ts = core.testsuite()
     ts.finish(verdict)
+    # Results are complete in Cynosure when the test suite has ended
+    flush_messages()
 
 
-def testcase_started(adapter, name, identifier=None):
+def testcase_started(adapter, name, identifier=None, starttime=None):
     """Call when a test case is started.
 
     'name' is the name of the test case (as it will be used in reports).
     'adapter' is an adapter for retrieving metadata.
+    'starttime' (UTC datetime) is only given when the test case was run
+    elsewhere, e.g. in another process, and is reported afterwards.
     """
     tc = core.testsuite().testcase(name=name, identifier=identifier)
     tc.register(data.TestCaseDataObserver(adapter))
     tc.register(cynosure_msg.TestCaseMessageObserver(messagehandler()))
-    tc.start()
+    tc.start(starttime)
 
 
-def testcase_ended(verdict):
+def testcase_ended(verdict, endtime=None):
     """Call when a test case is finished.
 
     'verdict' is one of:
       ('unknown', 'passed', 'skipped', 'failed', 'errored', 'skipped', 'aborted')
+    'endtime' (UTC datetime), see testcase_started().
     """
     assert verdict in Verdict.values.values(), 'Invalid verdict, must be one of: %s' % Verdict.values.values()
     tc = core.testsuite().testcase()
-    tc.finish(verdict)
+    tc.finish(verdict, endtime)
 
 
-def teststep_started(adapter, name, identifier=None):
+def teststep_started(adapter, name, identifier=None, starttime=None):
     """Call when a test step is started.
 
     'name' is the name of the test step (as it will be used in reports).
     'adapter' is an adapter for retrieving metadata.
+    'starttime' (UTC datetime), see testcase_started().
     """
     ts = core.testsuite().testcase().teststep(name=name, identifier=identifier)
     ts.register(data.TestStepDataObserver(adapter))
     ts.register(cynosure_msg.TestStepMessageObserver(messagehandler()))
-    ts.start()
+    ts.start(starttime)
 
 
-def teststep_ended(verdict):
+def teststep_ended(verdict, endtime=None):
     """Call when a test step is finished.
 
     'verdict' is one of:
       ('unknown', 'passed', 'skipped', 'failed', 'errored', 'skipped', 'aborted')
+    'endtime' (UTC datetime), see testcase_started().
     """
     assert verdict in Verdict.values.values(), 'Invalid verdict, must be one of: %s' % Verdict.values.values()
-    core.testsuite().testcase().teststep().finish(verdict)
+    core.testsuite().testcase().teststep().finish(verdict, endtime)
 
 
 # eof
@@ -680,6 +680,7 @@ def testsuite_ended():
         core.testsuite().abort()
     else:
         core.testsuite().finish()
+    cynosure.flush_messages()
 
 
 # Test case --------------------------------------------------------------{{{2
@@ -268,12 +268,12 @@ class TestCase(Observable):
         self.teststeps = []
         self.metadata = Container()
 
-    def abort_unfinished(self):
+    def abort_unfinished(self, endtime=None):
         """Run abort() for all test steps that are not finished within the test
         case."""
         for teststep in self.teststeps:
             if teststep.state.name != 'finished':
-                teststep.abort()
+                teststep.abort(endtime)
 
     def abort(self):
         """Abort unfihisned test steps and set state/verdict to
@@ -286,19 +286,20 @@ class TestCase(Observable):
         self.parent.update_verdict('aborted')
         self.notify_abort()
 
-    def start(self):
-        """Start the test case and set start tiee and state. Notify observers"""
-        self.starttime = datetime.datetime.utcnow()
+    def start(self, starttime=None):
+        """Start the test case and set start tiee and state. Notify observers.
+        'starttime' is only given for test cases that were run elsewhere."""
+        self.starttime = starttime or datetime.datetime.utcnow()
         self.state = Status('ongoing')
         self.notify_start()
 
-    def finish(self, verdict):
+    def finish(self, verdict, endtime=None):
         """Finish the test case and set start tiee and state. Notify observers.
         Any unfinished test steps will be set as 'aborted'."""
         # Let the test suite object get the verdict.
         self.parent.update_verdict(verdict)
-        self.abort_unfinished()
-        self.endtime = datetime.datetime.utcnow()
+        self.endtime = endtime or datetime.datetime.utcnow()
+        self.abort_unfinished(self.endtime)
         self.state = Status('finished')
         self.verdict = Verdict(verdict)
         self.notify_finish(self.verdict)
@@ -325,22 +326,22 @@ class TestStep(Observable):
         self.logs = []
         self.metadata = Container()
 
-    def abort(self):
+    def abort(self, endtime=None):
         """Abort and notify observers."""
-        self.endtime = datetime.datetime.utcnow()
+        self.endtime = endtime or datetime.datetime.utcnow()
         self.state = Status('disabled')
         self.verdict = Verdict('aborted')
         self.notify_abort()
 
-    def start(self):
+    def start(self, starttime=None):
         """Start and notify observers."""
-        self.starttime = datetime.datetime.utcnow()
+        self.starttime = starttime or datetime.datetime.utcnow()
         self.state = Status('ongoing')
         self.notify_start()
 
-    def finish(self, verdict):
+    def finish(self, verdict, endtime=None):
         """Finish and notify observers."""
-        self.endtime = datetime.datetime.utcnow()
+        self.endtime = endtime or datetime.datetime.utcnow()
         self.state = Status('finished')
         self.verdict = Verdict(verdict)
         self.notify_finish(self.verdict)
@@ -25,16 +25,21 @@ Any unauthorized copying or distribution of content from this file is prohibited
 Common definitions and functions for Cynosure 2 and Cynosure 3
 """
 
+import atexit
 import datetime
 import http.client
 import json
 import logging
 import pprint
 import pytz
+import queue
+import threading
 import time
 
 from collections import deque
 
+from epsmsgbus.spool import MessageSpool, spool_file
+
 
 # Globals ================================================================{{{1
 log = logging.getLogger('epsmsgbus.cynosure')
@@ -42,6 +47,10 @@ log = logging.getLogger('epsmsgbus.cynosure')
 DEFAULT_CONFIG = 'db'
 DEFAULT_USE_MQ = True
 DEFAULT_USE_DB = True
+# Post messages from a background thread instead of waiting for Cynosure
+DEFAULT_ASYNC_POST = True
+# Seconds to wait for messages to be sent at the end of a test suite
+FLUSH_TIMEOUT = 60.0
 
 
 # Base classes for messages =============================================={{{1
@@ -80,10 +89,11 @@ class CynosureMessage(dict):
                 # Not possible to persist
                 return False
 
-    def post(self):
-        """Push the message to cynosure."""
+    def post(self, on_sent=None):
+        """Push the message to cynosure. 'on_sent' is called when the message
+        has been delivered."""
         # Use the class name as the message name
-        post_message(self.server, self.version, self.__class__.__name__, self)
+        post_message(self.server, self.version, self.__class__.__name__, self, on_sent)
 
     def set_custom(self, **data):
         """Update/add custom fields."""
@@ -113,9 +123,11 @@ def qualify_verdict(description, code=None, vtype=None, url=None, data=None):
     
 # Post messages on queue (and call database API) ========================={{{1
 class MessageHandler(object):
-    def __init__(self, use_mq=False, use_db=False):
+    def __init__(self, use_mq=False, use_db=False, spool=None):
         self.use_mq = use_mq
         self.use_db = use_db
+        # MessageSpool each message is written to before it's sent
+        self.spool = spool
         self.internal_queue = deque()
 
     def handle(self, msg, share_activity=None):
@@ -134,19 +146,32 @@ class MessageHandler(object):
         log.debug('Queueing {} message for later processing [{} messages].'.format(msg.__class__.__name__, len(self.internal_queue)))
 
     def _handle(self, msg, share_activity):
+        seq = self.spool_message(msg, share_activity)
         if self.use_mq:
-            msg.post()
+            msg.post(None if seq is None else lambda: self.spool.ack(seq, 'mq'))
         else:
             log.debug("Not pushing any messages, not enabled.")
         if self.use_db:
             try:
                 import epsdb
-                epsdb.store_message(msg, share_activity)
+                epsdb.store_message(msg, share_activity, None if seq is None else lambda: self.spool.ack(seq, 'db'))
             except Exception as e:
                 log.info("Failed saving to database.")
                 log.info(e)
                 log.debug("TRACE", exc_info=True)
 
+    def spool_message(self, msg, share_activity):
+        """Write message to spool, return sequence number or None if not spooled."""
+        targets = [t for t, use in (('mq', self.use_mq), ('db', self.use_db)) if use]
+        if self.spool is None or not targets:
+            return None
+        try:
+            return self.spool.append(msg, targets, share_activity)
+        except Exception as e:
+            log.warning("Could not write message to spool '%s' [%s].", self.spool.path, e)
+            log.debug("TRACE", exc_info=True)
+            return None
+
 
 try:
     MESSAGE_HANDLER
@@ -154,31 +179,151 @@ except NameError:
     MESSAGE_HANDLER = MessageHandler(use_mq=DEFAULT_USE_MQ, use_db=DEFAULT_USE_DB)
 
 
-def messagehandler(use_db=None, use_mq=None):
+def messagehandler(use_db=None, use_mq=None, spool_dir=None):
+    """Configure message handler. With 'spool_dir' all messages are written to
+    a spool file in that directory first, see epsmsgbus.spool."""
     if use_db is not None:
         MESSAGE_HANDLER.use_db = bool(use_db)
     if use_mq is not None:
         MESSAGE_HANDLER.use_mq = bool(use_mq)
+    if spool_dir is not None:
+        MESSAGE_HANDLER.spool = MessageSpool(spool_file(spool_dir))
     return MESSAGE_HANDLER
 
 
-def post_message(server, version, messagetype, data):
-    """Called from message objects."""
+def post_message(server, version, messagetype, data, on_sent=None):
+    """Called from message objects. 'on_sent' is called when the message has
+    been delivered."""
     log.debug("--> START {} MESSAGE".format(messagetype))
     log.debug(pprint.pformat(data))
     log.debug("<-- END {} MESSAGE".format(messagetype))
-    headers = {"accept": "application/json", "content-type": "application/json"}
     path = "/api/{version}/{messagetype}".format(version=version, messagetype=messagetype)
-    try:
-        conn = http.client.HTTPConnection(server)
-        conn.request("POST", path, json.dumps(data) if data else None, headers)
-        response = conn.getresponse()
-        log.debug("Reponse: {} {}".format(response.status, response.reason))
-        log.debug("TRACE Response text {}".format(str(response.read(), 'utf8')))
-        conn.close()
-    except Exception as e:
-        log.error('Connection error pushing message to Cynosure, reason :: "%s"' % e)
-        log.debug("TRACE", exc_info=True)
+    # Serialized now, the message object may change before it's sent. As bytes
+    # the body is sent together with the headers, avoiding delayed ACKs.
+    MESSAGE_SENDER.post(server, path, json.dumps(data).encode('utf-8') if data else None, on_sent)
+
+
+def flush_messages(timeout=FLUSH_TIMEOUT):
+    """Wait until the messages posted have been sent to Cynosure."""
+    if not MESSAGE_SENDER.flush(timeout):
+        log.warning("Messages to Cynosure not sent within %s s, %s messages left.",
+                timeout, MESSAGE_SENDER.queue.unfinished_tasks)
+
+
+class MessageSender(object):
+    """Post messages to Cynosure from a background thread so the test doesn't
+    wait for the HTTP round-trip. Messages are sent in the order they were
+    posted, one keep-alive connection is used per server."""
+    # Messages waiting to be sent, posting waits when the queue is full
+    maxsize = 1000
+    put_timeout = 10.0
+    # Attempts after the first one, the first retry (stale keep-alive
+    # connection) is immediate, then backoff is doubled for each attempt
+    retries = 4
+    backoff = 0.5
+    timeout = 30.0
+
+    headers = {"accept": "application/json", "content-type": "application/json"}
+
+    def __init__(self, asynchronous=DEFAULT_ASYNC_POST):
+        self.asynchronous = asynchronous
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def post(self, server, path, body, on_sent=None):
+        """Send message, in the background if asynchronous. 'on_sent' is
+        called when the message has been delivered."""
+        if not self.asynchronous:
+            if self.send(server, path, body) and on_sent is not None:
+                on_sent()
+            return
+        self.start()
+        try:
+            self.queue.put((server, path, body, on_sent), timeout=self.put_timeout)
+        except queue.Full:
+            log.error("Queue to Cynosure full, message %s dropped.", path)
+
+    def start(self):
+        """Start sender thread if not running."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='cynosure_sender', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            server, path, body, on_sent = self.queue.get()
+            try:
+                if self.send(server, path, body) and on_sent is not None:
+                    on_sent()
+            except Exception as e:
+                log.error('Error pushing message to Cynosure, reason :: "%s"' % e)
+                log.debug("TRACE", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until all messages posted are sent. Return False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def connection(self, server):
+        """Return open connection to server."""
+        if server not in self.connections:
+            self.connections[server] = http.client.HTTPConnection(server, timeout=self.timeout)
+        return self.connections[server]
+
+    def close(self, server):
+        conn = self.connections.pop(server, None)
+        if conn is not None:
+            conn.close()
+
+    def send(self, server, path, body):
+        """Post message, retry with backoff on connection errors and server
+        errors. Return True if the message was delivered (2xx response)."""
+        for attempt in range(self.retries + 1):
+            if attempt > 1:
+                time.sleep(self.backoff * 2 ** (attempt - 2))
+            try:
+                conn = self.connection(server)
+                conn.request("POST", path, body, self.headers)
+                response = conn.getresponse()
+                # The response has to be read before the connection is used again
+                text = response.read()
+                log.debug("Reponse: {} {}".format(response.status, response.reason))
+                log.debug("TRACE Response text {}".format(str(text, 'utf8')))
+                if response.will_close:
+                    self.close(server)
+                if 200 <= response.status < 300:
+                    return True
+                if response.status < 500:
+                    # Rejected by Cynosure, posting it again won't help
+                    log.error('Cynosure rejected message %s, reason :: "%s %s" %s',
+                              path, response.status, response.reason, str(text, 'utf8', 'replace'))
+                    return False
+                reason = "{} {}".format(response.status, response.reason)
+            except Exception as e:
+                self.close(server)
+                reason = e
+                log.debug("TRACE", exc_info=True)
+            log.debug("Posting %s to Cynosure failed (attempt %s), reason :: \"%s\"", path, attempt + 1, reason)
+        log.error('Connection error pushing message to Cynosure, reason :: "%s"' % reason)
+        return False
+
+
+try:
+    MESSAGE_SENDER
+except NameError:
+    MESSAGE_SENDER = MessageSender()
+    atexit.register(flush_messages)
 
 
 # Date / Time utilities =================================================={{{1
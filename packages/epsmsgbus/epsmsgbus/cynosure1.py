@@ -113,9 +113,9 @@ class ActivityStarted(CynosureV1Message):
         self['chain_id'] = chain_id
         self['name'] = name
 
-    def post(self):
+    def post(self, on_sent=None):
         BaselineCreated(self['chain_id'], target=self['target'], event_time=zulu_time()).post()
-        CynosureMessage.post(self)
+        super().post(on_sent)
 
 
 # ActivityFinished -------------------------------------------------------{{{2
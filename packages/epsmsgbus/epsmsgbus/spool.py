@@ -0,0 +1,175 @@
+"""
+Local spool for messages to Cynosure and the database.
+
+Each message handled is appended to a JSON lines file before it is sent.
+When a message has been delivered to a target ('mq' or 'db') an ack line is
+appended. Messages not acknowledged, e.g. because the database or Cynosure
+was unavailable, can be replayed later:
+
+    python -m epsmsgbus.spool [--no-db] [--no-mq] <spool file(s)>
+
+Replaying appends acks to the same file, so a file can be replayed until
+everything has been delivered.
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+
+
+log = logging.getLogger('epsmsgbus.spool')
+
+SPOOL_FILE_NAME = 'epsmsgbus_spool.jsonl'
+
+
+# Spool file ============================================================={{{1
+class MessageSpool(object):
+    """Append-only JSON lines file with messages and acks."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.seq = 0
+        for record in read_records(path):
+            self.seq = max(self.seq, record.get('seq', 0))
+
+    def append(self, msg, targets, share_activity=None):
+        """Write message to spool before it's sent to targets. Return sequence
+        number to use for ack()."""
+        with self.lock:
+            self.seq += 1
+            self.write({
+                'seq': self.seq,
+                'time': datetime.datetime.utcnow().isoformat(),
+                'server': getattr(msg, 'server', None),
+                'version': getattr(msg, 'version', None),
+                'type': msg.__class__.__name__,
+                'share_activity': share_activity,
+                'targets': targets,
+                'message': msg})
+            return self.seq
+
+    def ack(self, seq, target):
+        """Message 'seq' has been delivered to target."""
+        with self.lock:
+            self.write({'ack': seq, 'target': target})
+
+    def write(self, record):
+        with open(self.path, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record) + '\n')
+
+    def pending(self, targets=('mq', 'db')):
+        """Return list of (message record, targets not acknowledged) in the
+        order the messages were spooled."""
+        records = []
+        acked = set()
+        for record in read_records(self.path):
+            if 'ack' in record:
+                acked.add((record['ack'], record['target']))
+            else:
+                records.append(record)
+        result = []
+        for record in records:
+            missing = [t for t in record['targets'] if t in targets and (record['seq'], t) not in acked]
+            if missing:
+                result.append((record, missing))
+        return result
+
+
+def read_records(path):
+    """Yield records in spool file, a line not completely written is skipped."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as fp:
+        for line in fp:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                log.warning("Skipping broken line in spool file '%s'.", path)
+
+
+def spool_file(directory):
+    """Return the spool file in directory."""
+    return os.path.join(str(directory), SPOOL_FILE_NAME)
+
+
+# Replay ================================================================={{{1
+def replay(path, targets=('mq', 'db')):
+    """Send messages in spool file not delivered yet. Return number of
+    deliveries still missing."""
+    import epsdb
+    import epsmsgbus.cynosure as cynosure
+    spool = MessageSpool(path)
+    pending = spool.pending(targets)
+    log.info("Replaying %s messages from '%s'.", len(pending), path)
+    for record, missing in pending:
+        seq = record['seq']
+        if 'db' in missing:
+            epsdb.store_message(record['message'], record['share_activity'],
+                    on_stored=lambda seq=seq: spool.ack(seq, 'db'))
+        if 'mq' in missing:
+            cynosure.post_message(record['server'], record['version'], record['type'], record['message'],
+                    on_sent=lambda seq=seq: spool.ack(seq, 'mq'))
+    epsdb.flush()
+    cynosure.flush_messages()
+    left = len(spool.pending(targets))
+    if left:
+        log.warning("%s messages in '%s' could not be delivered.", left, path)
+    return left
+
+
+def main(argv=None):
+    """Parse arguments and replay spool files."""
+    if argv is None:
+        argv = sys.argv[1:]
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(prog="epsmsgbus.spool",
+            description="Send messages from spool files that were not delivered to Cynosure or the database.")
+    ap.add_argument("-d", "--debug", action="store_true", default=False, help="Print out debug messages.")
+    ap.add_argument("--no-db", action="store_true", default=False, help="Don't store messages in the database.")
+    ap.add_argument("--no-mq", action="store_true", default=False, help="Don't post messages to Cynosure.")
+    ap.add_argument("files", nargs="+", help="Spool file(s), or directories containing '%s'." % SPOOL_FILE_NAME)
+    args = ap.parse_args(argv)
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    targets = [t for t, skip in (('mq', args.no_mq), ('db', args.no_db)) if not skip]
+    left = 0
+    for filearg in args.files:
+        for filename in glob.glob(filearg):
+            if os.path.isdir(filename):
+                filename = spool_file(filename)
+            left += replay(filename, targets)
+    return 1 if left else 0
+
+
+# __main__ ==============================================================={{{1
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+# modeline ==============================================================={{{1
+# vim: set fdm=marker:
+# eof
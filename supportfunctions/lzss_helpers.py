@@ -118,7 +118,7 @@ class CircularBuffer():
             get_fill
             returns number of bytes buffer is filled with
         """
-        return len(self._fill)
+        return self._fill
 
     def get_longest_match(self, max_allowable_match_length: int, buffer) -> Reference:
         """
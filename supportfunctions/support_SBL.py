@@ -67,8 +67,14 @@ import time
 import logging
 import sys
 import glob
-from typing import Dict
-import traceback
+import mmap
+import os
+import queue
+import re
+import threading
+from threading import Thread
+from pathlib import Path
+from typing import Dict, NamedTuple
 
 from supportfunctions.support_carcom import SupportCARCOM
 from supportfunctions.support_can import SupportCAN, CanParam, CanPayload, CanTestExtra
@@ -84,6 +90,7 @@ from supportfunctions.support_service34 import SupportService34
 from supportfunctions.support_service36 import SupportService36
 from supportfunctions.support_service37 import SupportService37
 from hilding.conf import get_conf
+from hilding import vbf_cache
 
 SIO = SupportFileIO
 SC = SupportCAN()
@@ -99,7 +106,6 @@ SE31 = SupportService31()
 SE34 = SupportService34()
 SE36 = SupportService36()
 SE37 = SupportService37()
-CONF = get_conf()
 
 
 class VbfHeader(Dict): # pylint: disable=inherit-non-class
@@ -152,6 +158,34 @@ class VbfBlock(Dict): # pylint: disable=inherit-non-class
         return block
 
 
+class VbfBlockView(NamedTuple):
+    """
+        Block in the VBF data section as yielded by SupportSBL.vbf_blocks
+        data is a view of the block data in the VBF file,
+        compressed if data compression is used
+    """
+    StartAddress: int
+    Length: int
+    Checksum: int
+    data: memoryview
+
+    def vbf_block(self) -> VbfBlock:
+        """
+            return block parameters as VbfBlock
+        """
+        return {'StartAddress': self.StartAddress,
+                'Length': self.Length,
+                'Checksum': self.Checksum}
+
+
+# tokens in a VBF header, whitespace and comments in named groups
+# a single quotation mark is a string not read completely
+VBF_HEADER_TOKENS = re.compile(rb'(?P<ws>\s+)|(?P<cm>//[^\n]*)|"[^"]*"|"|[{}=;,]'
+                               rb'|(?:[^\s{}=;,"/]|/(?!/))+')
+# tokens in a VBF header value as read by parse_vbf_header
+VBF_VALUE_TOKENS = re.compile(r'"[^"]*"?|[{},]|\s+|[^\s{},"]+')
+
+
 class SupportSBL:
     # Disable the too-many-public-methods violation. Not sure how to split it
     # pylint: disable=too-many-public-methods
@@ -260,7 +294,7 @@ class SupportSBL:
             if not f_name.find('.vbf') == -1:
                 logging.debug("VBF File to Download:  %s", f_name)
 
-                vbf_version, vbf_header, _, _ = self.read_vbf_file(f_name)
+                vbf_version, vbf_header, _ = self.read_vbf_header(f_name)
                 self.vbf_header_convert(vbf_header)
                 logging.debug("VBF version: %s", vbf_version)
                 logging.debug('VBF_header: %s', vbf_header)
@@ -283,7 +317,7 @@ class SupportSBL:
         sets filenames found in dict vbf_header
         This can be used if you want to avoid the sys.argv part
         """
-        f_names = glob.glob(str(CONF.rig.vbf_path) + "/*.vbf")
+        f_names = glob.glob(str(get_conf().rig.vbf_path) + "/*.vbf")
         result = self.read_vbf_param(f_names)
         return result
 
@@ -318,11 +352,10 @@ class SupportSBL:
         result = True
         # Iteration to Download the SBL by blocks
         logging.info("vbf_offset: %s len(data): %s", vbf_offset, len(vbf_data))
-        while vbf_offset < len(vbf_data):
-            # Extract data block
-            # new offset!
-            vbf_offset, vbf_block, vbf_block_data = (
-                self.block_data_extract(vbf_data, vbf_offset))
+        for block in self.vbf_blocks(vbf_data, vbf_offset):
+            # Extract data block, a view of vbf_data
+            vbf_block = block.vbf_block()
+            vbf_block_data = block.data
 
             decompress_block = True
             new_decompress_block =\
@@ -355,8 +388,9 @@ class SupportSBL:
 
             logging.debug("Header       CRC16 block_data:  {0:04X}".format(vbf_block['Checksum']))
             if decompress_block:
-                logging.debug("Decompressed CRC16 calculation: {0:04X}".format\
-                              (SUTE.crc16(decompr_data)))
+                # calculated once, used for the compare and the logging
+                decompr_crc = SUTE.crc16(decompr_data)
+                logging.debug("Decompressed CRC16 calculation: {0:04X}".format(decompr_crc))
             else:
                 logging.debug("Block not decompress. No compare of CRC16.")
             logging.debug("Length block from header:  {0:08X}".format(vbf_block['Length']))
@@ -373,7 +407,7 @@ class SupportSBL:
             logging.info("HEX: %s", decompr_data.hex())
             logging.info("\n")
 
-            if (decompress_block and SUTE.crc16(decompr_data) == vbf_block['Checksum'])\
+            if (decompress_block and decompr_crc == vbf_block['Checksum'])\
                or not decompress_block:
                 # Request Download
                 #result, nbl = SE34.request_block_download(can_p, vbf_header, vbf_block)
@@ -401,15 +435,100 @@ class SupportSBL:
                 logging.info("Header       CRC16 block_data:  {0:04X}".format\
                                 (vbf_block['Checksum']))
                 logging.info("Decompressed CRC16 calculation: {0:04X}".format\
-                                (SUTE.crc16(decompr_data)))
+                                (decompr_crc))
                 logging.info("Header       block length:  {0:08X}".format(vbf_block['Length']))
                 logging.info("Decompressed block length: {0:08X}".format(len(decompr_data)))
                 result = False
         return result
 
-    def transfer_data_block(self,# pylint: disable=too-many-branches too-many-statements
+    @classmethod
+    def decompressed_crc(cls, vbf_header: VbfHeader, vbf_block_data):
+        """
+        Decompress block data with the data_format_identifier in vbf_header
+        return: CRC16 and length of the decompressed data
+        """
+        if vbf_header['data_format_identifier'] == 0: # format '0x00':
+            decompr_data = vbf_block_data
+        elif vbf_header['data_format_identifier'] == 16: # format '0x10':
+            decompr_data = LZSS.decode_barray(vbf_block_data)
+        elif vbf_header['data_format_identifier'] == 32: # format '0x20':
+            decompr_data = LZMA.decode_barray(vbf_block_data)
+        else:
+            logging.info("Unknown compression format: {0:02X}".format\
+                         (vbf_header['data_format_identifier']))
+            decompr_data = b''
+        return SUTE.crc16(decompr_data), len(decompr_data)
+
+    def verified_blocks(self, vbf_header: VbfHeader, vbf_data, vbf_offset,# pylint: disable=too-many-arguments too-many-positional-arguments
+                        preprocessed=None, decompress_block=True, queue_size=2):
+        """
+        Iterate over the blocks in vbf_data together with the CRC16 and length
+        of their decompressed data.
+        A worker thread decompresses the next blocks while the current one is
+        transferred, at most queue_size blocks ahead.
+
+        preprocessed:
+            from read_vbf_preprocessed, blocks with known decompressed
+            CRC and length are not decompressed again, the ones
+            decompressed are added
+
+        yields: block number, VbfBlockView, decompressed CRC16 and length
+                CRC16 and length are None if decompress_block is False
+        """
+        block_table = None
+        verified = {}
+        if preprocessed is not None:
+            block_table = preprocessed['blocks']
+            verified = preprocessed['verified']
+        blocks = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            # give up when the transfer doesn't take blocks anymore
+            while not stop.is_set():
+                try:
+                    blocks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def decompress_blocks():
+            try:
+                for block_no, block in enumerate(self.vbf_blocks(vbf_data, vbf_offset,
+                                                                 block_table)):
+                    decompr_crc_len = (None, None)
+                    if decompress_block and block_no in verified:
+                        # same vbf file verified before, see read_vbf_preprocessed
+                        decompr_crc_len = verified[block_no]
+                        logging.debug("Decompressed CRC16 and length from VBF cache")
+                    elif decompress_block:
+                        decompr_crc_len = self.decompressed_crc(vbf_header, block.data)
+                        verified[block_no] = decompr_crc_len
+                    if not put((block_no, block) + decompr_crc_len):
+                        return
+                put(None)
+            except Exception as err: # pylint: disable=broad-except
+                # raised again in the thread doing the transfer
+                put(err)
+
+        worker = Thread(target=decompress_blocks, name='vbf_decompress', daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = blocks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            worker.join()
+
+    def transfer_data_block(self,# pylint: disable=too-many-branches
                             can_p: CanParam, vbf_header: VbfHeader,
-                            vbf_data, vbf_offset):
+                            vbf_data, vbf_offset, preprocessed=None):
         """
             transfer_data_block
             support function to transfer
@@ -417,58 +536,51 @@ class SupportSBL:
             intended destination, given by
             stub, can_send, can_rec, can_nspace
 
+            Blocks are decompressed and verified in a worker thread while
+            the previous block is transferred, see verified_blocks.
+
+            preprocessed:
+                from read_vbf_preprocessed, see verified_blocks
+
             stepno, purpose:
                 used for logging purposes
         """
         result = True
-        # Iteration to Download the SBL by blocks
-        logging.debug("vbf_offset: %s len(data): %s", vbf_offset, len(vbf_data))
-        while vbf_offset < len(vbf_data):
-            # Extract data block
-            # new offset!
-            vbf_offset, vbf_block, vbf_block_data = (
-                self.block_data_extract(vbf_data, vbf_offset))
-
-            decompress_block = True
-            new_decompress_block =\
-                SIO.parameter_adopt_teststep('decompress_block')
-            if new_decompress_block != '':
-                assert isinstance(new_decompress_block, bool)
-                decompress_block = new_decompress_block
-            else:
-                logging.debug("Support_SBL: new_decompress_block is empty. Leave True.")
-            logging.debug("Support_SBL: decompress_block after YML: %s", decompress_block)
+        decompress_block = True
+        new_decompress_block =\
+            SIO.parameter_adopt_teststep('decompress_block')
+        if new_decompress_block != '':
+            assert isinstance(new_decompress_block, bool)
+            decompress_block = new_decompress_block
+        else:
+            logging.debug("Support_SBL: new_decompress_block is empty. Leave True.")
+        logging.debug("Support_SBL: decompress_block after YML: %s", decompress_block)
 
-            #decompress data["b_data"] if needed
-            logging.debug("vbf_header:  %s", vbf_header)
-            logging.debug("data_format_identifier %s", vbf_header['data_format_identifier'])
-            logging.debug("DataFormat block: {0:02X}".format(vbf_header['data_format_identifier']))
+        #decompress data["b_data"] if needed
+        logging.debug("vbf_header:  %s", vbf_header)
+        logging.debug("data_format_identifier %s", vbf_header['data_format_identifier'])
+        logging.debug("DataFormat block: {0:02X}".format(vbf_header['data_format_identifier']))
 
-            if decompress_block:
-                if vbf_header['data_format_identifier'] == 0: # format '0x00':
-                    decompr_data = vbf_block_data
-                elif vbf_header['data_format_identifier'] == 16: # format '0x10':
-                    decompr_data = LZSS.decode_barray(vbf_block_data)
-                elif vbf_header['data_format_identifier'] == 32: # format '0x20':
-                    decompr_data = LZMA.decode_barray(vbf_block_data)
-                else:
-                    logging.info("Unknown compression format: {0:02X}".format\
-                                 (vbf_header['data_format_identifier']))
+        # Iteration to Download the SBL by blocks
+        logging.debug("vbf_offset: %s len(data): %s", vbf_offset, len(vbf_data))
+        for _, block, decompr_crc, decompr_len in self.verified_blocks(
+                vbf_header, vbf_data, vbf_offset, preprocessed, decompress_block):
+            # Extract data block, a view of vbf_data
+            vbf_block = block.vbf_block()
+            vbf_block_data = block.data
 
             logging.debug("Header       CRC16 block_data:  {0:04X}".format(vbf_block['Checksum']))
             if decompress_block:
-                logging.debug("Decompressed CRC16 calculation: {0:04X}".format\
-                              (SUTE.crc16(decompr_data)))
+                logging.debug("Decompressed CRC16 calculation: {0:04X}".format(decompr_crc))
             else:
                 logging.debug("Block not decompress. No compare of CRC16.")
             logging.debug("Length block from header:  {0:08X}".format(vbf_block['Length']))
             if decompress_block:
-                logging.debug("Length block decompressed: {0:08X}".format\
-                              (len(decompr_data)))
+                logging.debug("Length block decompressed: {0:08X}".format(decompr_len))
             else:
                 logging.debug("Block not decompress. No compare of Block length.")
 
-            if (decompress_block and SUTE.crc16(decompr_data) == vbf_block['Checksum'])\
+            if (decompress_block and decompr_crc == vbf_block['Checksum'])\
                or not decompress_block:
                 # Request Download
                 result, nbl = SE34.request_block_download(can_p, vbf_header, vbf_block)
@@ -476,7 +588,7 @@ class SupportSBL:
                     logging.info("Support SBL, DL block request failed")
                     logging.info("DL block request - vbf_header: %s", vbf_header)
                 # Flash blocks to BECM with transfer data service 0x36
-                result = result and SE36.flash_blocks(can_p, vbf_block_data, vbf_block, nbl)
+                result = result and SE36.stream_blocks(can_p, vbf_block_data, nbl)
                 if not result:
                     logging.info("Support SBL, SE36, flash_blocks failed")
                     logging.info("DL block request - vbf_header: %s", vbf_header)
@@ -491,24 +603,43 @@ class SupportSBL:
                 logging.info("Header       CRC16 block_data:  {0:04X}".format\
                                 (vbf_block['Checksum']))
                 logging.info("Decompressed CRC16 calculation: {0:04X}".format\
-                                (SUTE.crc16(decompr_data)))
+                                (decompr_crc))
                 logging.info("Header       block length:  {0:08X}".format(vbf_block['Length']))
-                logging.info("Decompressed block length: {0:08X}".format(len(decompr_data)))
+                logging.info("Decompressed block length: {0:08X}".format(decompr_len))
                 result = False
         return result
 
 
-    def sbl_download_no_check(self, can_p: CanParam, file_n):
+    def transfer_vbf(self, can_p: CanParam, file_n, stepno='', erase=False):
         """
-        Support Function for flashing Secondary Bootloader SW
-        SBL Download
+        Transfer all blocks of a vbf file.
+        Header and blocks are taken from the vbf cache, blocks verified during
+        the transfer are added to the cache for the next download of the file.
+        erase: erase the memory given in the vbf header first
+        return: result, converted vbf header, vbf version
         """
-        # Read vbf file for SBL download
-        _, vbf_header, vbf_data, vbf_offset = self.read_vbf_file(file_n)
+        vbf_version, vbf_header, vbf_offset, preprocessed = self.read_vbf_preprocessed(file_n)
+        vbf_data = self.map_vbf_file(file_n)
         #convert vbf header so values can be used directly
         self.vbf_header_convert(vbf_header)
+        blocks_verified = len(preprocessed['verified'])
+
+        result = True
+        if erase:
+            result = self.flash_erase(can_p, vbf_header, stepno)
+        result = result and self.transfer_data_block(can_p, vbf_header, vbf_data,
+                                                     vbf_offset, preprocessed)
+        if len(preprocessed['verified']) != blocks_verified:
+            self.write_vbf_preprocessed(file_n, preprocessed)
+        return result, vbf_header, vbf_version
+
 
-        testresult = self.transfer_data_block(can_p, vbf_header, vbf_data, vbf_offset)
+    def sbl_download_no_check(self, can_p: CanParam, file_n):
+        """
+        Support Function for flashing Secondary Bootloader SW
+        SBL Download
+        """
+        testresult, vbf_header, _ = self.transfer_vbf(can_p, file_n)
         return testresult, vbf_header
 
 
@@ -516,14 +647,8 @@ class SupportSBL:
         """
         Support Function for flashing Secondary Bootloader SW
         """
-
-        # Read vbf file for SBL download
-        vbf_version, vbf_header, vbf_data, vbf_offset = self.read_vbf_file(file_n)
-        #convert vbf header so values can be used directly
-        self.vbf_header_convert(vbf_header)
+        testresult, vbf_header, vbf_version = self.transfer_vbf(can_p, file_n)
         logging.debug("sbl_download: VBF version: %s", vbf_version)
-
-        testresult = self.transfer_data_block(can_p, vbf_header, vbf_data, vbf_offset)
         #Check memory
         testresult = testresult and SE31.check_memory(can_p, vbf_header, stepno)
         return testresult, vbf_header
@@ -555,15 +680,9 @@ class SupportSBL:
 
         # Read vbf file for SBL download
         logging.debug("sw_part_download_no_check: filename: %s", file_n)
-        vbf_version, vbf_header, vbf_data, vbf_offset = self.read_vbf_file(file_n)
-        #convert vbf header so values can be used directly
-        self.vbf_header_convert(vbf_header)
+        # Erase Memory, then download the Software by blocks
+        result, vbf_header, vbf_version = self.transfer_vbf(can_p, file_n, stepno, erase=True)
         logging.debug("sw_part_download_no_check: VBF version: %s", vbf_version)
-
-        # Erase Memory
-        result = self.flash_erase(can_p, vbf_header, stepno)
-        # Iteration to Download the Software by blocks
-        result = result and self.transfer_data_block(can_p, vbf_header, vbf_data, vbf_offset)
         return result, vbf_header
 
 
@@ -783,195 +902,254 @@ class SupportSBL:
     def vbf_header_convert(cls, header):
         """
         take 'header' as read from vbf file and convert values
-        so they get usable directly in python
+        so they get usable directly in python:
+        numbers to int (or float), strings without quotes, {...} to lists
         """
         logging.debug("vbf_header_convert:")
         logging.debug("Header before convert: %s", header)
         for keys in header:
-            #elements contains a list of elements
-            #convert into a python list
-            if header[keys][0] == '{' and header[keys][-1] == '}':
-                #convert multiple values into python list
-                cvert = header[keys].replace('{', '[')
-                cvert = cvert.replace('}', ']')
-                header[keys] = cvert
-
+            # values already converted are left as they are
+            if keys == 'sw_part_type' or not isinstance(header[keys], str):
+                continue
             try:
-                if keys != 'sw_part_type':
-                    header[keys] = eval(header[keys]) # pylint: disable=eval-used
-            except: # pylint: disable=bare-except
-                traceback.print_exc()
-                logging.info("Oops! Value in header that can't be evaluated")
+                header[keys] = cls.vbf_value(header[keys])
+            except ValueError as error:
+                logging.info("Oops! Value in header that can't be evaluated: %s = %s (%s)",
+                             keys, header[keys], error)
         logging.debug("Header after convert: %s", header)
 
     @classmethod
-    def vbf_cm_filter(cls, cm_str):
-        """
-        vbf_cm_filter
-        filter out comment from string
-        return: input string with comments removed
-        """
-        #logging.info("look for comments starting with '//': ")
-        str_ret = cm_str
-        comm = cm_str.find(b'//')
-        while comm != -1:
-            #comm = cm_str.find(b'//')
-            #if not comm == -1:
-            #logging.info("position comment: %s", comm)
-            #logging.info("found single line comment. Remove upp till cr/eol")
-            #comment line ends with LF (REQ 64698)
-            comm_end = cm_str.find(b'\n', comm)
-            str_ret = cm_str[0:comm] + cm_str[comm_end:]
-            cm_str = str_ret
-            comm = cm_str.find(b'//')
-            #else:
-            #    logging.info("nothing found, do nothing")
-            #    str_ret = cm_str
-        #logging.info("string to return: %s", str_ret)
-        return str_ret
+    def vbf_scalar(cls, text):
+        """
+        convert a single value in a vbf header:
+        hex or decimal int, float, otherwise the text (identifier)
+        """
+        try:
+            if text[:2] in ('0x', '0X'):
+                return int(text, 16)
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return text
 
     @classmethod
-    def vbf_ws_filtered(cls, p_str):
-        """
-        remove whitespace chars as defined for vbf2.6 in str
-        """
-        # [WS/CM]identifier[WS/CM]=[WS/CM]IdentifierValue[WS/CM];[WS/CM]
-        # WS chars in vbf 2.6
-        w_space = b'\x09\x0A\x0B\x0C\x0D\x20'
-        #logging.debug("vbf_ws_filter - in %s ", p_str)
-        for bchar in w_space:
-            #logging.debug("bchar to check: %s", bchar)
-            #p_str = p_str.replace(bchar, b'')
-            p_str = p_str.replace(bytes([bchar]), b'')
-        #logging.info("vbf_ws_filter - out %s", p_str)
-        return p_str
+    def vbf_value(cls, text):
+        """
+        convert value text from a vbf header in one pass
+        {a, b, {c}} gives a list, "text" a string, others see vbf_scalar
+        raises ValueError if text is not a single complete value
+        """
+        stack = [[]]
+        for token in VBF_VALUE_TOKENS.finditer(text):
+            value = token.group()
+            if value == '{':
+                stack[-1].append([])
+                stack.append(stack[-1][-1])
+            elif value == '}':
+                if len(stack) == 1:
+                    raise ValueError("closing bracket without opening bracket")
+                stack.pop()
+            elif value[0] == '"':
+                if len(value) == 1 or value[-1] != '"':
+                    raise ValueError("string not terminated")
+                stack[-1].append(value[1:-1])
+            elif value != ',' and not value.isspace():
+                stack[-1].append(cls.vbf_scalar(value))
+        if len(stack) != 1 or len(stack[0]) != 1:
+            raise ValueError("not a single complete value")
+        return stack[0][0]
 
     @classmethod
-    def vbf_parse(cls, p_str):
+    def vbf_header_tokens(cls, data):
         """
-        parse line for key and argument
-        delimiters: '=' for key/arg
-                    ';' for end of arg
+        tokens in vbf data (bytes) as re.Match: strings, brackets, '=', ';', ','
+        and words (keywords, numbers, identifiers). Whitespace and comments
+        are skipped. A single '"' is a string not terminated in data.
         """
-        logging.debug("vbf_parse to parse: %s", p_str)
-        vbf_key = p_str[0: p_str.find(b'=')]
-        vbf_nam = p_str[1+p_str.find(b'='):p_str.find(b';')]
-        logging.debug("key found: %s", cls.vbf_ws_filtered(vbf_key))
-        logging.debug("nam found: %s", cls.vbf_ws_filtered(vbf_nam))
-        return (cls.vbf_ws_filtered(vbf_key), cls.vbf_ws_filtered(vbf_nam))
-
-    @classmethod
-    def read_vbf_header_filtered(cls, data, start_pos):
-        """
-        starts reading data from start_pos
-        continous reading until next closing bracker cbrack
-        return: data_filtererd: data until next closing bracket, without comments
-                start_pos: position in data reached
-        """
-        data_filtered = b''
-        next_cbrack = data.find(b'}', start_pos)
-
-        # C++ style comment in header data before next closing bracket
-        next_comm_line = data.find(b'//', start_pos, next_cbrack +1)
-
-        #filter out comment(s),
-        while not next_comm_line == -1:
-            #read until comment:
-            data_filtered = data_filtered + data[start_pos:next_comm_line]
-            start_pos = next_comm_line + 2
-
-            #now filter out comment, set new start_pos for searching
-            next_comm_stop = data.find(b'\n', next_comm_line)
-            start_pos = next_comm_stop +1
-            #look for next semicolon / cbracket after comment / comment line
-            #next_scol = data.find(b';', next_comm_stop +1)
-            next_cbrack = data.find(b'}', next_comm_stop +1)
-            next_comm_line = data.find(b'//', start_pos, next_cbrack +1)
-
-        #no more comment lines, add data until cbrack
-        data_filtered = data_filtered + data[start_pos:next_cbrack +1]
-        start_pos = next_cbrack +1
-
-        #look if more comments in buffer
-        next_comm_line = data.find(b'//', start_pos +1, next_cbrack)
-        return data_filtered, start_pos
+        for token in VBF_HEADER_TOKENS.finditer(data):
+            if not token.lastgroup:
+                yield token
 
     @classmethod
     def read_vbf_file(cls, f_path_name):
-        # Disable too-many-locals violations in this function.
-        # Should be rewritten, maybe using regexp
-        # pylint: disable=too-many-locals
         """
         Read and decode vbf files for Software Parts
         """
         logging.debug("VBF File to read: %s", f_path_name)
         # read to EOF:
         data = SUTE.read_f(f_path_name)
-        vers_pos = data.find(b'vbf_version')
-        if not vers_pos == 0:
-            logging.info("Warning: version not at expected position: %s", vers_pos)
-        #logging.debug("Version vers_pos: %s", vers_pos)
-
-        # look for first semicolon
-        semi_pos = data.find(b';')
-        if not semi_pos == -1:
-            semi_pos += 1
-        logging.debug("VBF version to filter: %s", data[vers_pos:semi_pos])
-
-        # remove CM in string to parse
-        # if no semicolon contained take semicolon in file
-        str_cm_filtered = cls.vbf_cm_filter(data[vers_pos:semi_pos])
-        logging.debug("str_cm_filtered: %s", str_cm_filtered)
-        while not str_cm_filtered.find(b';'):
-            semi_pos = data.find(b';', semi_pos)
-            str_cm_filtered = cls.vbf_cm_filter(data[vers_pos:semi_pos])
-
-        v_key, v_arg = cls.vbf_parse(str_cm_filtered)
-        #logging.debug("VBF Version read: %s = %s", v_key.decode('utf-8'), v_arg.decode('utf-8'))
-        version = v_arg.decode('utf-8')
-
-        logging.debug("Now starting to read Header")
-        #Start to read header data
-        #store all key, arg in dict
-        header: VbfHeader = {}
-        head_pos = data.find(b'header', semi_pos)
-        logging.debug("Header head_pos: %s", head_pos)
+        version, header, data_start = cls.parse_vbf_header(data)
+        return version, header, data, data_start
+
+    @classmethod
+    def vbf_header_end(cls, data):
+        """
+        position after the bracket closing the vbf header in data
+        return: None if data doesn't contain the whole header
+        """
+        depth = 0
+        for token in cls.vbf_header_tokens(data):
+            if token.group() == b'{':
+                depth += 1
+            elif token.group() == b'}':
+                depth -= 1
+                if depth == 0:
+                    return token.end()
+            elif token.group() == b'"':
+                return None
+        return None
 
-        head_pos = data.find(b'{', head_pos) + 1
+    @classmethod
+    def read_vbf_header(cls, f_path_name, chunk_size=0x10000):
+        """
+        Read and decode only the header of a vbf file.
+        The file is read in chunks until the bracket closing the header.
+        return: version, header, position where the data section starts
+        """
+        logging.debug("VBF header to read: %s", f_path_name)
+        data = b''
+        with open(f_path_name, 'rb') as vbf_file:
+            chunk = vbf_file.read(chunk_size)
+            while chunk:
+                data += chunk
+                if cls.vbf_header_end(data) is not None:
+                    break
+                chunk = vbf_file.read(chunk_size)
+        return cls.parse_vbf_header(data)
 
-        # header data without comments, position where to continue reading
-        data_filtered, head_pos = cls.read_vbf_header_filtered(data, head_pos)
+    @classmethod
+    def map_vbf_file(cls, f_path_name):
+        """
+        Memory map a vbf file
+        return: read only memoryview of the whole file, slices of it are views
+                of the file as well. The file is unmapped when no view is left.
+        """
+        with open(f_path_name, 'rb') as vbf_file:
+            if os.fstat(vbf_file.fileno()).st_size == 0:
+                return memoryview(b'')
+            return memoryview(mmap.mmap(vbf_file.fileno(), 0, access=mmap.ACCESS_READ))
 
-        #only cbrack in buffer: header completely read
-        while not (data_filtered.find(b'}') != -1 and data_filtered.find(b'=') == -1):
+    @classmethod
+    def vbf_block_table(cls, vbf_data, vbf_offset):
+        """
+        Scan the blocks in the data section of vbf_data, starting at vbf_offset
+        See Volvo Document 31808832 Rev 015
+        Chapter 6.3.3 REQPROD 64727 Data section structure
+        return: list of (StartAddress, Length, Checksum, position of block data)
+        """
+        block_table = []
+        while vbf_offset < len(vbf_data):
+            start_address = int.from_bytes(vbf_data[vbf_offset: vbf_offset + 4], 'big')
+            length = int.from_bytes(vbf_data[vbf_offset + 4: vbf_offset + 8], 'big')
+            data_end = vbf_offset + 8 + length
+            checksum = int.from_bytes(vbf_data[data_end: data_end + 2], 'big')
+            block_table.append((start_address, length, checksum, vbf_offset + 8))
+            vbf_offset = data_end + 2
+        return block_table
 
-        #Read on until next keyword / data pair
-            while data_filtered.find(b';') == -1:
-                #logging.debug("No ';' found anymore, read further.")
-                #logging.debug("Data read: %s %s", data.find(b'}', next_cbrack+1))
+    @classmethod
+    def vbf_blocks(cls, vbf_data, vbf_offset, block_table=None):
+        """
+        Iterate over the blocks in the data section of vbf_data, starting at vbf_offset
+        block_table: result of vbf_block_table for vbf_data if already known
+        yields: VbfBlockView, its data is a view of vbf_data, nothing is copied
+        """
+        vbf_data = memoryview(vbf_data)
+        if block_table is None:
+            block_table = cls.vbf_block_table(vbf_data, vbf_offset)
+        for start_address, length, checksum, data_offset in block_table:
+            logging.debug("vbf_blocks - StartAddress: %08X Length: %08X Checksum: %04X",
+                          start_address, length, checksum)
+            yield VbfBlockView(start_address, length, checksum,
+                               vbf_data[data_offset: data_offset + length])
 
-                #fill up data_filtered
-                data_filtered2, head_pos = cls.read_vbf_header_filtered(data, head_pos)
-                data_filtered = data_filtered + data_filtered2
+    @classmethod
+    def read_vbf_preprocessed(cls, f_path_name):
+        """
+        Header and block table of a vbf file. They are taken from the vbf cache
+        in the rig build directory as long as the file content doesn't change.
+        return: version, header (not converted), position where the data
+                section starts, preprocessed
+                preprocessed also holds the decompressed CRC and length of the
+                blocks verified so far, see transfer_data_block
+        """
+        vbf_file = Path(f_path_name)
+        try:
+            preprocessed = vbf_cache.read_cache(get_conf().rig.vbf_cache_path, vbf_file)
+        except OSError as err:
+            logging.warning("VBF cache not available: %s", err)
+            preprocessed = None
+        if preprocessed is None:
+            vbf_version, vbf_header, data_start = cls.read_vbf_header(f_path_name)
+            preprocessed = {'vbf_version': vbf_version,
+                            'header': vbf_header,
+                            'data_start': data_start,
+                            'blocks': cls.vbf_block_table(cls.map_vbf_file(f_path_name),
+                                                          data_start),
+                            'verified': {},
+                            'sha256': vbf_cache.vbf_file_hash(vbf_file)}
+            cls.write_vbf_preprocessed(f_path_name, preprocessed)
+        else:
+            logging.debug("VBF header and blocks from cache: %s", f_path_name)
+        return preprocessed['vbf_version'], dict(preprocessed['header']),\
+            preprocessed['data_start'], preprocessed
 
-            # Now I should have next keyword read
-            # filter away white spaces
-            str_filtered = cls.vbf_ws_filtered(data_filtered)
-            logging.debug("expr WS filtered: %s", str_filtered)
-            v_key, v_arg = cls.vbf_parse(str_filtered)
-            header[v_key.decode('utf-8')] = v_arg.decode('utf-8')
+    @classmethod
+    def write_vbf_preprocessed(cls, f_path_name, preprocessed):
+        """
+        Store preprocessed (see read_vbf_preprocessed) in the vbf cache
+        """
+        try:
+            vbf_cache.write_cache(get_conf().rig.vbf_cache_path, Path(f_path_name),
+                                  preprocessed, preprocessed['sha256'])
+        except OSError as err:
+            logging.warning("Could not write VBF cache for %s: %s", f_path_name, err)
 
-            data_filtered = data_filtered[data_filtered.find(b';')+1:]
-        # header read now, start data
-        data_start = head_pos
+    @classmethod
+    def parse_vbf_header(cls, data):
+        """
+        Decode version and header at the beginning of vbf data in one pass.
+        Header values are the text in the file without comments and whitespace
+        (except in strings), vbf_header_convert converts them to python values.
+        return: version, header, position where the data section starts
+        """
+        version = ''
+        header: VbfHeader = {}
+        data_start = len(data)
+        in_header = False
+        # tokens of the statement being read and depth of brackets in it
+        statement = []
+        depth = 0
+        for token in cls.vbf_header_tokens(data):
+            text = token.group()
+            if text == b'"':
+                logging.warning("VBF header: string not terminated at %s", token.start())
+                break
+            if text == b'{' and not in_header and statement == [b'header']:
+                in_header = True
+                statement = []
+            elif text == b'}' and in_header and depth == 0 and not statement:
+                # header read now, start data
+                data_start = token.end()
+                break
+            elif text == b';' and depth == 0:
+                if len(statement) < 2 or statement[1] != b'=':
+                    logging.warning("VBF header: can't parse %s", b' '.join(statement))
+                elif in_header:
+                    header[statement[0].decode('utf-8')] = b''.join(statement[2:]).decode('utf-8')
+                elif statement[0] == b'vbf_version':
+                    version = b''.join(statement[2:]).decode('utf-8')
+                statement = []
+            else:
+                depth += (text == b'{') - (text == b'}')
+                statement.append(text)
         logging.debug("vbf_version: %s", version)
         logging.debug('Header: %s', header)
         logging.debug("Data_Start: %s", data_start)
-
-        ### optional to add:
-        ### check for not allowed keywords in header
-
-        return version, header, data, data_start
+        return version, header, data_start
 
     @classmethod
     def flash_erase(cls, can_p: CanParam, vbf_header, stepno):
@@ -45,10 +45,16 @@ Any unauthorized copying or distribution of content from this file is prohibited
 import logging
 import time
 import threading
+import queue
 from threading import Thread
 import sys
 from typing import Dict
 import grpc
+
+from supportfunctions.support_periodic import PeriodicScheduler, BurstStats, skip_missed,\
+    wait_until
+from supportfunctions.support_isotp import IsoTpReassembler, CanFrame, FrameBuffer,\
+    BufferStats
 sys.path.append('generated')
 import protogenerated.network_api_pb2 as network_api_pb2 # pylint: disable=wrong-import-position
 import protogenerated.network_api_pb2_grpc as network_api_pb2_grpc # pylint: disable=wrong-import-position
@@ -96,6 +102,7 @@ class CanTestExtra(Dict): # pylint: disable=too-few-public-methods,inherit-non-c
     timeout: int
     min_no_messages: int
     max_no_messages: int
+    wait_response: bool
 
 
 class CanPayload(Dict): # pylint: disable=too-few-public-methods,inherit-non-class
@@ -132,6 +139,23 @@ class SupportCAN:
     can_messages = dict()
     can_subscribes = dict()
     can_periodic = dict()
+    # Condition per received signal, notified each time a frame is appended
+    can_frames_cond = dict()
+    # FlowControl frames received per signal, consumed by send_cf_can
+    can_fc_queue = dict()
+    # ISO-TP reassembler per signal, fed by the receive thread
+    can_reassembler = dict()
+    # Max number of entries kept per signal in can_frames, can_messages, can_cf_received
+    buffer_maxlen = 10000
+    # BufferStats per (buffer, signal), kept when buffers are cleared
+    can_buffer_stats = dict()
+    # Event per periodic signal, set when the first frame has been sent
+    can_periodic_started = dict()
+    # PeriodicScheduler sending the signals in can_periodic, created when first used
+    periodic_scheduler = None
+    # Event per subscribed signal, set when the subscription stream is established
+    can_subscribed = dict()
+    can_subscribe_threads = dict()
 
     _heartbeat = False
 
@@ -185,14 +209,14 @@ class SupportCAN:
         clear_old_CF_frames
         """
         for s_frame in self.can_cf_received:
-            self.can_cf_received[s_frame] = list()
+            self.can_cf_received[s_frame] = self.new_buffer('can_cf_received', s_frame)
 
 
     def clear_can_message(self, can_mess):
         """
         clear_can_message
         """
-        self.can_messages[can_mess] = list()
+        self.can_messages[can_mess] = self.new_buffer('can_messages', can_mess)
         return True
 
 
@@ -201,7 +225,7 @@ class SupportCAN:
         clear_all_can_messages
         """
         for can_mess in self.can_messages:
-            self.can_messages[can_mess] = list()
+            self.can_messages[can_mess] = self.new_buffer('can_messages', can_mess)
         return True
 
 
@@ -209,7 +233,9 @@ class SupportCAN:
         """
         clear_can_frame
         """
-        self.can_frames[can_frame] = list()
+        with self.frames_condition(can_frame):
+            self.can_frames[can_frame] = self.new_buffer('can_frames', can_frame)
+            self.reassembler(can_frame).reset(self.can_frames[can_frame])
         return True
 
 
@@ -217,11 +243,98 @@ class SupportCAN:
         """
         clear_all_can_frames
         """
-        for can_frame in self.can_frames:
-            self.can_frames[can_frame] = list()
+        for can_frame in list(self.can_frames):
+            self.clear_can_frame(can_frame)
         return True
 
 
+    def reset_signal(self, signame):
+        """
+        reset_signal
+
+        Clear buffers and restore the default flow control of a subscribed
+        signal, the subscription continues
+        """
+        self.clear_can_frame(signame)
+        self.clear_can_message(signame)
+        self.can_cf_received[signame] = self.new_buffer('can_cf_received', signame)
+        fc_queue = self.fc_queue(signame)
+        while not fc_queue.empty():
+            fc_queue.get_nowait()
+        # block_size, separation_time, delay, flag, responses, auto
+        self.can_subscribes[signame][1:7] = [0, 0, 0, 48, 0, True]
+
+
+    def frames_condition(self, can_rec):
+        """
+        Returns the condition notified when a frame is received for can_rec
+        """
+        return self.can_frames_cond.setdefault(can_rec, threading.Condition())
+
+
+    def new_buffer(self, buffer, name):
+        """
+        Returns empty FrameBuffer limited to buffer_maxlen entries
+
+        buffer: name of buffer, 'can_frames', 'can_messages' or 'can_cf_received'
+        name:   signal name
+        """
+        stats = self.can_buffer_stats.setdefault((buffer, name), BufferStats())
+        return FrameBuffer(f'{buffer}[{name}]', self.buffer_maxlen, stats)
+
+
+    def log_buffer_stats(self):
+        """
+        Log high water mark and entries dropped for each buffer used
+        """
+        for (buffer, name), stats in sorted(self.can_buffer_stats.items()):
+            if stats.high_water:
+                logging.info("%s[%s]: high water mark %s of %s, dropped %s",
+                             buffer, name, stats.high_water, self.buffer_maxlen,
+                             stats.dropped)
+
+
+    def reassembler(self, can_rec):
+        """
+        Returns the ISO-TP reassembler for frames received on can_rec
+        """
+        return self.can_reassembler.setdefault(can_rec, IsoTpReassembler())
+
+
+    def fc_queue(self, can_rec):
+        """
+        Returns the queue FlowControl frames received for can_rec are put in
+        """
+        return self.can_fc_queue.setdefault(can_rec, queue.Queue())
+
+
+    def frames_received(self, can_rec):
+        """
+        Returns the number of frames received for can_rec since its buffer was
+        cleared, frames dropped or removed from the buffer are still counted
+        """
+        frames = self.can_frames.get(can_rec, [])
+        return getattr(frames, 'received', len(frames))
+
+
+    def wait_for_frame(self, can_rec, frames_seen, timeout):
+        """
+        Action: block until frames_received(can_rec) differs from
+                frames_seen, or timeout expires
+
+        Args: can_rec     - name of received signal
+              frames_seen - frames_received(can_rec) when caller last checked
+              timeout     - max time to wait in seconds
+
+        Returns: True if new frames were received within timeout
+        """
+        frames_cond = self.frames_condition(can_rec)
+        with frames_cond:
+            return frames_cond.wait_for(
+                lambda: self.frames_received(can_rec) != frames_seen,
+                max(timeout, 0))
+
+
     @classmethod
     def signal2message(cls, my_signal):
         """
@@ -233,12 +346,11 @@ class SupportCAN:
 
         Args: my_signal - Frame received from beamybroker
 
-        Returns: extracts values as list
+        Returns: CanFrame, can be used as list [timestamp, CAN_ID, HEXSTRING]
         """
-        # Format signal to be better readable
-        return ([my_signal.signal[0].timestamp/1000000,\
-                 my_signal.signal[0].id.name,\
-                 my_signal.signal[0].raw.hex().upper()])
+        return CanFrame(my_signal.signal[0].timestamp/1000000,
+                        my_signal.signal[0].id.name,
+                        my_signal.signal[0].raw)
 
     @classmethod
     def display_signals_available(cls, can_p: CanParam):
@@ -272,9 +384,10 @@ class SupportCAN:
         signals=network_api_pb2.SignalIds(signalId=[signal]), onChange=False)
 
         # add signal to dictionary, empty list of messages
-        self.can_frames[can_p["receive"]] = list()
-        self.can_messages[can_p["receive"]] = list()
-        self.can_cf_received[can_p["receive"]] = list()
+        self.clear_can_frame(can_p["receive"])
+        self.clear_can_message(can_p["receive"])
+        self.can_cf_received[can_p["receive"]] = self.new_buffer('can_cf_received',
+                                                                 can_p["receive"])
 
         # Frame control handling
         fc_param = dict()
@@ -297,6 +410,12 @@ class SupportCAN:
                 [subscribe_object, fc_param["block_size"], fc_param["separation_time"],\
                 fc_param["delay"], fc_param["flag"], fc_param["responses"], fc_param["auto"]]
             logging.debug("Added object %s to subcribe %s", can_p["receive"], self.can_subscribes)
+            # returns when the signal broker has accepted the subscription
+            subscribe_object.initial_metadata()
+            self.can_subscribed[can_p["receive"]].set()
+            frames_cond = self.frames_condition(can_p["receive"])
+            fc_queue = self.fc_queue(can_p["receive"])
+            isotp = self.reassembler(can_p["receive"])
             for response in subscribe_object:
                 #if multiframe detected prepare answer and send it
                 #if no raw value found, take the integer one
@@ -318,7 +437,13 @@ class SupportCAN:
                 if (det_mf == 3) and\
                    (can_p["send"] in self.can_mf_send and self.can_mf_send[can_p["send"]] == []):
                     logging.warning("No CF was expected for %s", can_p["send"])
-                self.can_frames[can_p["receive"]].append(self.signal2message(response))
+                frame = self.signal2message(response)
+                with frames_cond:
+                    self.can_frames[can_p["receive"]].append(frame)
+                    isotp.feed(frame.timestamp, frame.name, frame.raw)
+                    frames_cond.notify_all()
+                if det_mf == 3:
+                    fc_queue.put(frame)
         except grpc._channel._Rendezvous as err: # pylint: disable=protected-access
             # suppress 'Deadline Exceeded', show other errors
             if not err._state.details == "Deadline Exceeded": # pylint: disable=protected-access
@@ -336,9 +461,28 @@ class SupportCAN:
         # since more than one signal is typically subscribed
         thread_1.name = "SubscribeThread"
         thread_1.deamon = True
+        self.can_subscribed[can_p["receive"]] = threading.Event()
+        self.can_subscribe_threads[can_p["receive"]] = thread_1
         thread_1.start()
 
 
+    def wait_subscribed(self, signames, timeout=1):
+        """
+        wait_subscribed
+
+        Wait until the subscriptions of all signals in signames are established,
+        at most timeout seconds in total. Returns False if not all were established.
+        """
+        deadline = time.time() + timeout
+        for signame in signames:
+            if signame not in self.can_subscribed or\
+               not self.can_subscribed[signame].wait(max(0, deadline - time.time())):
+                logging.warning("Subscription of %s not established within %s sec",
+                                signame, timeout)
+                return False
+        return True
+
+
     def unsubscribe_signal(self, signame):
         """
         unsubscribe_signal
@@ -355,34 +499,42 @@ class SupportCAN:
 
         for unsubsc in self.can_subscribes:
             self.unsubscribe_signal(unsubsc)
-        time.sleep(5)
+        # wait for the subscribe threads to end, at most 5 sec in total
+        deadline = time.time() + 5
+        for thread in self.can_subscribe_threads.values():
+            thread.join(max(0, deadline - time.time()))
 
 
     @classmethod
     def thread_stop(cls):
         """
         stop any remaining active threads that we have created in support_can
-        with a join
+        with a join, the periodic scheduler thread is stopped
         """
         logging.debug("Active threads: %s", threading.enumerate())
-        threads = [t.name for t in threading.enumerate()
-                   if t.name in ["SignalThread", "PeriodicThread"]]
+        if cls.periodic_scheduler is not None:
+            cls.periodic_scheduler.stop()
+        # PeriodicThread: send_periodic started by a test, ends when the signal is stopped
+        threads = [t for t in threading.enumerate()
+                   if t.name in ["SignalThread", "PeriodicThread"]
+                   and t is not threading.current_thread()]
 
         logging.debug("Signal or periodic threads remaining: %s", len(threads))
 
         for thread in threads:
-            logging.debug("Joining thread: %s", thread)
+            logging.debug("Joining thread: %s", thread.name)
             thread.join()
 
         logging.debug("Active threads: %s", threading.enumerate())
 
 
-    def start_periodic(self, stub, per_param):
+    def start_periodic(self, stub, per_param, timeout=1):
         """
         start_periodic
 
         Start a periodic signal: parameters network_stub, send TRUE/FALSE,\
                            name, DBC_name, DBC_namespace, CAN_frame, intervall
+        Waits until the first frame is sent, at most timeout seconds.
         """
         logging.debug("Start_sending_periodic: %s", per_param["name"])
         self.can_periodic[per_param["name"]] = [per_param["send"], per_param["id"],\
@@ -391,14 +543,56 @@ class SupportCAN:
         logging.debug("self.can_periodic: %s", self.can_periodic)
 
         # start periodic, repeat every per_intervall (ms)
-        thread_1 = Thread(target=self.send_periodic, args=(stub, per_param["name"]))
+        started = threading.Event()
+        self.can_periodic_started[per_param["name"]] = started
+        self.scheduler().start(stub, per_param["name"])
+        logging.debug("Wait for periodic signal to start: %s", per_param["name"])
+        if not started.wait(timeout):
+            logging.debug("Periodic signal %s not sent within %s sec",
+                          per_param["name"], timeout)
 
-        # perhaps this should have a number attached like PeriodicThread-1
-        thread_1.name = "PeriodicThread"
-        thread_1.daemon = True
-        thread_1.start()
-        logging.debug("Wait 1sec for periodic signal to start: %s", per_param["name"])
-        time.sleep(1)
+
+    @classmethod
+    def scheduler(cls):
+        """
+        Returns the PeriodicScheduler sending all periodic signals
+        """
+        if cls.periodic_scheduler is None:
+            cls.periodic_scheduler = PeriodicScheduler(cls.can_periodic.get,
+                                                       cls.t_send_signals_hex,
+                                                       on_sent=cls.periodic_sent)
+        return cls.periodic_scheduler
+
+
+    @classmethod
+    def periodic_sent(cls, per_name):
+        """
+        Called by the scheduler when a frame of periodic signal per_name was sent
+        """
+        started = cls.can_periodic_started.get(per_name)
+        if started is not None:
+            started.set()
+
+
+    @classmethod
+    def periodic_active(cls, per_name):
+        """
+        True if periodic signal per_name is being sent
+        """
+        return cls.periodic_scheduler is not None and cls.periodic_scheduler.active(per_name)
+
+
+    def log_periodic_stats(self):
+        """
+        Log how late periodic signals were sent compared to their interval
+        """
+        if self.periodic_scheduler is None:
+            return
+        for name, stats in sorted(self.periodic_scheduler.stats.items()):
+            if stats.sent:
+                logging.info("periodic[%s]: %s sent, late mean %.1f ms max %.1f ms, "
+                             "missed intervals %s", name, stats.sent,
+                             stats.mean_late * 1000, stats.max_late * 1000, stats.overruns)
 
 
     def set_periodic(self, per_param):
@@ -465,18 +659,41 @@ class SupportCAN:
         Sends a number of CAN-frames in a row with given intervall.
         That's sometimes needed for waking up MCU or getting frames sent
         withing a certain time intervall.
+
+        Frame n is sent at start + n * intervall. After a slow call the
+        missed intervalls are skipped, the frames are not sent back to back.
+        Returns BurstStats with the achieved time between frames.
         """
         logging.debug("SC.send_burst nspace: %s", burst_param["nspace"])
+        # the request is the same for all frames
+        publisher_info = self.publisher_config([(burst_param["id"],
+                                                 burst_param["nspace"],
+                                                 burst_param["frame"])])
+        intervall = burst_param["intervall"]
+        stats = BurstStats(intervall)
+        # busy wait only the last part of each intervall
+        spin = min(0.002, intervall / 4)
+        deadline = time.perf_counter()
         for _ in range(quantity):
-            self.t_send_signal_hex(stub, burst_param["id"],
-                                   burst_param["nspace"],
-                                   burst_param["frame"])
-            time.sleep(burst_param["intervall"])
+            wait_until(deadline, spin)
+            stats.add(time.perf_counter())
+            try:
+                stub.PublishSignals(publisher_info)
+            except grpc._channel._Rendezvous as err: # pylint: disable=protected-access
+                logging.error("Exception %s", err)
+            # deadlines from the start, a slow call doesn't delay the following frames
+            deadline, missed = skip_missed(deadline, intervall, time.perf_counter())
+            stats.overruns += missed
+        logging.info("Burst %s: %s", burst_param["id"], stats)
+        return stats
 
 
-    def start_heartbeat(self, stub, hb_param):
+    def start_heartbeat(self, stub, hb_param, wakeup_wait=4):
         """
         start_heartbeat
+
+        wakeup_wait: seconds the ECU gets to wake up after the first heartbeat,
+                     use 0 if the caller waits for the ECU to answer instead
         """
         per_param = dict()
         per_param["name"] = 'heartbeat'
@@ -486,8 +703,9 @@ class SupportCAN:
         per_param["frame"] = hb_param["frame"]
         per_param["intervall"] = hb_param["intervall"]
         self.start_periodic(stub, per_param)
-        # Wait for heartbeat to start")
-        time.sleep(4)
+        # Wait for ECU to wake up
+        if wakeup_wait:
+            time.sleep(wakeup_wait)
 
 
     def stop_heartbeat(self):
@@ -748,6 +966,11 @@ class SupportCAN:
         signal_with_payload = network_api_pb2.Signal(id=signal)
         signal_with_payload.raw = self.can_mf_send[can_p["send"]][1][0]
 
+        # FC frames received before FF was sent don't belong to this message
+        fc_queue = self.fc_queue(can_p["receive"])
+        while not fc_queue.empty():
+            fc_queue.get_nowait()
+
         publisher_info = network_api_pb2.PublisherConfig(clientId=source,\
             signals=network_api_pb2.Signals(signal=[signal_with_payload]), frequency=freq)
         try:
@@ -763,44 +986,42 @@ class SupportCAN:
         """
         send_CF_CAN
 
-        Replaced
-        can_p["send"] = can_p["send"] = signal_name
-        can_p["receive"] = can_p["receive"] = r_var
+        Send consecutive frames of MF message after FF has been sent.
+        Waits for each FC frame put in fc_queue by the receive thread and
+        sends frames as stated in FC (block size, separation time).
+
+        can_p["send"]    signal_name
+        can_p["receive"] signal FC frames are received on
+        frequency        not used, kept for compatibility
+        timeout_ms       max time to wait for each FC frame
         """
-        time_start = time.time()
-        last_frame = '00'
+        # pylint: disable=unused-argument
         #Reset fc_wait flag before sending request
         self.fc_wait['Wait'] = False
+        fc_queue = self.fc_queue(can_p["receive"])
 
-        # wait for FC frame to arrive (max 1 sec)
-        # take last frame received
-        if self.can_frames[can_p["receive"]]:
-            last_frame = self.can_frames[can_p["receive"]][-1][2]
         logging.debug("Try to get FC frame")
-        while ((time.time() - time_start)*1000 < timeout_ms) and (int(last_frame[0:1]) != 3):
-            if self.can_frames[can_p["receive"]] != []:
-                last_frame = self.can_frames[can_p["receive"]][-1][2]
-        #ToDo: if FC timed out: delete message to send # pylint: disable=fixme
-        if self.can_frames[can_p["receive"]] == []:
-            logging.error("Send_CF_CAN: FC timed out, discard rest of message to send")
-            self.can_mf_send[can_p["send"]] = []
-            return "Error: FC timed out, message discarded"
-
-        # continue as stated in FC
-        if int(last_frame[0:1]) == 3:
-            # fetch next CAN frames to send
-            frame_control_flag = int(last_frame[1:2], 16)
-            block_size = int(last_frame[2:4], 16)
-            separation_time = int(last_frame[4:6], 16)
+        while self.can_mf_send[can_p["send"]] and\
+            self.can_mf_send[can_p["send"]][0] < len(self.can_mf_send[can_p["send"]][1]):
+            try:
+                fc_frame = fc_queue.get(timeout=timeout_ms / 1000)
+            except queue.Empty:
+                logging.error("Send_CF_CAN: FC timed out, discard rest of message to send")
+                self.can_mf_send[can_p["send"]] = []
+                return "Error: FC timed out, message discarded"
 
-            # safe CF received for later analysis
-            self.can_cf_received[can_p["receive"]].\
-                append(self.can_frames[can_p["receive"]][0])
+            # safe FC received for later analysis, remove it from received frames
+            self.can_cf_received[can_p["receive"]].append(fc_frame)
+            with self.frames_condition(can_p["receive"]):
+                try:
+                    self.can_frames[can_p["receive"]].remove(fc_frame)
+                    self.reassembler(can_p["receive"]).frames_removed += 1
+                except ValueError:
+                    pass
 
+            frame_control_flag = int(fc_frame[2][1:2], 16)
             if frame_control_flag == 1:
                 # Wait flag - wait for next FC frame
-                self.can_frames[can_p["receive"]].pop(0) #remove last frame received from list.
-                self.send_cf_can(can_p, frequency, timeout_ms)
                 self.fc_wait['Wait'] = True
             elif frame_control_flag == 2:
                 # overflow / abort
@@ -809,22 +1030,31 @@ class SupportCAN:
                 return "Error: FC 32 received"
             elif frame_control_flag == 0:
                 # continue sending as stated in FC frame
+                block_size = int(fc_frame[2][2:4], 16)
+                separation_time = int(fc_frame[2][4:6], 16)
                 self.__send_cf_can_ok(can_p, separation_time, block_size)
-                # not whole block sent? Wait for next FC frame and send rest
-                if self.can_mf_send[can_p["send"]][0] <\
-                    len(self.can_mf_send[can_p["send"]][1]):
-                    self.send_cf_can(can_p, frequency, timeout_ms)
             else:
                 return "FAIL: invalid value in FC"
-        if self.can_mf_send[can_p["send"]][0] ==\
-            len(self.can_mf_send[can_p["send"]][1]):
-            logging.debug("MF sent, remove MF")
-            logging.debug("CAN_CF_RECEIVED: %s", self.can_cf_received)
-            self.can_mf_send[can_p["send"]] = []
-            logging.debug("remove CF from received frames:")
-            self.can_frames[can_p["receive"]].pop(0)
-            return "OK: MF message sent"
-        return "FAIL: MF message failed to send"
+
+        logging.debug("MF sent, remove MF")
+        logging.debug("CAN_CF_RECEIVED: %s", self.can_cf_received)
+        self.can_mf_send[can_p["send"]] = []
+        return "OK: MF message sent"
+
+
+    @staticmethod
+    def separation_time_s(separation_time):
+        """
+        Convert STmin from FC frame to seconds
+
+        0x00-0x7F: 0-127 ms, 0xF1-0xF9: 100-900 us,
+        reserved values are handled as 127 ms (ISO 15765-2)
+        """
+        if separation_time <= 0x7F:
+            return separation_time / 1000
+        if 0xF1 <= separation_time <= 0xF9:
+            return (separation_time - 0xF0) / 10000
+        return 0x7F / 1000
 
 
     def add_canframe_tosend(self, signal_name, frame):
@@ -953,19 +1183,44 @@ class SupportCAN:
 
         Send CAN message (8 bytes load) with raw (hex) payload
         """
-        source = common_pb2.ClientId(id=cls.get_file_name()+'_send')
-        signal = common_pb2.SignalId(name=signal_name, namespace=cls.nspace_lookup(namespace))
-        signal_with_payload = network_api_pb2.Signal(id=signal)
-        signal_with_payload.raw = payload_value
-        publisher_info = network_api_pb2.PublisherConfig(clientId=source,\
-                            signals=network_api_pb2.Signals(signal=[signal_with_payload]),\
-                                                                    frequency=0)
+        cls.t_send_signals_hex(stub, [(signal_name, namespace, payload_value)])
+
+
+    @classmethod
+    def t_send_signals_hex(cls, stub, signals):
+        """
+        t_send_signals_hex
+
+        Send several CAN messages with raw (hex) payload in one call,
+        signals is a list of (signal_name, namespace, payload_value)
+        """
+        publisher_info = cls.publisher_config(signals)
         try:
             stub.PublishSignals(publisher_info)
         except grpc._channel._Rendezvous as err: # pylint: disable=protected-access
             logging.error("Exception %s", err)
 
 
+    @classmethod
+    def publisher_config(cls, signals):
+        """
+        publisher_config
+
+        PublisherConfig for sending signals,
+        a list of (signal_name, namespace, payload_value)
+        """
+        source = common_pb2.ClientId(id=cls.get_file_name()+'_send')
+        signals_with_payload = []
+        for signal_name, namespace, payload_value in signals:
+            signal = common_pb2.SignalId(name=signal_name, namespace=cls.nspace_lookup(namespace))
+            signal_with_payload = network_api_pb2.Signal(id=signal)
+            signal_with_payload.raw = payload_value
+            signals_with_payload.append(signal_with_payload)
+        return network_api_pb2.PublisherConfig(clientId=source,\
+                            signals=network_api_pb2.Signals(signal=signals_with_payload),\
+                                                                    frequency=0)
+
+
     def __send_cf_can_ok(self, can_p: CanParam, separation_time, block_size):
         """
             __send_cf_can_ok
@@ -984,6 +1239,8 @@ class SupportCAN:
             logging.debug("Delay frame after FC as stated in frame_control_delay [ms]: %s",
                           self.can_subscribes[can_p["send"]][3])
             time.sleep(self.can_subscribes[can_p["send"]][3]/1000)
+        st_min = self.separation_time_s(separation_time)
+        next_send = time.perf_counter()
         while self.can_mf_send[can_p["send"]][0] <\
             len(self.can_mf_send[can_p["send"]][1]):
             signal_with_payload.raw = \
@@ -992,11 +1249,14 @@ class SupportCAN:
             logging.debug("Signal_with_payload : %s", signal_with_payload.raw.hex().upper()) # Not sure how to fix this pylint warning. pylint: disable=no-member
             publisher_info = network_api_pb2.PublisherConfig(clientId=source,\
                 signals=network_api_pb2.Signals(signal=[signal_with_payload]), frequency=0)
+            # keep STmin between frames sent, not between end of publish and next frame
+            wait_time = next_send - time.perf_counter()
+            if wait_time > 0:
+                time.sleep(wait_time)
             try:
+                next_send = time.perf_counter() + st_min
                 can_p["netstub"].PublishSignals(publisher_info)
                 self.can_mf_send[can_p["send"]][0] += 1
-                # wait ms, only 0-127 ms allowed, microseconds 0xF1-0xF9 ignored:
-                time.sleep((separation_time and 0x7F) / 1000)
                 logging.debug("Frames sent(CF): %s of %s",
                               self.can_mf_send[can_p["send"]][0],
                               len(self.can_mf_send[can_p["send"]][1]))
@@ -1005,6 +1265,7 @@ class SupportCAN:
                     break
             except grpc._channel._Rendezvous as err: # pylint: disable=protected-access
                 logging.error(err)
+                break
 
 
     def t_send_signal_raw(self, stub, signal_name, namespace, payload_value):
@@ -1066,26 +1327,14 @@ class SupportCAN:
                                payload)
 
 
-    def __update_msg(self, can_rec, temp_message, mf_size_remain):
-        """
-        __update_msg
-        """
-        can_mess_updated = False
-        # don't add empty messages
-        if temp_message:
-            #print("mf_size_remain: ", mf_size_remain)
-            if mf_size_remain == 0:
-                can_mess_updated = True
-                logging.debug("Add messages to can_messages: %s", self.can_messages[can_rec])
-                logging.debug("Messages: %s", list(temp_message))
-                self.can_messages[can_rec].append(list(temp_message))
-        return can_mess_updated
-
-
-    def update_can_messages(self, can_p): # pylint: disable=too-many-branches, too-many-statements
+    def update_can_messages(self, can_p):
         """
         update list of messages for a given can_p["receive"]
 
+        Messages are reassembled by the receive thread as frames arrive.
+        If can_frames[can_p["receive"]] was changed by other means than
+        receiving frames, messages are rebuilt from the frames in the list.
+
         parameter:
         can_p :   dict() containing can parameters and received frames
 
@@ -1093,121 +1342,16 @@ class SupportCAN:
         can_mess_updated :  True if messages could be build from CAN-frames in can_rec
                         False if frames contained in can_rec not being used for building a messages
         """
-        # default message_status=0 - single frame message
-        can_mess_updated = False
-        message_status = 0
-        mf_cf_count = 0
-        mf_mess_size = 0
-        temp_message = [] #empty list as default
-
         can_rec = can_p["receive"]
-        if self.can_frames[can_rec]:
-            for i in self.can_frames[can_rec]:
-                #logging.debug("Whole can_frame : %s", i)
-                if message_status == 0:
-                    det_mf = int(i[2][0:1], 16)
-                    if det_mf == 0:
-                        #Single frame message, add frame as message
-                        temp_message = i
-                        mf_size_remain = 0
-                        #logging.debug("Single frame message received")
-                    elif det_mf == 1:
-                        # added for CAN / CAN_FD:
-                        # 1. detect if FirstFrame is CAN/CAN_FD
-                        #    (https://en.wikipedia.org/wiki/CAN_FD)
-                        # 2. get payload length of message
-                        #logging.debug("detect if CAN/CAN_FD multiframe")
-                        if int(i[2][1:4], 16) == 0:
-                            #logging.debug("decode CAN_FD multiframe")
-                            protocol = 'canfd'
-                            mf_mess_size = int(i[2][4:12], 16)
-                            mess_bytes_received = (len(i[2]) / 2)-12 #payload starts byte6
-                        else:
-                            #logging.debug("decode CAN multiframe")
-                            protocol = 'can'
-                            mf_mess_size = int(i[2][1:4], 16)
-                            mess_bytes_received = (len(i[2]) / 2)-4 #payload starts byte2
-                        # 3.
-                        # First frame of MF-message, change to status=2 consective frames to follow
-                        message_status = 2
-                        mf_cf_count = 32 # CF franes start with 0x20..0x2F for CAN and CAN_FD
-
-                        # get size of message to receive:
-                        if protocol == 'canfd':
-                            # CAN_FD message
-                            #logging.debug("add first payload CAN_FD")
-                            mess_bytes_received = (len(i[2]) // 2)-12 #payload starts byte6
-                        # add first payload
-                            temp_message = i[:]
-                            #logging.debug("first payload CAN_FD %s", temp_message)
-                            #logging.debug("CAN_FD message size %s", mf_mess_size)
-                            mf_size_remain = mf_mess_size - mess_bytes_received
-                            mf_cf_count = ((mf_cf_count + 1) & 0xF) + 32
-                            #logging.debug("mf_size_remain: %s", mf_size_remain)
-                        else:
-                            logging.debug("add first payload CAN")
-                            # CAN message
-                            mf_mess_size = int(i[2][1:4], 16)
-                            #mess_bytes_received = 6
-                            mess_bytes_received = (len(i[2]) // 2)-2 #payload starts byte2
-                        # add first payload
-                            temp_message = i[:]
-                            #logging.debug("first payload CAN %s", temp_message)
-                            #logging.debug("CAN message size %s", mf_mess_size)
-                            mf_size_remain = mf_mess_size - mess_bytes_received
-                            #logging.debug("mf_mess_size: %s, received %s, new size %s.",
-                            #                                 mf_mess_size,
-                            #                                 mess_bytes_received,
-                            #                                 mf_size_remain)
-                            mf_cf_count = ((mf_cf_count + 1) & 0xF) + 32
-                            #logging.debug("mf_size_remain: %s", mf_size_remain)
-
-                        #logging.debug("update_can_message: message_size %s", mf_mess_size)
-                        # add first payload
-                        #logging.debug("update_can_message: whole frame %s", i[2])
-                        #logging.debug("update_can_message firstpayload %s", i[2][10:])
-#                        temp_message = i[:]
-                        # calculate bytes to be removed from mf_mess_size
-                        #mf_size_remain = mf_mess_size - 6
-#                        mf_size_remain = mf_mess_size - mess_bytes_received
-#                        mf_cf_count = ((mf_cf_count + 1) & 0xF) + 32
-                    elif det_mf == 2:
-                        logging.error("Consecutive frame not expected without FC")
-                    elif det_mf == 3:
-                        if not can_rec in self.can_mf_send:
-                            logging.error("Flow control received - not expected")
-                            logging.error("Can-frame:  %s", i)
-                            #print("MF sent: ", self.can_mf_send)
-                            return can_mess_updated
-                        logging.debug("MF sent: %s", self.can_mf_send)
-                        logging.debug("FC expected for %s", can_rec)
-                        logging.debug("Can_frames      %s", self.can_frames)
-                    else:
-                        logging.debug("Reserved CAN-header")
-                elif message_status == 1:
-                    logging.error("message not expected")
-                elif message_status == 2:
-                    if mf_size_remain > can_p["framelength_max"]-1:
-                        #temp_message[2] = temp_message[2] + i[2][2:16]
-                        temp_message[2] = temp_message[2] + i[2][2:]
-                        #logging.debug("Update temp_message: %s", temp_message[2])
-                        mf_size_remain -= can_p["framelength_max"]-1
-                        mf_cf_count = ((mf_cf_count + 1) & 0xF) + 32
-                        #logging.debug("mf_size_remain: %s", mf_size_remain)
-                    else:
-                        logging.debug("Last frame to add")
-                        #logging.debug("slice indices: i[2] %s", type(i[2]))
-                        #logging.debug("slice indices: mf_size_remain %s", type(mf_size_remain))
-                        #logging.debug("slice indices: 2+mf_size_remain*2 %s",
-                        #              type(2+mf_size_remain*2))
-                        #logging.debug("slice indices: mess_bytes_received %s",
-                        #              type(mess_bytes_received))
-                        #logging.debug("slice indices: mf_mess_size %s", type(mf_mess_size))
-                        temp_message[2] = temp_message[2] + i[2][2:(2+mf_size_remain*2)]
-                        mf_size_remain = 0
-                else:
-                    logging.error("Unexpected message status in can_frames")
-            can_mess_updated = self.__update_msg(can_rec, temp_message, mf_size_remain)
-            logging.debug("CAN message updated: %s", can_mess_updated)
-            logging.debug("message: %s", self.can_messages[can_rec])
+        with self.frames_condition(can_rec):
+            isotp = self.reassembler(can_rec)
+            if not isotp.in_sync(self.can_frames[can_rec]):
+                logging.debug("Rebuild messages from can_frames %s", can_rec)
+                isotp.rebuild(self.can_frames[can_rec])
+            message = isotp.legacy_message()
+        can_mess_updated = message is not None
+        if can_mess_updated:
+            self.can_messages[can_rec].append(message)
+        logging.debug("CAN message updated: %s", can_mess_updated)
+        logging.debug("message: %s", self.can_messages[can_rec])
         return can_mess_updated
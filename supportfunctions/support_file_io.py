@@ -55,9 +55,10 @@ Any unauthorized copying or distribution of content from this file is prohibited
 
 import os
 import sys
+import copy
 import logging
-import inspect
 from ast import literal_eval
+from contextlib import contextmanager
 import yaml
 
 sys.path.append(os.path.join(os.path.dirname(__file__),".."))
@@ -67,25 +68,61 @@ from hilding.predefined_variables import project_default_to_conf_default
 
 dut_configuration = Conf()
 
-def _find_yml_file(directory, file_names):
-    """Try to find a yml file matching list of files
-
-    Args:
-        dir (str): Root of where the function should look
-        file_names (list): List of python files the function should try to match
-        with a test specific yml
-
-    Returns:
-        str: A path to test specific yml alt. empty string if none was found
+class ParameterStore:
     """
-    walker = os.walk(directory)
+    Test specific yml files in test_folder
 
-    for root, _, files in walker:
-        for file_name in file_names:
-            if f"{file_name}.yml" in files:
-                return os.path.join(root, f"{file_name}.yml")
+    The yml files are indexed by name the first time a parameter is looked up
+    and a parsed yml file is kept until its modification time changes.
 
-    return ""
+    script is the name of the test script of the running step, set by
+    Dut.step. Without it the yml file is found from the file names of the
+    functions calling.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.script = None
+        self._index = None
+        self._parsed = {}
+
+    def index(self):
+        """ dict with file name (without .yml) and path of all yml files """
+        if self._index is None:
+            self._index = {}
+            for root, _, files in os.walk(self.directory):
+                for file_name in files:
+                    if file_name.endswith(".yml"):
+                        self._index.setdefault(file_name[:-len(".yml")],
+                                               os.path.join(root, file_name))
+        return self._index
+
+    def find_yml(self):
+        """
+        Path to the test specific yml file, empty string if none was found
+        """
+        index = self.index()
+        if self.script in index:
+            return index[self.script]
+        # pylint: disable=protected-access
+        frame = sys._getframe(1)
+        while frame is not None:
+            name_of_file = os.path.basename(frame.f_code.co_filename).split(".")[0]
+            if name_of_file in index:
+                return index[name_of_file]
+            frame = frame.f_back
+        return ""
+
+    def load(self, path):
+        """ parsed content of yml file """
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._parsed.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path) as yml_file:
+                cached = (mtime, yaml.safe_load(yml_file))
+            self._parsed[path] = cached
+        return cached[1]
+
+PARAMETER_STORE = ParameterStore(os.path.join(os.path.dirname(__file__), "..", "test_folder"))
 
 def _convert_type(var_with_required_type, variable):
     """A funky little function that makes sure we return values with the correct type.
@@ -151,6 +188,8 @@ def _find_value_in_testspecific_yml(caller, dictionary_to_modify, changed_keys):
                     value = sub_dict.get(swapped_key)
 
                 if value is not None:
+                    # the parsed yml is cached, don't hand out its content
+                    value = copy.deepcopy(value)
                     value_correct_type = _convert_type(dictionary_to_modify[key], value)
                     dictionary_to_modify[key] = value_correct_type
                     changed_keys.append(key)
@@ -162,20 +201,11 @@ def _find_value_in_testspecific_yml(caller, dictionary_to_modify, changed_keys):
             return True
         return False
 
-    file_names_in_callstack = []
-    for level in inspect.stack():
-        path_to_file = level[1]
-        name_of_file = os.path.basename(path_to_file).split(".")[0]
-        file_names_in_callstack.append(name_of_file)
-
-    #Find yml file with absolute folder path and the "test_folder" folder name.
-    path_to_test_specific_yml = _find_yml_file(os.path.dirname(os.path.abspath(path_to_file))+
-                                                        "/test_folder",file_names_in_callstack)
+    path_to_test_specific_yml = PARAMETER_STORE.find_yml()
 
     if path_to_test_specific_yml:
 
-        with open(path_to_test_specific_yml) as yml_file:
-            yml_dictionary = yaml.safe_load(yml_file)
+        yml_dictionary = PARAMETER_STORE.load(path_to_test_specific_yml)
 
         platform = dut_configuration.default_platform
         platform_specific_yml_dict = yml_dictionary.get(platform)
@@ -330,7 +360,40 @@ class SupportFileIO:
             allows you to change variable values in a specific teststep
 
             parameters:
-            inspect.stack()[1][3]   contains name of calling function
+            sys._getframe(1)        frame of calling function, its name is the step
             dict_name               dict which values should be replaced
         """
-        return cls.extract_parameter_yml(str(inspect.stack()[1][3]), dict_name)
+        # pylint: disable=protected-access
+        return cls.extract_parameter_yml(sys._getframe(1).f_code.co_name, dict_name)
+
+    @classmethod
+    @contextmanager
+    def step_context(cls, func):
+        """
+            step_context
+            parameters are looked up in the yml file of the script defining func
+            while the context is active
+        """
+        code = getattr(func, '__code__', None)
+        previous_script = PARAMETER_STORE.script
+        if code is not None:
+            PARAMETER_STORE.script = os.path.basename(code.co_filename).split(".")[0]
+        try:
+            yield
+        finally:
+            PARAMETER_STORE.script = previous_script
+
+
+def test_parameter_store(tmp_path):
+    """ yml files are indexed once and parsed again when changed """
+    tmp_path.joinpath("sub").mkdir()
+    yml_file = tmp_path.joinpath("sub", "e_1_test.yml")
+    yml_file.write_text("platform:\n  step_1:\n    padding: 1\n")
+    store = ParameterStore(str(tmp_path))
+    assert store.find_yml() == ""
+    store.script = "e_1_test"
+    assert store.find_yml() == str(yml_file)
+    assert store.load(store.find_yml())["platform"]["step_1"]["padding"] == 1
+    yml_file.write_text("platform:\n  step_1:\n    padding: 22\n")
+    os.utime(yml_file, ns=(0, 0))
+    assert store.load(str(yml_file))["platform"]["step_1"]["padding"] == 22
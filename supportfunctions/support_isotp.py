@@ -0,0 +1,360 @@
+"""
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+    Frames received on CAN / CAN-FD, bounded buffers for them and their
+    ISO-TP (ISO 15765-2) reassembly.
+
+    Frames are fed once as they are received instead of parsing all frames
+    received each time the messages are needed.
+"""
+import logging
+from collections import deque
+
+
+class CanFrame:
+    """
+    Frame or message received: broker timestamp, signal name and raw bytes
+
+    Behaves like the list [timestamp, name, HEXSTRING] used for frames before,
+    the hex string is only created when it's used.
+    """
+    __slots__ = ('timestamp', 'name', 'raw', '_hex')
+
+    def __init__(self, timestamp, name, raw):
+        self.timestamp = timestamp
+        self.name = name
+        self.raw = raw
+        self._hex = None
+
+    @property
+    def hex(self):
+        """ frame as upper case hex string """
+        if self._hex is None:
+            self._hex = self.raw.hex().upper()
+        return self._hex
+
+    def __getitem__(self, index):
+        if index in (2, -1):
+            return self.hex
+        if index in (0, -3):
+            return self.timestamp
+        if index in (1, -2):
+            return self.name
+        return [self.timestamp, self.name, self.hex][index]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter((self.timestamp, self.name, self.hex))
+
+    def __eq__(self, other):
+        if isinstance(other, CanFrame):
+            return (self.timestamp, self.name, self.raw) ==\
+                (other.timestamp, other.name, other.raw)
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr([self.timestamp, self.name, self.hex])
+
+
+class BufferStats: # pylint: disable=too-few-public-methods
+    """
+    Statistics for a buffer, kept when the buffer is cleared
+    """
+    __slots__ = ('dropped', 'high_water')
+
+    def __init__(self):
+        self.dropped = 0
+        self.high_water = 0
+
+
+class FrameBuffer(list):
+    """
+    Frames or messages with bounded length
+
+    A list, so scripts can still pop, slice and index the buffers. When
+    maxlen is reached the oldest entries are dropped, maxlen // 16 of them at
+    once since removing the first entry of a list moves all the others.
+    received counts entries added to this buffer, it keeps increasing when
+    entries are dropped or removed. dropped counts entries dropped from this
+    buffer, stats is shared with the buffers replacing this one when it's cleared.
+    """
+    def __init__(self, name='', maxlen=None, stats=None):
+        super().__init__()
+        self.name = name
+        self.maxlen = maxlen or None
+        self.received = 0
+        self.dropped = 0
+        self.stats = stats if stats is not None else BufferStats()
+
+    def __make_room(self):
+        if self.maxlen is not None and len(self) >= self.maxlen:
+            drop = len(self) - self.maxlen + max(1, self.maxlen // 16)
+            del self[:drop]
+            if self.stats.dropped == 0:
+                logging.warning("Buffer %s exceeded %s entries, oldest entries are dropped",
+                                self.name, self.maxlen)
+            self.dropped += drop
+            self.stats.dropped += drop
+
+    def append(self, x):
+        self.__make_room()
+        super().append(x)
+        self.received += 1
+        self.stats.high_water = max(self.stats.high_water, len(self))
+
+    def insert(self, i, x):
+        self.__make_room()
+        super().insert(i, x)
+        self.received += 1
+        self.stats.high_water = max(self.stats.high_water, len(self))
+
+    def extend(self, iterable):
+        for item in iterable:
+            self.append(item)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __copy__(self):
+        buffer = FrameBuffer(self.name, self.maxlen, self.stats)
+        buffer.extend(self)
+        return buffer
+
+    def __reduce__(self):
+        return (FrameBuffer, (self.name, self.maxlen, self.stats), None, iter(self))
+
+
+class IsoTpReassembler: # pylint: disable=too-many-instance-attributes
+    """
+    Incremental reassembler for the frames received on one signal
+
+    messages        last max_messages messages completed since reset, as CanFrame
+    frames_fed      number of frames fed since reset
+    frames_removed  number of fed frames removed from the frame list again
+    """
+    def __init__(self, frames=None, max_messages=1000):
+        self.max_messages = max_messages
+        self.reset(frames)
+
+    def reset(self, frames=None):
+        """
+        Forget all frames fed. frames is the list of frames the reassembler mirrors.
+        """
+        self.frames = frames
+        self.frames_fed = 0
+        self.frames_removed = 0
+        self.messages = deque(maxlen=self.max_messages)
+        # message being received: [timestamp, name, bytearray], bytes remaining
+        self._multi_frame = None
+        self._remain = 0
+        # first multi frame message since reset, last single frame before it
+        self._first_multi_frame = None
+        self._first_multi_frame_done = None
+        self._last_single_frame = None
+
+    def in_sync(self, frames):
+        """
+        True if exactly the frames in list frames have been fed,
+        frames dropped by a FrameBuffer are taken into account
+        """
+        return frames is self.frames and\
+            len(frames) + getattr(frames, 'dropped', 0) == self.frames_fed - self.frames_removed
+
+    def rebuild(self, frames):
+        """
+        Reset and feed all frames in frames (CanFrame or [timestamp, name, HEXSTRING])
+        """
+        self.reset(frames)
+        for frame in frames:
+            if isinstance(frame, CanFrame):
+                self.feed(frame.timestamp, frame.name, frame.raw)
+            else:
+                self.feed(frame[0], frame[1], bytes.fromhex(frame[2]))
+
+    def feed(self, timestamp, name, raw): # pylint: disable=too-many-branches
+        """
+        Add a received frame, raw contains the whole frame including PCI.
+
+        Returns the message completed by this frame, None if no message completed.
+        """
+        self.frames_fed += 1
+        if not raw:
+            return None
+        frame_type = raw[0] >> 4
+        message = None
+        if frame_type == 0:
+            if self._multi_frame is not None:
+                logging.warning("IsoTp %s: single frame during multi frame message", name)
+                self._multi_frame = None
+            message = CanFrame(timestamp, name, bytes(raw))
+            if self._first_multi_frame is None:
+                self._last_single_frame = message
+        elif frame_type == 1:
+            if self._multi_frame is not None:
+                logging.warning("IsoTp %s: new first frame, multi frame message dropped", name)
+            if raw[0] & 0x0F == 0 and raw[1] == 0:
+                # CAN_FD first frame, 32 bit message length
+                mess_size = int.from_bytes(raw[2:6], 'big')
+                mess_bytes_received = len(raw) - 6
+            else:
+                mess_size = ((raw[0] & 0x0F) << 8) + raw[1]
+                mess_bytes_received = len(raw) - 2
+            self._multi_frame = [timestamp, name, bytearray(raw)]
+            self._remain = mess_size - mess_bytes_received
+            if self._first_multi_frame_done is None:
+                self._first_multi_frame = self._multi_frame
+            if self._remain <= 0:
+                message = self.__multi_frame_done()
+        elif frame_type == 2:
+            if self._multi_frame is None:
+                logging.error("Consecutive frame not expected without FC")
+            else:
+                payload = raw[1:1 + self._remain]
+                self._multi_frame[2] += payload
+                self._remain -= len(payload)
+                if self._remain == 0:
+                    message = self.__multi_frame_done()
+        elif frame_type != 3:
+            logging.debug("Reserved CAN-header")
+
+        if message is not None:
+            self.messages.append(message)
+        return message
+
+    def __multi_frame_done(self):
+        timestamp, name, payload = self._multi_frame
+        message = CanFrame(timestamp, name, bytes(payload))
+        if self._multi_frame is self._first_multi_frame:
+            self._first_multi_frame_done = message
+        self._multi_frame = None
+        return message
+
+    def legacy_message(self):
+        """
+        Message the way update_can_messages has always built it from all frames:
+        the first multi frame message since reset once completed, if no multi
+        frame message was started the last single frame received.
+
+        Returns CanFrame or None
+        """
+        if self._first_multi_frame is not None:
+            return self._first_multi_frame_done
+        return self._last_single_frame
+
+
+def test_can_frame():
+    """ CanFrame can be used as [timestamp, name, HEXSTRING] """
+    frame = CanFrame(1.5, 'rec', bytes.fromhex('0562f18601'))
+    assert frame[0] == 1.5
+    assert frame[1] == 'rec'
+    assert frame[2] == '0562F18601'
+    assert frame[-1] == frame.hex
+    assert frame[:2] == [1.5, 'rec']
+    assert frame == [1.5, 'rec', '0562F18601']
+    timestamp, name, hexstring = frame
+    assert (timestamp, name, hexstring) == (1.5, 'rec', '0562F18601')
+    assert str([frame]) == "[[1.5, 'rec', '0562F18601']]"
+
+
+def test_frame_buffer():
+    """ oldest entries are dropped, statistics survive a new buffer """
+    frames = FrameBuffer('rec', maxlen=3)
+    for i in range(5):
+        frames.append(i)
+    assert list(frames) == [2, 3, 4]
+    assert frames.dropped == 2
+    assert frames.received == 5
+    assert frames.stats.high_water == 3
+    frames = FrameBuffer('rec', maxlen=3, stats=frames.stats)
+    frames.append(5)
+    assert frames.dropped == 0
+    assert frames.stats.dropped == 2
+    frames.extend([6, 7])
+    frames += [8]
+    frames.insert(0, 1)
+    assert list(frames) == [1, 7, 8]
+    assert frames.dropped == 2
+    assert str(frames) == "[1, 7, 8]"
+    # used as list by the test scripts
+    assert frames.pop(-1) == 8
+    assert frames.pop(0) == 1
+    assert frames[0:] == [7]
+    frames = FrameBuffer('rec', maxlen=32)
+    frames.extend(range(40))
+    # two entries dropped at once
+    assert frames == list(range(8, 40))
+    assert frames.dropped == 8
+
+    isotp = IsoTpReassembler(FrameBuffer('rec', maxlen=2))
+    for i in range(3):
+        isotp.frames.append(CanFrame(i, 'rec', bytes.fromhex('0562F186010000')))
+        isotp.feed(i, 'rec', bytes.fromhex('0562F186010000'))
+    assert isotp.in_sync(isotp.frames)
+
+
+def test_single_frames():
+    """ last single frame received is used as message """
+    isotp = IsoTpReassembler()
+    assert isotp.legacy_message() is None
+    assert isotp.feed(1.0, 'rec', bytes.fromhex('037F2278AAAAAAAA')) ==\
+        [1.0, 'rec', '037F2278AAAAAAAA']
+    isotp.feed(2.0, 'rec', bytes.fromhex('0562F186010000'))
+    assert isotp.legacy_message() == [2.0, 'rec', '0562F186010000']
+    assert len(isotp.messages) == 2
+
+
+def test_multi_frame_can():
+    """ multi frame message on CAN, flow control frames are ignored """
+    isotp = IsoTpReassembler()
+    assert isotp.feed(1.0, 'rec', bytes.fromhex('100E62EDA0010203')) is None
+    isotp.feed(1.1, 'rec', bytes.fromhex('3000000000000000'))
+    assert isotp.feed(1.2, 'rec', bytes.fromhex('2104050607080000')) is None
+    assert isotp.legacy_message() is None
+    assert isotp.feed(1.3, 'rec', bytes.fromhex('22090A0B0C0D0E0F')) ==\
+        [1.0, 'rec', '100E62EDA00102030405060708000009']
+    # frames after the first multi frame message don't change the message
+    isotp.feed(1.4, 'rec', bytes.fromhex('0562F186010000'))
+    assert isotp.legacy_message() == [1.0, 'rec', '100E62EDA00102030405060708000009']
+
+
+def test_multi_frame_canfd():
+    """ CAN_FD first frame with 32 bit length """
+    isotp = IsoTpReassembler()
+    isotp.feed(1.0, 'rec', bytes.fromhex('1000000000080102'))
+    isotp.feed(1.1, 'rec', bytes.fromhex('2103040506070809'))
+    assert isotp.legacy_message() == [1.0, 'rec', '1000000000080102030405060708']
+
+
+def test_rebuild():
+    """ rebuild from list of received frames """
+    frames = [[1.0, 'rec', '037F3678'], [2.0, 'rec', '02760100']]
+    isotp = IsoTpReassembler()
+    assert not isotp.in_sync(frames)
+    isotp.rebuild(frames)
+    assert isotp.in_sync(frames)
+    assert isotp.legacy_message() == [2.0, 'rec', '02760100']
+    frames.pop()
+    assert not isotp.in_sync(frames)
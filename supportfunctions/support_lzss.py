@@ -42,7 +42,6 @@ Any unauthorized copying or distribution of content from this file is prohibited
 
 """
 
-import io
 from supportfunctions.lzss_bitio import BitReader, BitWriter
 from supportfunctions.lzss_helpers import CircularBuffer, Reference, SmartOpener
 
@@ -68,76 +67,100 @@ class LzssEncoder():
     def __init__(self):
         pass
 
-    @staticmethod
-    def _byte2int(byte) -> int:
-        assert len(byte) == 1
-        return int.from_bytes(byte, byteorder="big")
-
-    def _read_next(self, buffer: CircularBuffer, dictionary: CircularBuffer, infile) -> bool:
-        """Read next to buffer, return false if there is nothing to read"""
-        dictionary.put_byte(buffer.get_byte_at(0))
-        last_byte = infile.read(1)
-        if last_byte:
-            buffer.put_byte(self._byte2int(last_byte))  # read another byte to buffer
-            ret_v = True
-        else: # EOF?
-            buffer.pop()
-            ret_v = buffer.get_fill() > 0
-        return ret_v
-
     def encode(self, inpath, outpath):
         """
-        Encode file with LZSS
-        code snippet from web - not tested yet
+        Encode file with LZSS, the result can be decoded with decode_barray
         """
-        dictionary = CircularBuffer(self.LZSS_WINDOW_SIZE)
-        buffer = CircularBuffer(self.MAX_MATCH_SIZE)
-        with SmartOpener.smart_read(inpath) as infile, SmartOpener.smart_write(outpath) as outfile:
-            with BitWriter(outfile) as writer:
-                for _ in range(0, self.MAX_MATCH_SIZE): #max match as initial buffer value
-                    buffer.put_byte(self._byte2int(infile.read(1)))
-                is_there_something_to_read = True
-                while is_there_something_to_read:
-                    longest_match_ref = dictionary.get_longest_match(self.MAX_MATCH_SIZE, buffer)
-                    if longest_match_ref.get_length() > self.LZSS_BREAK_EVEN:
-                        writer.writebits(self.ENCODED_FLAG, 1)
-                        writer.writebits(longest_match_ref.get_bits(), 16)
-                        #print("Writing ref: " + str(bin(longest_match_ref.get_bits())))
-                        for _ in range(0, longest_match_ref.get_length()):
-                            # go forward since only match reference is written
-                            is_there_something_to_read = self._read_next(buffer, dictionary, infile)
-                    else:
-                        writer.writebits(0, 1)
-                        #print("Writing raw: " + str(bin(buffer.get_byte_at(0))))
-                        writer.writebits(buffer.get_byte_at(0), 8) #write original byte
-                        is_there_something_to_read = self._read_next(buffer, dictionary, infile)
-    def encode_barray(self, in_array, out_array):
+        with SmartOpener.smart_read(inpath) as infile:
+            data = infile.read()
+        with SmartOpener.smart_write(outpath) as outfile:
+            outfile.write(self.encode_barray(data))
+
+    def encode_barray(self, in_array, out_array=None, max_chain=256):
+        # pylint: disable=too-many-locals
         """
-        Encode binary stream with LZSS
-        code snippet from web - not tested yet
+        Encode bytes (or any bytes-like object) with LZSS
+        in the format decode_barray handles
+
+        Earlier positions with the same two bytes are kept in hash chains, only
+        those within the window are compared to find the longest match.
+        max_chain limits the number of positions compared for each match.
+
+        Returns the encoded bytes, they are also appended to out_array if given.
         """
-        dictionary = CircularBuffer(self.LZSS_WINDOW_SIZE)
-        buffer = CircularBuffer(self.MAX_MATCH_SIZE)
-        #with in_array as infile, out_array as outfile:
-        with io.BytesIO(in_array) as infile, io.BytesIO(out_array) as outfile:
-            with BitWriter(outfile) as writer:
-                for _ in range(0, self.MAX_MATCH_SIZE): #max match as initial buffer value
-                    buffer.put_byte(self._byte2int(infile.read(1)))
-                is_there_something_to_read = True
-                while is_there_something_to_read:
-                    longest_match_ref = dictionary.get_longest_match(self.MAX_MATCH_SIZE, buffer)
-                    if longest_match_ref.get_length() > self.LZSS_BREAK_EVEN:
-                        writer.writebits(self.ENCODED_FLAG, 1)
-                        writer.writebits(longest_match_ref.get_bits(), 16)
-                        #print("Writing ref: " + str(bin(longest_match_ref.get_bits())))
-                        for _ in range(0, longest_match_ref.get_length()):
-                            # go forward since only match reference is written
-                            is_there_something_to_read = self._read_next(buffer, dictionary, infile)
-                    else:
-                        writer.writebits(0, 1)
-                        #print("Writing raw: " + str(bin(buffer.get_byte_at(0))))
-                        writer.writebits(buffer.get_byte_at(0), 8) #write original byte
-                        is_there_something_to_read = self._read_next(buffer, dictionary, infile)
+        data = bytes(in_array)
+        size = len(data)
+        min_match = self.LZSS_BREAK_EVEN + 1
+        max_match = self.MAX_MATCH_SIZE + min_match
+        window = self.LZSS_WINDOW_SIZE
+        # last position for each pair of bytes, previous position with the same pair
+        head = [-1] * 0x10000
+        prev = [-1] * size
+
+        out = bytearray()
+        acc = 0
+        acc_bits = 0
+        pos = 0
+        while pos < size:
+            max_len = min(max_match, size - pos)
+            best_len, best_pos = 1, -1
+            if max_len >= min_match:
+                best_len, best_pos = self._longest_match(
+                    data, pos, max_len, head[(data[pos] << 8) | data[pos + 1]], prev, max_chain)
+
+            if best_pos >= 0:
+                # encoded flag, 10 bit position and 4 bit length
+                acc = (acc << 15) | ((best_pos % window + 1) << self.LZSS_LENGTH_BIT_COUNT) |\
+                    (best_len - min_match)
+                acc_bits += 15
+            else:
+                acc = (acc << 9) | 0x100 | data[pos]
+                acc_bits += 9
+            while acc_bits >= 8:
+                acc_bits -= 8
+                out.append(acc >> acc_bits)
+                acc &= (1 << acc_bits) - 1
+
+            for i in range(pos, min(pos + best_len, size - 1)):
+                key = (data[i] << 8) | data[i + 1]
+                prev[i] = head[key]
+                head[key] = i
+            pos += best_len
+
+        # end of stream: encoded flag and position 0, padded to a whole byte
+        end_bits = 1 + self.LZSS_INDEX_BIT_COUNT
+        padding = -(acc_bits + end_bits) % 8
+        acc <<= end_bits + padding
+        out += acc.to_bytes((acc_bits + end_bits + padding) // 8, 'big')
+
+        if out_array is not None:
+            out_array += out
+        return bytes(out)
+
+    def _longest_match(self, data, pos, max_len, candidate, prev, max_chain):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Longest match for data[pos:pos + max_len] in the window, following
+        the hash chain from candidate. Returns length and position, (1, -1)
+        if nothing longer than one byte was found.
+        """
+        window = self.LZSS_WINDOW_SIZE
+        best_len, best_pos = 1, -1
+        while candidate >= 0 and pos - candidate <= window and max_chain:
+            max_chain -= 1
+            # last position in the dictionary can't be referenced,
+            # position + 1 is sent and 0 is the end of stream
+            if candidate % window != window - 1 and\
+               data[candidate + best_len] == data[pos + best_len]:
+                length = self.LZSS_BREAK_EVEN + 1
+                while length < max_len and data[candidate + length] == data[pos + length]:
+                    length += 1
+                if length > best_len:
+                    best_len, best_pos = length, candidate
+                    if length == max_len:
+                        break
+            candidate = prev[candidate]
+        return best_len, best_pos
 
     def decode(self, inpath, outpath):
         # pylint: disable=too-many-locals
@@ -179,43 +202,95 @@ class LzssEncoder():
 
 
     def decode_barray(self, in_array):
-        # pylint: disable=too-many-locals
         """
-        Decode io.BytesIO with LZSS
+        Decode bytes (or any bytes-like object) with LZSS
         modified to fit Volvo, tested with VBF files
+
+        Works on the whole buffer: each flag and the data following it are
+        taken from one 24 bit window instead of reading the input bit by bit.
+        The output is the same as decoding with BitReader/BitWriter, also
+        for truncated input.
         """
-        eos_reached = False
-        dictionary = CircularBuffer(self.LZSS_WINDOW_SIZE)
-        # no out_array here, wouldn't be returned
-        with io.BytesIO(in_array) as infile, io.BytesIO() as outfile:
-            with BitReader(infile) as reader, BitWriter(outfile) as writer:
-                while not eos_reached:
-                    bit = reader.readbits(1)
-                    if bit == self.ENCODED_FLAG:
-                        reference_pos_bits = reader.readbits(self.LZSS_INDEX_BIT_COUNT)
-                        if reference_pos_bits == self.LZSS_END_OF_STREAM:
-                            eos_reached = True
-                        else:
-                            reference_length_bits = reader.readbits(self.LZSS_LENGTH_BIT_COUNT)
-                            reference_length_bits = reference_length_bits + self.LZSS_BREAK_EVEN +1
-                            #print("New length: ", reference_length_bits)
-                            #Python array starts at 0, correct position:
-                            #Correct length to be loop+1
-                            reference = Reference(reference_pos_bits-1, reference_length_bits)
-                            for i in range(0, reference.get_length()):
-                                byte = dictionary.get_byte_at((reference.get_pos() + i)\
-                                                            % self.LZSS_WINDOW_SIZE)
-                                dictionary.put_byte(byte)
-                                writer.writebits(byte, 8)
-                            if not reader.read:
-                                print("Not reader.read - break in encoded")
-                                break
-                    else:
-                        byte = reader.readbits(8)
-                        if not reader.read:
-                            print("Not reader.read - break in else")
-                            break
-                        dictionary.put_byte(byte)
-                        writer.writebits(byte, 8)
-            out_array = outfile.getvalue()
-        return out_array
+        data = bytes(in_array)
+        in_bits = 8 * len(data)
+        # BitReader keeps returning the bits of the last byte after the end
+        # of the input, pad with it so a token can always be read at once
+        data += data[-1:] * 3 or bytes(3)
+        out = bytearray()
+        bit_pos = 0
+        while True:
+            byte_pos = bit_pos >> 3
+            window = (data[byte_pos] << 16) | (data[byte_pos + 1] << 8) | data[byte_pos + 2]
+            shift = 23 - (bit_pos & 7)
+            if (window >> shift) & 1 == self.ENCODED_FLAG:
+                # 10 bit position and 4 bit length following the flag
+                reference = (window >> (shift - 14)) & 0x3FFF
+                position = reference >> self.LZSS_LENGTH_BIT_COUNT
+                if position == self.LZSS_END_OF_STREAM:
+                    break
+                bit_pos += 1 + self.LZSS_INDEX_BIT_COUNT + self.LZSS_LENGTH_BIT_COUNT
+                length = (reference & self.MAX_MATCH_SIZE) + self.LZSS_BREAK_EVEN + 1
+                self._copy_reference(out, position - 1, length)
+                if bit_pos > in_bits:
+                    print("Not reader.read - break in encoded")
+                    break
+            else:
+                bit_pos += 9
+                if bit_pos > in_bits:
+                    print("Not reader.read - break in else")
+                    break
+                out.append((window >> (shift - 8)) & 0xFF)
+        if not out:
+            # BitWriter always flushes one byte
+            return bytes(1)
+        return bytes(out)
+
+    def _copy_reference(self, out: bytearray, position: int, length: int):
+        """
+        Append length bytes starting at position in the dictionary to out.
+
+        The dictionary is a window of the last LZSS_WINDOW_SIZE bytes in out:
+        position p holds the last byte written at an offset equal to p modulo
+        the window size, zero if no byte was written there yet.
+        """
+        out_len = len(out)
+        start = out_len - 1 - ((out_len - 1 - position) % self.LZSS_WINDOW_SIZE)
+        if start >= 0:
+            distance = out_len - start
+            if distance >= length:
+                out += out[start:start + length]
+            else:
+                # overlapping copy repeats the last distance bytes
+                out += (out[start:] * (length // distance + 1))[:length]
+        else:
+            # not yet written part of the dictionary, only at the beginning
+            for i in range(start, start + length):
+                out.append(out[i] if i >= 0 else 0)
+
+
+def test_decode_barray(tmp_path):
+    """ pytest: decode_barray gives the same result as the bitwise decoder """
+    lzss = LzssEncoder()
+    # literal 'A', literal 'B', reference to position 0 length 5, end of stream
+    assert lzss.decode_barray(bytes.fromhex('a0d080098000')) == b'ABABABA'
+
+    in_file = tmp_path.joinpath('in.lzss')
+    out_file = tmp_path.joinpath('out.bin')
+    for compressed in (b'', bytes.fromhex('a0d08009'), bytes(range(256)) * 4):
+        in_file.write_bytes(compressed)
+        lzss.decode(in_file, out_file)
+        assert lzss.decode_barray(memoryview(compressed)) == out_file.read_bytes()
+
+
+def test_encode_barray():
+    """ pytest: encoded data is decoded to the original """
+    lzss = LzssEncoder()
+    # literal 'A', literal 'B', reference to position 0 length 5, end of stream
+    assert lzss.encode_barray(b'ABABABA') == bytes.fromhex('a0d080098000')
+
+    data = bytes(range(256)) * 8 + b'\x00' * 100 + bytes(range(255, 0, -3)) * 5
+    out_array = bytearray()
+    encoded = lzss.encode_barray(data, out_array)
+    assert encoded == out_array
+    assert len(encoded) < len(data) // 2
+    assert lzss.decode_barray(encoded) == data
@@ -0,0 +1,311 @@
+"""
+
+/*********************************************************************************/
+
+
+
+Copyright © 2021 Volvo Car Corporation. All rights reserved.
+
+
+
+NOTICE:
+This file contains material that is confidential and confidential to Volvo Cars and/or
+other developers. No license is granted under any intellectual or industrial property
+rights of Volvo Cars except as may be provided in an agreement with Volvo Cars.
+Any unauthorized copying or distribution of content from this file is prohibited.
+
+
+
+/*********************************************************************************/
+    Scheduler sending all periodic signals (heartbeat, tester present, ...)
+    from one thread.
+
+    Deadlines are kept in a heap and computed from time.monotonic() and the
+    interval, so the time spent sending doesn't accumulate as drift. Signals
+    due at the same time are sent in one call.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class JitterStats:
+    """
+    How late the frames of a periodic signal were sent compared to their deadline
+
+    overruns  number of times a whole interval was missed
+    """
+    __slots__ = ('sent', 'max_late', 'total_late', 'overruns')
+
+    def __init__(self):
+        self.sent = 0
+        self.max_late = 0.0
+        self.total_late = 0.0
+        self.overruns = 0
+
+    def add(self, late):
+        """ add a frame sent late seconds after its deadline """
+        self.sent += 1
+        self.max_late = max(self.max_late, late)
+        self.total_late += late
+
+    @property
+    def mean_late(self):
+        """ mean time in seconds the frames were sent after their deadline """
+        return self.total_late / self.sent if self.sent else 0.0
+
+
+class BurstStats:
+    """
+    Achieved time between the frames of a burst
+
+    overruns  number of intervals skipped after a frame was sent too late
+    """
+    __slots__ = ('intervall', 'sent', 'first', 'last', 'min_intervall', 'max_intervall',
+                 'overruns')
+
+    def __init__(self, intervall):
+        self.intervall = intervall
+        self.sent = 0
+        self.first = None
+        self.last = None
+        self.min_intervall = None
+        self.max_intervall = None
+        self.overruns = 0
+
+    def add(self, sent):
+        """ add a frame sent at time sent (seconds, time.perf_counter()) """
+        if self.last is not None:
+            intervall = sent - self.last
+            self.min_intervall = intervall if self.min_intervall is None else\
+                min(self.min_intervall, intervall)
+            self.max_intervall = intervall if self.max_intervall is None else\
+                max(self.max_intervall, intervall)
+        else:
+            self.first = sent
+        self.last = sent
+        self.sent += 1
+
+    @property
+    def mean_intervall(self):
+        """ mean time in seconds between frames """
+        return (self.last - self.first) / (self.sent - 1) if self.sent > 1 else 0.0
+
+    def __str__(self):
+        if self.sent < 2:
+            return f"{self.sent} frames sent"
+        return (f"{self.sent} frames sent, intervall {self.intervall * 1000:.3f} ms requested, "
+                f"mean {self.mean_intervall * 1000:.3f} ms, "
+                f"min {self.min_intervall * 1000:.3f} ms, max {self.max_intervall * 1000:.3f} ms"
+                + (f", {self.overruns} intervalls skipped" if self.overruns else ""))
+
+
+def skip_missed(deadline, intervall, now):
+    """
+    Deadline following deadline. Periods already missed at time now are
+    skipped instead of catching up with frames sent back to back.
+    return: next deadline, number of periods skipped
+    """
+    next_deadline = deadline + intervall
+    if next_deadline > now or intervall <= 0:
+        return next_deadline, 0
+    missed = int((now - deadline) // intervall)
+    return deadline + (missed + 1) * intervall, missed
+
+
+def wait_until(deadline, spin=0.002):
+    """
+    Wait until time.perf_counter() reaches deadline: sleep until spin seconds
+    before the deadline, busy wait the rest for a precise wake up. Keep spin
+    well below the time between deadlines, or the thread busy waits all the
+    time.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class PeriodicScheduler: # pylint: disable=too-many-instance-attributes
+    """
+    One thread sending all periodic signals, ended with stop
+
+    params(name)            returns the current [send, id, nspace, frame, intervall]
+                            of a periodic signal, None if there is none.
+                            The signal is stopped when send is False.
+    publish(stub, signals)  sends a list of (id, nspace, frame) on stub
+    on_sent(name)           called each time a frame of signal name was sent
+    """
+    def __init__(self, params, publish, on_sent=None):
+        self.params = params
+        self.publish = publish
+        self.on_sent = on_sent
+        self.stats = {}
+        self._heap = []
+        self._active = {}
+        self._generation = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self, stub, name):
+        """
+        Send periodic signal name on stub, the first frame is sent at once.
+        A signal already scheduled with the same name is replaced.
+        """
+        with self._cond:
+            generation = next(self._generation)
+            self._active[name] = generation
+            self.stats[name] = JitterStats()
+            heapq.heappush(self._heap, (time.monotonic(), generation, name, stub))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="PeriodicScheduler",
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self, timeout=1):
+        """
+        Stop sending all periodic signals and end the scheduler thread,
+        a later start creates a new thread
+        """
+        with self._cond:
+            thread = self._thread
+            self._thread = None
+            self._heap.clear()
+            self._active.clear()
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def active(self, name):
+        """ True if periodic signal name is scheduled """
+        with self._cond:
+            return name in self._active
+
+    def _wait_due(self):
+        """
+        wait until the first deadline and return all entries due,
+        nothing if the scheduler was stopped
+        """
+        with self._cond:
+            while True:
+                if self._thread is not threading.current_thread():
+                    return []
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                if self._heap[0][0] > now:
+                    self._cond.wait(self._heap[0][0] - now)
+                    continue
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                return due
+
+    def _batches(self, due):
+        """ group the entries still active by stub """
+        batches = {}
+        for deadline, generation, name, stub in due:
+            per_param = self.params(name)
+            with self._cond:
+                if self._active.get(name) != generation:
+                    # replaced by a new start of the same signal
+                    continue
+                if per_param is None or not per_param[0]:
+                    del self._active[name]
+                    continue
+            batch = batches.setdefault(id(stub), (stub, [], []))
+            batch[1].append((per_param[1], per_param[2], per_param[3]))
+            batch[2].append((deadline, generation, name, per_param[4]))
+        return batches.values()
+
+    def _run(self):
+        while self._thread is threading.current_thread():
+            for stub, signals, entries in self._batches(self._wait_due()):
+                dispatched = time.monotonic()
+                sent = True
+                try:
+                    self.publish(stub, signals)
+                except Exception as err: # pylint: disable=broad-except
+                    sent = False
+                    logging.error("Periodic signals %s not sent: %s",
+                                  [entry[2] for entry in entries], err)
+                with self._cond:
+                    for deadline, generation, name, intervall in entries:
+                        if self._active.get(name) != generation:
+                            continue
+                        self.stats[name].add(dispatched - deadline)
+                        next_deadline, missed = skip_missed(deadline, intervall, dispatched)
+                        self.stats[name].overruns += missed
+                        heapq.heappush(self._heap, (next_deadline, generation, name, stub))
+                if sent and self.on_sent is not None:
+                    for entry in entries:
+                        self.on_sent(entry[2])
+
+
+def test_periodic_scheduler():
+    """ signals due together are sent in one call, stopped signals are dropped """
+    periodic = {'hb': [True, 'Hb', 'ns', b'\x01', 0.02],
+                'tp': [True, 'Tp', 'ns', b'\x02', 0.02]}
+    published = []
+    sent = threading.Event()
+    scheduler = PeriodicScheduler(periodic.get,
+                                  lambda stub, signals: published.append(signals),
+                                  on_sent=lambda name: sent.set())
+    stub = object()
+    with scheduler._cond: # pylint: disable=protected-access
+        scheduler.start(stub, 'hb')
+        scheduler.start(stub, 'tp')
+    assert sent.wait(1)
+    time.sleep(0.1)
+    assert published[0] == [('Hb', 'ns', b'\x01'), ('Tp', 'ns', b'\x02')]
+    assert scheduler.stats['hb'].sent >= 4
+    assert scheduler.stats['hb'].mean_late < 0.02
+    periodic['hb'][0] = False
+    time.sleep(0.05)
+    assert not scheduler.active('hb')
+    assert scheduler.active('tp')
+    count = len(published)
+    time.sleep(0.05)
+    assert all(signals == [('Tp', 'ns', b'\x02')] for signals in published[count:])
+    thread = scheduler._thread # pylint: disable=protected-access
+    scheduler.stop()
+    assert not thread.is_alive()
+    assert not scheduler.active('tp')
+    count = len(published)
+    time.sleep(0.05)
+    assert len(published) == count
+
+
+def test_burst_stats():
+    """ time between frames of a burst """
+    stats = BurstStats(0.001)
+    assert str(stats) == "0 frames sent"
+    for sent in (1.0, 1.001, 1.003, 1.004):
+        stats.add(sent)
+    assert stats.sent == 4
+    assert abs(stats.mean_intervall - 0.001333) < 1e-5
+    assert abs(stats.min_intervall - 0.001) < 1e-9
+    assert abs(stats.max_intervall - 0.002) < 1e-9
+
+
+def test_skip_missed():
+    """ missed periods are skipped, the next deadline stays on the grid """
+    assert skip_missed(1.0, 0.1, 1.05) == (1.1, 0)
+    next_deadline, missed = skip_missed(1.0, 0.1, 1.25)
+    assert missed == 2
+    assert abs(next_deadline - 1.3) < 1e-9
+    assert skip_missed(1.0, 0, 2.0) == (1.0, 0)
+
+
+def test_wait_until():
+    """ wake up at the deadline, not before """
+    deadline = time.perf_counter() + 0.005
+    wait_until(deadline, spin=0.001)
+    # the upper bound only catches a missing wake up, the scheduling delay of
+    # a loaded test machine can be several ms
+    assert deadline <= time.perf_counter() < deadline + 0.1
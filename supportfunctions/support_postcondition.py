@@ -87,6 +87,7 @@ class SupportPostcondition: # pylint: disable=too-few-public-methods
 
         logging.debug("Do cleanup now...")
         logging.debug("Stop all periodic signals sent")
+        SC.log_buffer_stats()
         SC.stop_periodic_all()
 
         #There is an issue in unsubscribe_signals() that generates a lot of errors in the log.
@@ -67,6 +67,19 @@ class SupportPrecondition:
     class for supporting Service#11
     """
 
+    @staticmethod
+    def wait_ecu_ready(can_p: CanParam, timeout=4):
+        """
+        Read DID F186 until the ECU answers, at most timeout seconds
+        Returns the result of the last read
+        """
+        deadline = time.time() + timeout
+        result = SE22.read_did_f186(can_p, b'\01')
+        while not SC.can_messages[can_p["receive"]] and time.time() < deadline:
+            logging.info("Precondition: waiting for ECU to answer 22F186")
+            result = SE22.read_did_f186(can_p, b'\01')
+        return result
+
     @staticmethod
     def precondition(can_p: CanParam, timeout=300):
         """
@@ -108,7 +121,8 @@ class SupportPrecondition:
         logging.debug("hb_param %s", hb_param)
 
         # start heartbeat, repeat every x second
-        SC.start_heartbeat(can_p["netstub"], hb_param)
+        # no wait for the ECU to wake up, it's probed with 22F186 below
+        SC.start_heartbeat(can_p["netstub"], hb_param, wakeup_wait=0)
 
         #Start testerpresent without reply
         tp_name = "Vcu1ToAllFuncFront1DiagReqFrame"
@@ -139,7 +153,7 @@ class SupportPrecondition:
 
         SC.subscribe_signal(can_p2, timeout)
         #Don't generate FC frames for signals we generated:
-        time.sleep(1)
+        SC.wait_subscribed([can_p["receive"], can_p2["receive"]])
 
         can_mf: CanMFParam = {
             "block_size": 0,
@@ -153,7 +167,7 @@ class SupportPrecondition:
         pn_sn_list = []
         SIO.parameter_adopt_teststep('pn_sn_list')
 
-        result = SE22.read_did_f186(can_p, b'\01')
+        result = SupportPrecondition.wait_ecu_ready(can_p)
         logging.info("Precondition ECU Mode 1 checked usine 22F186: %s\n", result)
 
         result = SE22.read_did_eda0(can_p, pn_sn_list)
@@ -219,7 +233,8 @@ class SupportPrecondition:
         logging.debug("hp_param %s", hb_param)
 
         # start heartbeat, repeat every x second
-        SC.start_heartbeat(can_p["netstub"], hb_param)
+        # the burst sent below gives the ECU time to wake up
+        SC.start_heartbeat(can_p["netstub"], hb_param, wakeup_wait=0)
 
         #Start testerpresent without reply
         tp_name = "Vcu1ToAllFuncFront1DiagReqFrame"
@@ -242,7 +257,7 @@ class SupportPrecondition:
                            }
         SC.subscribe_signal(can_p2, timeout)
         #Don't generate FC frames for signals we generated:
-        time.sleep(1)
+        SC.wait_subscribed([can_p["receive"], can_p2["receive"]])
 
         can_mf: CanMFParam = {
             "block_size": 0,
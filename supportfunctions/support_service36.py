@@ -48,12 +48,15 @@ The Python implementation of the gRPC route guide client.
 """
 
 import logging
+import time
 from supportfunctions.support_can import SupportCAN, CanParam, CanPayload, CanTestExtra
 from supportfunctions.support_test_odtb2 import SupportTestODTB2
+from supportfunctions.support_file_io import SupportFileIO
 
 
 SC = SupportCAN()
 SUTE = SupportTestODTB2()
+SIO = SupportFileIO
 
 class SupportService36: # pylint: disable=too-few-public-methods
     """
@@ -90,3 +93,97 @@ class SupportService36: # pylint: disable=too-few-public-methods
             result = SUTE.teststep(can_p, cpay, etp)
             result = result and SUTE.test_message(SC.can_messages[can_p["receive"]], '76')
         return result
+
+    @classmethod
+    def stream_blocks(cls, can_p: CanParam, vbf_block_data, nbl,
+                      timeout=0.2, timeout_pending=5.0):
+        """
+        Transfer Data engine used for software download
+
+        Sends the next 0x36 block as soon as the 0x76 response to the previous
+        block is received instead of running a complete teststep per block.
+        Each new 7F3678 (responsePending) restarts the wait with
+        timeout_pending, at most max_7fxx78 times per block.
+
+        vbf_block_data   bytes   data to transfer (compressed as in VBF)
+        nbl              int     maxNumberOfBlockLength from RequestDownload
+        timeout          float   max time to wait for a response in seconds
+        timeout_pending  float   max time to wait for response after 7F3678
+
+        Return:
+        result           bool    all blocks acknowledged with 0x76
+        """
+        # pylint: disable=too-many-arguments, too-many-locals
+        padding = SIO.parameter_adopt_teststep("padding")
+        max_7fxx78 = 10
+        new_max_7fxx78 = SIO.parameter_adopt_teststep('max_7fxx78')
+        if new_max_7fxx78 != '':
+            max_7fxx78 = int(new_max_7fxx78)
+        can_rec = can_p["receive"]
+        block_len = nbl - 2
+        no_blocks = max(1, -(-len(vbf_block_data) // block_len))
+
+        logging.info("------Start Downloading blocks------")
+        logging.info("Transfer data: %s bytes in %s blocks", len(vbf_block_data), no_blocks)
+        transfer_start = time.time()
+        for block_no in range(no_blocks):
+            pad = block_len * block_no
+            block_seq = (block_no + 1) % 256
+            cpay: CanPayload = {"payload" : b'\x36' + bytes([block_seq])
+                                            + vbf_block_data[pad:pad + block_len],
+                                "extra" : ''
+                               }
+            SC.clear_old_cf_frames()
+            SC.clear_can_frame(can_rec)
+            SC.clear_can_message(can_rec)
+            SC.t_send_signal_can_mf(can_p, cpay, padding, 0x00)
+            if not cls.__wait_transfer_response(can_p, block_seq, timeout, timeout_pending,
+                                                max_7fxx78):
+                logging.error("Transfer data: block %s of %s not accepted, received: %s",
+                              block_no + 1, no_blocks, SC.can_messages[can_rec])
+                return False
+
+        duration = max(time.time() - transfer_start, 1e-6)
+        logging.info("Transfer data: %s bytes in %s blocks done in %.2f s"
+                     " (%.0f bytes/s, %.1f blocks/s)", len(vbf_block_data), no_blocks,
+                     duration, len(vbf_block_data)/duration, no_blocks/duration)
+        return True
+
+    @staticmethod
+    def __wait_transfer_response(can_p: CanParam, block_seq, timeout, timeout_pending,
+                                 max_7fxx78):
+        """
+        Wait for 0x76 response with block_seq, returns as soon as a final
+        response is received. Returns True if positive response received.
+        """
+        # pylint: disable=too-many-arguments
+        can_rec = can_p["receive"]
+        deadline = time.time() + timeout
+        pending_received = 0
+        pending_frames_seen = None
+        while True:
+            frames_seen = SC.frames_received(can_rec)
+            SC.clear_can_message(can_rec)
+            SC.update_can_messages(can_p)
+            if SC.can_messages[can_rec]:
+                message = SC.can_messages[can_rec][0][2]
+                # CAN-FD single frames longer than 7 bytes have a 2 byte PCI
+                sid_pos = 4 if message[0:2] == '00' else 2
+                sid = message[sid_pos:sid_pos + 2]
+                if sid == '7F' and message[sid_pos + 4:sid_pos + 6] == '78':
+                    # only a new 7F3678 extends the wait, not the one already handled
+                    if frames_seen != pending_frames_seen:
+                        pending_frames_seen = frames_seen
+                        pending_received += 1
+                        if pending_received > max_7fxx78:
+                            logging.error("Transfer data: more than %s 7F3678 received",
+                                          max_7fxx78)
+                            return False
+                        logging.debug("Transfer data: 7F3678 received, wait for response")
+                        deadline = time.time() + timeout_pending
+                else:
+                    return sid == '76' and\
+                           message[sid_pos + 2:sid_pos + 4] == f'{block_seq:02X}'
+            if time.time() >= deadline:
+                return False
+            SC.wait_for_frame(can_rec, frames_seen, deadline - time.time())
@@ -126,6 +126,7 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
         padding = SIO.parameter_adopt_teststep("padding")
         if "wait_max" in etp:
             wait_max = etp["wait_max"]
+        wait_response = etp.get("wait_response", False)
 
         wait_start = time.time()
         logging.debug("To send:   [%s, %s, %s]", time.time(), can_p["send"],
@@ -133,16 +134,43 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
         SC.clear_all_can_messages()
         SC.t_send_signal_can_mf(can_p, cpay, padding, 0x00)
         #wait timeout for getting subscribed data
-        if (wait_max or (etp["max_no_messages"] == -1)):
+        if wait_max or (etp["max_no_messages"] == -1 and not wait_response):
             time.sleep(etp["timeout"])
             SC.update_can_messages(can_p)
         else:
+            cls.__wait_messages(can_p, etp, wait_start + etp["timeout"])
+
+    @classmethod
+    def __wait_messages(cls, can_p: CanParam, etp: CanTestExtra, deadline, pending_ok=False):
+        """
+        Rebuild received messages each time a new frame arrives until the
+        expected messages are complete or deadline (time.time()) is reached.
+
+        Messages are complete when max_no_messages is reached or, if
+        wait_response is set, when a final (not 7Fxx78) response is assembled.
+        pending_ok: a complete 7Fxx78 response also ends the wait
+        """
+        can_rec = can_p["receive"]
+        while True:
+            frames_seen = SC.frames_received(can_rec)
+            SC.clear_can_message(can_rec)
             SC.update_can_messages(can_p)
-            while((time.time()-wait_start <= etp["timeout"])
-                  and (len(SC.can_messages[can_p["receive"]]) < etp["max_no_messages"])):
-                SC.clear_can_message(can_p["receive"])
-                SC.update_can_messages(can_p)
-                time.sleep(0.05) #pause a bit to receive frames in background
+            if cls.__messages_complete(etp, SC.can_messages[can_rec], pending_ok) or\
+               time.time() >= deadline:
+                break
+            SC.wait_for_frame(can_rec, frames_seen, deadline - time.time())
+
+    @classmethod
+    def __messages_complete(cls, etp: CanTestExtra, messages, pending_ok=False):
+        """
+        Check if messages received fulfill what teststep waits for
+        """
+        if 0 <= etp["max_no_messages"] <= len(messages):
+            return True
+        if etp.get("wait_response", False) and messages:
+            message = messages[0][2]
+            return pending_ok or not (message.find('7F') != -1 and message[6:8] == '78')
+        return False
 
     @classmethod
     def __validate_nrc_21(cls, message):
@@ -185,6 +213,8 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
         clear_old_mess   bool    clear old messages before doing teststep
         wait_max         bool    TRUE: wait until timeout for messages
                                   FALSE: wait until max_no_messages reached
+        wait_response    bool    TRUE: return as soon as a final (not 7Fxx78)
+                                  response is received, also if max_no_messages is -1
         Return:
         testresult       bool    result of teststep is as expected
         """
@@ -263,7 +293,11 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
                 logging.debug("teststep: max_7Fxx78 %s", max_7fxx78)
 
                 while (len(SC.can_frames[can_p['receive']]) == 0) and (wait_loop <= max_7fxx78):
-                    time.sleep(1)
+                    if etp.get("wait_response", False):
+                        SC.wait_for_frame(can_p['receive'],
+                                          SC.frames_received(can_p['receive']), 1)
+                    else:
+                        time.sleep(1)
                     wait_loop += 1
                     logging.debug("7Fxx78: frames received: %s", SC.can_frames[can_p['receive']])
                     logging.debug("7Fxx78: len frames received: %s",
@@ -274,8 +308,13 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
                     logging.debug("7Fxx78 wait_loop <=%s: %s",
                                  max_7fxx78, (wait_loop <= max_7fxx78))
                 logging.info("Received can frames : %s", SC.can_frames[can_p["receive"]])
-                SC.clear_can_message(can_p["receive"])
-                SC.update_can_messages(can_p)
+                if etp.get("wait_response", False):
+                    # frame received may be the first of a multi frame response
+                    self.__wait_messages(can_p, etp, time.time() + etp["timeout"],
+                                         pending_ok=True)
+                else:
+                    SC.clear_can_message(can_p["receive"])
+                    SC.update_can_messages(can_p)
 
         if len(SC.can_messages[can_p["receive"]]) < etp["min_no_messages"]:
             logging.warning("Bad: min_no_messages not reached: %s",
@@ -1234,23 +1273,17 @@ class SupportTestODTB2: # pylint: disable=too-many-public-methods
 
 
     @classmethod
-    def crc16(cls, data):
-        """
-        crc16
-        """
-        mask_crc16_citt = 0x1021
-        data = bytearray(data)
-        # crc initial value
-        crc = 0xFFFF
-        for bits in data:
-            crc ^= bits << 8
-            for _ in range(8):
-                if crc & 0x8000:
-                    crc = (crc << 1) ^ mask_crc16_citt
-                else:
-                    crc = crc << 1
-            crc &= 0xffff
-        return crc
+    def crc16(cls, data, crc=0xFFFF):
+        """
+        crc16 CCITT, polynomial 0x1021, initial value 0xFFFF
+
+        Can be calculated in chunks, give the crc of the data before as crc:
+            crc16(data[n:], crc16(data[:n])) == crc16(data)
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytearray(data)
+        # table driven in C, same result as the bitwise calculation
+        return binascii.crc_hqx(data, crc)
 
 
     @classmethod